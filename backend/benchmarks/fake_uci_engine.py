@@ -0,0 +1,165 @@
+"""
+Scripted stand-in for Stockfish that speaks enough UCI for the backend.
+
+Evaluations are canned: every legal move gets a stable pseudo-random score
+derived from a hash of the position and the move, so runs are reproducible
+and the best move never changes between iterations. Each iteration of
+"iterative deepening" sleeps ``--latency-ms``, which makes engine cost a
+knob instead of a property of the machine.
+
+Usage: python fake_uci_engine.py [--latency-ms 1.0] [--nodes-per-depth 1000]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import sys
+import threading
+import time
+
+import chess
+
+MAX_DEPTH = 64
+
+
+class FakeEngine:
+    def __init__(self, latency_ms: float, nodes_per_depth: int):
+        self.latency = latency_ms / 1000.0
+        self.nodes_per_depth = nodes_per_depth
+        self.board = chess.Board()
+        self.multipv = 1
+        self._out_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: threading.Thread | None = None
+
+    # ----- io -----
+    def send(self, line: str) -> None:
+        with self._out_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    # ----- canned evaluation -----
+    @staticmethod
+    def move_score(board: chess.Board, move: chess.Move) -> int:
+        digest = hashlib.sha1(f"{board.fen()}|{move.uci()}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:2], "big") % 301 - 150
+
+    def ranked_moves(self, board: chess.Board):
+        return sorted(board.legal_moves, key=lambda m: (-self.move_score(board, m), m.uci()))
+
+    # ----- search -----
+    def _parse_go(self, tokens):
+        depth, nodes, movetime, infinite = None, None, None, False
+        for i, token in enumerate(tokens):
+            nxt = tokens[i + 1] if i + 1 < len(tokens) else "0"
+            if token == "depth":
+                depth = int(nxt)
+            elif token == "nodes":
+                nodes = int(nxt)
+            elif token == "movetime":
+                movetime = int(nxt) / 1000.0
+            elif token == "infinite":
+                infinite = True
+        if nodes is not None:
+            by_nodes = max(1, nodes // self.nodes_per_depth)
+            depth = min(depth, by_nodes) if depth else by_nodes
+        if depth is None:
+            depth = MAX_DEPTH
+        return min(depth, MAX_DEPTH), movetime, infinite
+
+    def _search(self, board: chess.Board, tokens) -> None:
+        depth, movetime, infinite = self._parse_go(tokens)
+        started = time.monotonic()
+        moves = self.ranked_moves(board)
+        if not moves:
+            self.send("info depth 0 score mate 0" if board.is_checkmate() else "info depth 0 score cp 0")
+            self.send("bestmove (none)")
+            return
+
+        for d in range(1, depth + 1):
+            if self._stop.wait(self.latency):
+                break
+            elapsed_ms = int((time.monotonic() - started) * 1000)
+            nodes = d * self.nodes_per_depth
+            for rank, move in enumerate(moves[: self.multipv], start=1):
+                self.send(
+                    f"info depth {d} seldepth {d} multipv {rank} score cp {self.move_score(board, move)} "
+                    f"nodes {nodes} nps {nodes * 1000 // max(1, elapsed_ms)} time {elapsed_ms} pv {move.uci()}"
+                )
+            if movetime is not None and time.monotonic() - started >= movetime:
+                break
+        while infinite and not self._stop.wait(0.005):
+            pass
+        self.send(f"bestmove {moves[0].uci()}")
+
+    def _stop_search(self) -> None:
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self._stop.clear()
+
+    # ----- protocol -----
+    def handle(self, line: str) -> bool:
+        parts = line.split()
+        if not parts:
+            return True
+        cmd = parts[0]
+        if cmd == "uci":
+            self.send("id name FakeUCI")
+            self.send("id author benchmarks")
+            for option in (
+                "option name Threads type spin default 1 min 1 max 512",
+                "option name Hash type spin default 16 min 1 max 33554432",
+                "option name Clear Hash type button",
+                "option name MultiPV type spin default 1 min 1 max 500",
+                "option name Skill Level type spin default 20 min 0 max 20",
+                "option name UCI_LimitStrength type check default false",
+                "option name UCI_Elo type spin default 1320 min 1320 max 3190",
+            ):
+                self.send(option)
+            self.send("uciok")
+        elif cmd == "isready":
+            self.send("readyok")
+        elif cmd == "setoption":
+            if "MultiPV" in parts and "value" in parts:
+                self.multipv = max(1, int(parts[parts.index("value") + 1]))
+        elif cmd == "ucinewgame":
+            self.board = chess.Board()
+        elif cmd == "position":
+            self._position(parts[1:])
+        elif cmd == "go":
+            self._stop_search()
+            self._worker = threading.Thread(target=self._search, args=(self.board.copy(), parts[1:]), daemon=True)
+            self._worker.start()
+        elif cmd == "stop":
+            self._stop_search()
+        elif cmd == "quit":
+            self._stop_search()
+            return False
+        return True
+
+    def _position(self, tokens) -> None:
+        moves_at = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if tokens and tokens[0] == "fen":
+            self.board = chess.Board(" ".join(tokens[1:moves_at]))
+        else:
+            self.board = chess.Board()
+        for uci in tokens[moves_at + 1:]:
+            self.board.push_uci(uci)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="sleep per search iteration")
+    parser.add_argument("--nodes-per-depth", type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = FakeEngine(args.latency_ms, args.nodes_per_depth)
+    for line in sys.stdin:
+        if not engine.handle(line.strip()):
+            break
+
+
+if __name__ == "__main__":
+    main()
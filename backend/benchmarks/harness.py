@@ -0,0 +1,117 @@
+"""Shared helpers for the benchmark suite and the load generator."""
+from __future__ import annotations
+
+import json
+import os
+import platform
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FAKE_ENGINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_uci_engine.py")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def fake_engine_command(latency_ms: float, workdir: Optional[str] = None) -> str:
+    """
+    Write an executable wrapper that launches the fake engine with this
+    interpreter. STOCKFISH_PATH takes a single path, not an argv list.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="fake-uci-")
+    path = os.path.join(workdir, "fake-stockfish")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_ENGINE}" --latency-ms {latency_ms} "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """Run the FastAPI app under uvicorn in a subprocess, backed by the fake engine."""
+
+    def __init__(self, engine_path: str, port: Optional[int] = None, env: Optional[Dict[str, str]] = None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(os.environ, STOCKFISH_PATH=engine_path, **(env or {}))
+        self.proc: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "AppServer":
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=self.env,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {self.proc.returncode}")
+            try:
+                if requests.get(self.url + "/", timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        self.__exit__(None, None, None)
+        raise RuntimeError("uvicorn did not become ready within 60s")
+
+    def __exit__(self, *exc) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(name: str, durations: List[float], **extra) -> Dict[str, object]:
+    values = sorted(durations)
+    total = sum(values)
+    return {
+        "name": name,
+        "runs": len(values),
+        "total_s": round(total, 6),
+        "mean_s": round(total / len(values), 6) if values else 0.0,
+        "p50_s": round(percentile(values, 50), 6),
+        "p95_s": round(percentile(values, 95), 6),
+        "p99_s": round(percentile(values, 99), 6),
+        "min_s": round(values[0], 6) if values else 0.0,
+        "max_s": round(values[-1], 6) if values else 0.0,
+        **extra,
+    }
+
+
+def environment() -> Dict[str, object]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def write_json(payload: Dict[str, object], out_path: Optional[str], prefix: str) -> str:
+    if not out_path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out_path = os.path.join(RESULTS_DIR, f"{prefix}-{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    return out_path
@@ -0,0 +1,158 @@
+"""
+Closed-loop load generator for concurrency tests.
+
+Each worker thread replays a scenario in a loop for --duration seconds and
+records per-request latency. The report has throughput, latency percentiles
+and error counts per endpoint. Pass --spawn to start the app under uvicorn
+with the fake UCI engine. Without it, point --url at a running server.
+
+Scenarios:
+  live      POST /analyze/move over positions from a user's first game
+  deep      POST /analyze/move/deep over the same positions
+  listing   GET /games/pgn/{username}/games and /moves
+  mixed     live + listing, interleaved
+
+Usage (from backend/):
+  python -m benchmarks.load_generator --spawn --scenario mixed --concurrency 8 --duration 10
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import chess
+import requests
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.harness import AppServer, environment, fake_engine_command, summarize, write_json  # noqa: E402
+
+Request = Tuple[str, str, Dict[str, object]]  # (label, method+path, payload-or-params)
+
+
+def build_requests(url: str, scenario: str, username: str, plies: int) -> List[Request]:
+    game = requests.get(f"{url}/games/pgn/{username}/moves", params={"index": 0}, timeout=30).json()
+    board = chess.Board()
+    live: List[Request] = []
+    deep: List[Request] = []
+    for uci in game["moves"][:plies]:
+        payload = {"username": username, "fen": board.fen(), "move": uci}
+        live.append(("POST /analyze/move", "POST /analyze/move", payload))
+        deep.append(("POST /analyze/move/deep", "POST /analyze/move/deep", payload))
+        board.push_uci(uci)
+    listing: List[Request] = [
+        ("GET /games/pgn/{username}/games", f"GET /games/pgn/{username}/games", {"limit": 20}),
+        ("GET /games/pgn/{username}/moves", f"GET /games/pgn/{username}/moves", {"index": 0}),
+    ]
+    if scenario == "live":
+        return live
+    if scenario == "deep":
+        return deep
+    if scenario == "listing":
+        return listing
+    mixed: List[Request] = []
+    for i, request in enumerate(live):
+        mixed.append(request)
+        mixed.append(listing[i % len(listing)])
+    return mixed
+
+
+def run_load(url: str, plan: List[Request], concurrency: int, duration: float) -> Dict[str, object]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(offset: int) -> None:
+        session = requests.Session()
+        for label, target, data in itertools.islice(itertools.cycle(plan), offset, None):
+            if time.monotonic() >= stop_at:
+                break
+            method, path = target.split(" ", 1)
+            start = time.perf_counter()
+            try:
+                if method == "POST":
+                    response = session.post(url + path, json=data, timeout=120)
+                else:
+                    response = session.get(url + path, params=data, timeout=120)
+                ok = response.status_code < 400
+                status = str(response.status_code)
+            except requests.RequestException as exc:
+                ok, status = False, exc.__class__.__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies[label].append(elapsed)
+                else:
+                    errors[f"{label} [{status}]"] += 1
+
+    # Stagger start offsets so workers do not hit the same position in lockstep.
+    threads = [threading.Thread(target=worker, args=(i * max(1, len(plan) // concurrency),)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    total_ok = sum(len(v) for v in latencies.values())
+    return {
+        "wall_s": round(wall, 3),
+        "requests_ok": total_ok,
+        "requests_failed": sum(errors.values()),
+        "throughput_rps": round(total_ok / wall, 2) if wall else 0.0,
+        "endpoints": [summarize(label, values) for label, values in sorted(latencies.items())],
+        "errors": dict(errors),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="start the app with the fake engine")
+    parser.add_argument("--engine-latency-ms", type=float, default=1.0)
+    parser.add_argument("--scenario", choices=("live", "deep", "listing", "mixed"), default="mixed")
+    parser.add_argument("--username", default="talhahahaa")
+    parser.add_argument("--plies", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    def sweep(url: str) -> List[Dict[str, object]]:
+        plan = build_requests(url, args.scenario, args.username, args.plies)
+        levels = []
+        for concurrency in args.concurrency:
+            print(f"[load] {args.scenario} x{concurrency} for {args.duration:.0f}s ...", flush=True)
+            level = run_load(url, plan, concurrency, args.duration)
+            level["concurrency"] = concurrency
+            levels.append(level)
+            print(f"  {level['throughput_rps']:8.1f} req/s  ok={level['requests_ok']} failed={level['requests_failed']}")
+        return levels
+
+    if args.spawn:
+        engine_path = fake_engine_command(args.engine_latency_ms)
+        with AppServer(engine_path, env={"GEMINI_API_KEY": ""}) as server:
+            levels = sweep(server.url)
+    else:
+        levels = sweep(args.url)
+
+    payload = {
+        "environment": environment(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "levels": levels,
+    }
+    print(f"[load] wrote {write_json(payload, args.out, 'load')}")
+    return 1 if any(level["requests_failed"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+Backend benchmark suite, run against the fake UCI engine so the numbers
+measure our own overhead (parsing, bookkeeping, caching, HTTP) rather than
+Stockfish.
+
+Suites:
+  analysis   analyze_pgn_file on archives in data/uploads
+  profile    build_profile_from_pgn for users with *_chesscom.pgn archives
+  routes     /analyze/* (cold and warm cache) and the PGN listing endpoints,
+             over real HTTP against a uvicorn subprocess
+
+Results are written as JSON. With --baseline, mean times are compared to a
+previous run and the exit code is 1 if any benchmark regressed by more
+than --tolerance.
+
+Usage (from backend/):
+  python -m benchmarks.run_benchmarks [--suites analysis,profile,routes]
+      [--engine-latency-ms 1] [--profile-games 10] [--plies 20]
+      [--out results.json] [--baseline old.json --tolerance 0.25]
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import chess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.harness import AppServer, environment, fake_engine_command, summarize, write_json  # noqa: E402
+
+import requests  # noqa: E402
+
+UPLOADS_DIR = os.path.join(BACKEND_DIR, "data", "uploads")
+
+
+def _user_archives() -> Dict[str, str]:
+    users = {}
+    for path in sorted(glob.glob(os.path.join(UPLOADS_DIR, "*_chesscom.pgn"))):
+        users[os.path.basename(path)[: -len("_chesscom.pgn")]] = path
+    return users
+
+
+def _timed(fn, repeat: int) -> List[float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+# ---------- in-process suites ----------
+def bench_analysis(args) -> List[Dict[str, object]]:
+    from services import engine_service
+    from services.analysis_service import analyze_pgn_file
+
+    archives = sorted(os.path.basename(p) for p in glob.glob(os.path.join(UPLOADS_DIR, "*.pgn")))
+    # Manual uploads are often the same file re-uploaded; one of each size is enough.
+    seen_sizes, selected = set(), []
+    for name in archives:
+        size = os.path.getsize(os.path.join(UPLOADS_DIR, name))
+        if size not in seen_sizes:
+            seen_sizes.add(size)
+            selected.append(name)
+
+    results = []
+    try:
+        for name in selected:
+            summary: Dict[str, object] = {}
+
+            def run():
+                summary.update(analyze_pgn_file(name))
+
+            durations = _timed(run, args.repeat)
+            plies = int(summary.get("movesAnalyzed", 0) or 0)
+            results.append(summarize(
+                f"analyze_pgn_file[{name}]",
+                durations,
+                plies=plies,
+                plies_per_s=round(plies * len(durations) / max(1e-9, sum(durations)), 2),
+                search=summary.get("search"),
+            ))
+    finally:
+        engine_service.get_supervisor().stop()
+    return results
+
+
+def bench_profile(args) -> List[Dict[str, object]]:
+    from services.engine_supervisor import EngineSupervisor
+    from services.profiling import StockfishEvaluator, build_profile_from_pgn
+
+    supervisor = EngineSupervisor(os.environ["STOCKFISH_PATH"], name="bench").start(monitor=False)
+    results = []
+    try:
+        for username, path in _user_archives().items():
+            stats: Dict[str, object] = {}
+
+            def run():
+                with supervisor.session() as engine:
+                    evaluator = StockfishEvaluator(engine)
+                    profile = build_profile_from_pgn(username, path, evaluator, max_games=args.profile_games)
+                stats.update(games=profile.games_analyzed, search=dict(evaluator.budget.stats))
+
+            durations = _timed(run, args.repeat)
+            games = int(stats.get("games", 0) or 0)
+            results.append(summarize(
+                f"build_profile_from_pgn[{username}]",
+                durations,
+                games=games,
+                games_per_s=round(games * len(durations) / max(1e-9, sum(durations)), 3),
+                search=stats.get("search"),
+            ))
+    finally:
+        supervisor.stop()
+    return results
+
+
+# ---------- HTTP suite ----------
+def _live_positions(server: AppServer, username: str, plies: int) -> List[Dict[str, str]]:
+    game = requests.get(f"{server.url}/games/pgn/{username}/moves", params={"index": 0}, timeout=30).json()
+    board = chess.Board()
+    positions = []
+    for uci in game["moves"][:plies]:
+        positions.append({"username": username, "fen": board.fen(), "move": uci})
+        board.push_uci(uci)
+    return positions
+
+
+def _post_all(url: str, payloads: List[Dict[str, str]]) -> List[float]:
+    durations = []
+    with requests.Session() as session:
+        for payload in payloads:
+            start = time.perf_counter()
+            response = session.post(url, json=payload, timeout=120)
+            durations.append(time.perf_counter() - start)
+            response.raise_for_status()
+    return durations
+
+
+def _get_repeat(url: str, params: Dict[str, object], repeat: int) -> List[float]:
+    durations = []
+    with requests.Session() as session:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = session.get(url, params=params, timeout=60)
+            durations.append(time.perf_counter() - start)
+            response.raise_for_status()
+    return durations
+
+
+def bench_routes(args) -> List[Dict[str, object]]:
+    users = _user_archives()
+    if not users:
+        return []
+    username = next(iter(users))
+    results = []
+    with AppServer(os.environ["STOCKFISH_PATH"], env={"GEMINI_API_KEY": ""}) as server:
+        positions = _live_positions(server, username, args.plies)
+        for route in ("/analyze/move", "/analyze/move/deep", "/analyze/explain/move"):
+            cold = _post_all(server.url + route, positions)
+            warm = _post_all(server.url + route, positions)
+            results.append(summarize(f"POST {route} (cold)", cold))
+            results.append(summarize(f"POST {route} (warm)", warm))
+
+        for limit in (20, 200):
+            durations = _get_repeat(f"{server.url}/games/pgn/{username}/games", {"limit": limit}, args.http_repeat)
+            results.append(summarize(f"GET /games/pgn/{{username}}/games?limit={limit}", durations))
+        for index in (0, 50):
+            durations = _get_repeat(f"{server.url}/games/pgn/{username}/moves", {"index": index}, args.http_repeat)
+            results.append(summarize(f"GET /games/pgn/{{username}}/moves?index={index}", durations))
+    return results
+
+
+SUITES = {"analysis": bench_analysis, "profile": bench_profile, "routes": bench_routes}
+
+
+def compare(results: List[Dict[str, object]], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f).get("results", [])}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if not old or not old.get("mean_s"):
+            continue
+        ratio = result["mean_s"] / old["mean_s"]
+        result["baseline_mean_s"] = old["mean_s"]
+        result["ratio"] = round(ratio, 3)
+        if ratio > 1.0 + tolerance:
+            regressions.append(f"{result['name']}: {old['mean_s']:.4f}s -> {result['mean_s']:.4f}s (x{ratio:.2f})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default="analysis,profile,routes")
+    parser.add_argument("--engine-latency-ms", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per in-process benchmark")
+    parser.add_argument("--http-repeat", type=int, default=20, help="runs per GET benchmark")
+    parser.add_argument("--profile-games", type=int, default=10)
+    parser.add_argument("--plies", type=int, default=20, help="live positions replayed per /analyze route")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    os.chdir(BACKEND_DIR)  # services resolve data/ and database/ relative to cwd
+    os.environ["STOCKFISH_PATH"] = fake_engine_command(args.engine_latency_ms)
+    # Repeated runs over the same archives would otherwise be served from the game cache.
+    os.environ.setdefault("GAME_CACHE", "0")
+
+    results: List[Dict[str, object]] = []
+    for name in [s.strip() for s in args.suites.split(",") if s.strip()]:
+        if name not in SUITES:
+            parser.error(f"unknown suite {name!r}; choose from {', '.join(SUITES)}")
+        print(f"[bench] {name} ...", flush=True)
+        results.extend(SUITES[name](args))
+
+    regressions = compare(results, args.baseline, args.tolerance) if args.baseline else []
+    payload = {
+        "environment": environment(),
+        "config": {k: v for k, v in vars(args).items() if k not in {"out", "baseline"}},
+        "results": results,
+        "regressions": regressions,
+    }
+    out_path = write_json(payload, args.out, "bench")
+
+    for result in results:
+        print(f"  {result['name']:<55} mean {result['mean_s'] * 1000:9.2f} ms  p95 {result['p95_s'] * 1000:9.2f} ms")
+    for line in regressions:
+        print(f"  REGRESSION {line}")
+    print(f"[bench] wrote {out_path}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,40 @@
-import sqlite3, os
+import sqlite3, os, threading
 DB_PATH = os.path.join("database", "app.db")
 os.makedirs("database", exist_ok=True)
 
-def get_conn():
+# Tables are created by the app's startup hook, or on the first connection
+# for scripts and workers that never run it, not as a side effect of import.
+_initialized = False
+_init_lock = threading.Lock()
+
+def _connect():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("""CREATE TABLE IF NOT EXISTS analyses(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        filename TEXT, movesAnalyzed INT, avgCPL INT, accuracy REAL,
-        inaccuracies INT, mistakes INT, blunders INT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS analysis_moves(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        analysis_id INT, ply INT, played TEXT, best TEXT, cpl INT, tag TEXT
-    )""")
-    conn.commit(); conn.close()
+def get_conn():
+    if not _initialized:
+        init_db()
+    return _connect()
 
-init_db()
+def init_db():
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        conn = _connect(); cur = conn.cursor()
+        cur.execute("""CREATE TABLE IF NOT EXISTS analyses(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT, movesAnalyzed INT, avgCPL INT, accuracy REAL,
+            inaccuracies INT, mistakes INT, blunders INT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )""")
+        cur.execute("""CREATE TABLE IF NOT EXISTS analysis_moves(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INT, ply INT, played TEXT, best TEXT, cpl INT, tag TEXT
+        )""")
+        cur.execute("""CREATE TABLE IF NOT EXISTS game_evals(
+            key TEXT PRIMARY KEY,
+            positions INT, payload TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )""")
+        conn.commit(); conn.close()
+        _initialized = True
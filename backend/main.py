@@ -1,6 +1,10 @@
 import os
-import threading
+import time
+
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from routes import game_routes, model_routes
 from fastapi.middleware.cors import CORSMiddleware
 from routes import game_routes, model_routes
@@ -9,10 +13,22 @@ from routes import game_fetch_routes
 from routes.profile import router as profile_router
 from routes.feedback import router as feedback_router
 from routes.live_analysis import router as live_analysis_router
+from routes.metrics import router as metrics_router
 from dotenv import load_dotenv
 import chess.engine
+from database import init_db
+from services import ai_service, feedback_pipeline
+from services.engine_supervisor import EngineSupervisor
+from services.admission import pool_stats
+from services.cache_backend import get_cache
+from services import response_cache
+from services.metrics import RequestMetricsMiddleware
+from services.opening_book import get_book
+from services.prefetch import PREFETCH_ENABLED, Prefetcher
+from services.startup_profile import StartupProfile
 
-
+startup_profile = StartupProfile()
+startup_profile.import_s = time.perf_counter() - _import_started
 
 load_dotenv()
 
@@ -30,6 +46,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 # include routes
 app.include_router(game_routes.router)
@@ -39,31 +56,88 @@ app.include_router(game_fetch_routes.router)
 app.include_router(profile_router)
 app.include_router(feedback_router)
 app.include_router(live_analysis_router)
+app.include_router(metrics_router)
+
+def _engine_ready(supervisor: EngineSupervisor):
+    # Runs on the supervisor's startup thread once the first launch is done.
+    startup_profile.record("engine", supervisor.startup_s or 0.0)
+    if PREFETCH_ENABLED and supervisor.engine is not None and not getattr(app.state, "shutting_down", False):
+        app.state.prefetcher = Prefetcher(supervisor)
+        app.state.prefetcher.start()
+
 
 @app.on_event("startup")
 def startup_engine():
+    started = time.perf_counter()
     stockfish_path = os.getenv(
         "STOCKFISH_PATH",
         r"D:\engines\stockfish\stockfish-windows-x86-64-avx2.exe",
     )
-    try:
-        app.state.stockfish_engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
-        app.state.stockfish_error = None
-    except Exception as exc:
-        app.state.stockfish_engine = None
-        app.state.stockfish_error = str(exc)
-    app.state.stockfish_lock = threading.Lock()
-
+    with startup_profile.phase("init_db"):
+        init_db()
+    with startup_profile.phase("opening_book"):
+        app.state.opening_book = get_book()
+    with startup_profile.phase("cache"):
+        app.state.cache = get_cache()
+    app.state.prefetcher = None
+    app.state.shutting_down = False
+    # Launching and warming Stockfish takes a while; serve requests meanwhile
+    # (engine routes wait for it, /health reports when it is ready).
+    supervisor = EngineSupervisor(stockfish_path, name="stockfish")
+    app.state.engine_supervisor = supervisor
+    app.state.stockfish_lock = supervisor.lock
+    supervisor.start_background(on_ready=_engine_ready)
+    startup_profile.record("startup", time.perf_counter() - started)
 
 
 @app.on_event("shutdown")
 def shutdown_engine():
-    engine = getattr(app.state, "stockfish_engine", None)
-    if engine is not None:
-        try:
-            engine.quit()
-        except Exception:
-            pass
+    app.state.shutting_down = True
+    prefetcher = getattr(app.state, "prefetcher", None)
+    if prefetcher is not None:
+        prefetcher.stop()
+    supervisor = getattr(app.state, "engine_supervisor", None)
+    if supervisor is not None:
+        supervisor.stop()
+    ai_service.shutdown()
+    feedback_pipeline.shutdown()
+
+
+@app.get("/engine/status")
+def engine_status():
+    supervisor = getattr(app.state, "engine_supervisor", None)
+    status = supervisor.status() if supervisor is not None else {"alive": False}
+    book = get_book()
+    status["admission"] = pool_stats()
+    status["opening_book"] = (
+        {"positions": len(book), "depth": book.depth, "mode": book.mode, "plies": book.plies}
+        if book is not None else None
+    )
+    return status
+
+@app.get("/health")
+def health():
+    supervisor = getattr(app.state, "engine_supervisor", None)
+    engine = supervisor.status() if supervisor is not None else {"ready": False, "alive": False}
+    if not engine["ready"]:
+        status = "starting"
+    elif engine["alive"]:
+        status = "ok"
+    else:
+        status = "degraded"
+    body = {
+        "status": status,
+        "engine": engine,
+        "opening_book": getattr(app.state, "opening_book", None) is not None,
+        "cache": get_cache().name,
+        "model_runtime_loaded": ai_service.loaded(),
+        "startup": startup_profile.report(),
+    }
+    return JSONResponse(body, status_code=200 if status == "ok" else 503)
+
+@app.get("/cache/status")
+def cache_status():
+    return {**get_cache().stats(), "responses": response_cache.stats()}
 
 @app.get("/")
 def root():
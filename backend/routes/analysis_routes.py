@@ -1,17 +1,21 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
+from routes.dependencies import admission
 from services.analysis_service import analyze_pgn_file
+from services.engine_service import SERVICE_ENGINE_NAME
 
 router = APIRouter(prefix="/analysis", tags=["Analysis"])
 
 @router.get("/analyze_game")
-def analyze_game(pgn_filename: str = Query(default=None, description="Optional: filename in data/uploads")):
-    result = analyze_pgn_file(pgn_filename)
+def analyze_game(request: Request, pgn_filename: str = Query(default=None, description="Optional: filename in data/uploads")):
+    with admission(request, "analysis", pool=SERVICE_ENGINE_NAME):
+        result = analyze_pgn_file(pgn_filename)
     return result
 
 @router.post("/analyze_and_store")
-def analyze_and_store(pgn_filename: str | None = None):
+def analyze_and_store(request: Request, pgn_filename: str | None = None):
     from services.analysis_service import analyze_pgn_file, save_analysis
-    result = analyze_pgn_file(pgn_filename)
+    with admission(request, "analysis", pool=SERVICE_ENGINE_NAME):
+        result = analyze_pgn_file(pgn_filename)
     if "error" in result: return result
     saved = save_analysis(result)
     return saved
@@ -0,0 +1,73 @@
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+import chess.engine
+from fastapi import HTTPException, Request
+
+from services.admission import Overloaded, get_pool
+from services.engine_supervisor import EngineStarting, EngineUnavailable
+
+
+def _client_id(request: Request, user: Optional[str]) -> str:
+    user = (user or "").strip().lower()
+    if user:
+        return user
+    return request.client.host if request.client else "anonymous"
+
+
+@contextmanager
+def admission(request: Request, route_class: str, user: Optional[str] = None, pool: str = "stockfish"):
+    """
+    Hold a place in the engine's admission pool (see services.admission).
+    Shed requests become 429 (per-user quota) or 503 (queue full, deadline
+    passed) with a Retry-After header.
+    """
+    try:
+        with get_pool(pool).admit(route_class, _client_id(request, user)):
+            yield
+    except Overloaded as exc:
+        raise HTTPException(status_code=exc.status, detail=exc.detail, headers={"Retry-After": str(exc.retry_after)})
+
+
+def background_session(app, route_class: str, user: str):
+    """
+    Engine session factory for work running outside a request (e.g. the
+    feedback pipeline): admitted like a request from ``user``, None when
+    the app has no engine.
+    """
+    supervisor = getattr(app.state, "engine_supervisor", None)
+    if supervisor is None:
+        return None
+
+    @contextmanager
+    def session():
+        with get_pool(supervisor.name).admit(route_class, user.strip().lower()):
+            with supervisor.session() as engine:
+                yield engine
+
+    return session
+
+
+@contextmanager
+def engine_session(request: Request, route_class: str = "live", user: Optional[str] = None):
+    """
+    Yield the app's Stockfish engine for one serialized unit of work.
+    Goes through admission control, pre-empts speculative prefetching and
+    maps engine failures to HTTP errors.
+    """
+    supervisor = getattr(request.app.state, "engine_supervisor", None)
+    if supervisor is None:
+        raise HTTPException(status_code=500, detail="Stockfish engine not initialized")
+
+    prefetcher = getattr(request.app.state, "prefetcher", None)
+    with admission(request, route_class, user, pool=supervisor.name):
+        with prefetcher.priority() if prefetcher else nullcontext():
+            try:
+                with supervisor.session() as engine:
+                    yield engine
+            except EngineStarting as exc:
+                raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+            except EngineUnavailable as exc:
+                raise HTTPException(status_code=500, detail=f"Stockfish engine failed to start: {exc}")
+            except chess.engine.EngineTerminatedError:
+                raise HTTPException(status_code=503, detail="Stockfish engine crashed and is restarting")
@@ -1,8 +1,11 @@
 import json
 import os
-from fastapi import APIRouter, HTTPException
+import time
+from fastapi import APIRouter, HTTPException, Request
 
-from services.feedback import generate_feedback
+from routes.dependencies import background_session
+from services import feedback_pipeline
+from services.response_cache import cached_json
 
 router = APIRouter()
 
@@ -10,12 +13,27 @@ PROFILES_DIR = os.path.join("data", "profiles")
 
 
 @router.get("/feedback/{username}")
-def get_feedback(username: str):
+def get_feedback(username: str, request: Request):
+    """
+    Stored proof feedback. It is generated in the background after each
+    profile build; until then the response has "status": "pending" and no
+    items, and the client should ask again.
+    """
     profile_path = os.path.join(PROFILES_DIR, f"{username}.json")
 
     if not os.path.exists(profile_path):
         raise HTTPException(status_code=404, detail="Profile not found")
 
+    return cached_json(
+        request,
+        ("feedback", username),
+        [profile_path],
+        lambda: _stored_feedback(request, username, profile_path),
+        cache_if=lambda body: body["status"] == feedback_pipeline.READY,
+    )
+
+
+def _stored_feedback(request: Request, username: str, profile_path: str):
     with open(profile_path, "r", encoding="utf-8") as f:
         profile = json.load(f)
 
@@ -23,18 +41,30 @@ def get_feedback(username: str):
     if not proofs:
         raise HTTPException(status_code=404, detail="No proof positions found")
 
-    feedback_items = []
+    status = profile.get("feedback_status", feedback_pipeline.PENDING)
+    # Profiles built before precomputation existed, or Gemini was unavailable a while ago.
+    retry = status == feedback_pipeline.PENDING or (
+        status == feedback_pipeline.UNAVAILABLE
+        and time.time() - os.path.getmtime(profile_path) > feedback_pipeline.RETRY_UNAVAILABLE_S
+    )
+    if retry:
+        feedback_pipeline.get_pipeline().schedule(username, background_session(request.app, "profile", username))
+    if status == feedback_pipeline.PENDING:
+        return {"username": username, "status": status, "feedback": []}
 
-    for proof in proofs:
-        feedback_text = generate_feedback(profile, proof)
-        feedback_items.append({
+    feedback_items = [
+        {
             "move_number": proof["move_number"],
             "played_move": proof["played_move"],
+            "best_move": proof.get("best_move"),
             "label": proof["label"],
-            "feedback": feedback_text
-        })
+            "feedback": proof.get("feedback"),
+        }
+        for proof in proofs
+    ]
 
     return {
         "username": username,
+        "status": status,
         "feedback": feedback_items
     }
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
 import os
 from datetime import datetime
 import chess.pgn
 
+from services.metrics import PGN_PARSE_SECONDS
+from services.response_cache import cached_json
+
 router = APIRouter(prefix="/games", tags=["Games"])
 
 UPLOAD_DIR = "data/uploads"
@@ -35,13 +38,24 @@ async def upload_pgn(file: UploadFile = File(...)):
 
 
 @router.get("/pgn/{username}/games")
-def list_pgn_games(username: str, limit: int = Query(default=20, ge=1, le=200)):
+def list_pgn_games(request: Request, username: str, limit: int = Query(default=20, ge=1, le=200)):
     path = _resolve_pgn_path(username)
+    return cached_json(
+        request,
+        ("pgn_games", username, limit),
+        [path],
+        lambda: _read_game_list(username, path, limit),
+        variant=(limit,),
+    )
+
+
+def _read_game_list(username: str, path: str, limit: int):
     games = []
     with open(path, "r", encoding="utf-8", errors="ignore") as pgn:
         index = 0
         while True:
-            game = chess.pgn.read_game(pgn)
+            with PGN_PARSE_SECONDS.time(site="pgn_list"):
+                game = chess.pgn.read_game(pgn)
             if game is None:
                 break
             headers = game.headers
@@ -73,7 +87,8 @@ def get_pgn_game_moves(username: str, index: int = Query(..., ge=0)):
         current = 0
         game = None
         while True:
-            game = chess.pgn.read_game(pgn)
+            with PGN_PARSE_SECONDS.time(site="pgn_moves"):
+                game = chess.pgn.read_game(pgn)
             if game is None:
                 break
             if current == index:
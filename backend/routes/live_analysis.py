@@ -1,7 +1,14 @@
-from pydantic import BaseModel, Field
-from fastapi import APIRouter, HTTPException, Request
+import asyncio
+import threading
+from typing import Optional
 
-from services.live_analysis import analyze_move, analyze_move_deep, explain_move
+import chess
+from pydantic import BaseModel, Field, ValidationError
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+
+from routes.dependencies import engine_session
+from services.engine_service import SearchBudget
+from services.live_analysis import analyze_move, analyze_move_deep, explain_move, move_heatmap, stream_move_deep
 
 router = APIRouter(prefix="/analyze", tags=["Live Analysis"])
 
@@ -14,69 +21,56 @@ class MoveAnalysisRequest(BaseModel):
     pv_len: int | None = None
 
 
+class PrefetchRequest(BaseModel):
+    fen: str
+
+
+class HeatmapRequest(BaseModel):
+    fen: str
+    username: str | None = None
+    depth: int | None = Field(default=None, ge=1, le=30)
+    top_n: int | None = Field(default=None, ge=1, le=256)
+
+
+def _schedule_prefetch(request: Request, fen: str, move_uci: str) -> None:
+    prefetcher = getattr(request.app.state, "prefetcher", None)
+    if prefetcher is None:
+        return
+    board = chess.Board(fen)
+    board.push(chess.Move.from_uci(move_uci))
+    prefetcher.submit(board.fen())
+
+
 @router.post("/move")
 def analyze_live_move(payload: MoveAnalysisRequest, request: Request):
-    engine = getattr(request.app.state, "stockfish_engine", None)
-    if engine is None:
-        error = getattr(request.app.state, "stockfish_error", None)
-        detail = "Stockfish engine not initialized"
-        if error:
-            detail = f"Stockfish engine failed to start: {error}"
-        raise HTTPException(status_code=500, detail=detail)
-
-    lock = getattr(request.app.state, "stockfish_lock", None)
     depth = payload.depth or 10
+    budget = SearchBudget.live(depth)
     try:
-        if lock:
-            with lock:
-                result = analyze_move(
-                    engine=engine,
-                    fen=payload.fen,
-                    move_uci=payload.move,
-                    username=payload.username,
-                    depth=depth,
-                )
-        else:
-            result = analyze_move(
-                engine=engine,
-                fen=payload.fen,
-                move_uci=payload.move,
-                username=payload.username,
-                depth=depth,
-            )
+        # The engine is taken only if the prefetched entries are missing.
+        result = analyze_move(
+            session=lambda: engine_session(request, "live", payload.username),
+            fen=payload.fen,
+            move_uci=payload.move,
+            username=payload.username,
+            depth=depth,
+            budget=budget,
+        )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     except RuntimeError as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
+    _schedule_prefetch(request, payload.fen, payload.move)
     return result
 
 
 @router.post("/move/deep")
 def analyze_live_move_deep(payload: MoveAnalysisRequest, request: Request):
-    engine = getattr(request.app.state, "stockfish_engine", None)
-    if engine is None:
-        error = getattr(request.app.state, "stockfish_error", None)
-        detail = "Stockfish engine not initialized"
-        if error:
-            detail = f"Stockfish engine failed to start: {error}"
-        raise HTTPException(status_code=500, detail=detail)
-
-    lock = getattr(request.app.state, "stockfish_lock", None)
     depth = payload.depth or 14
     pv_len = payload.pv_len or 8
+    budget = SearchBudget.live(depth)
     try:
-        if lock:
-            with lock:
-                result = analyze_move_deep(
-                    engine=engine,
-                    fen=payload.fen,
-                    move_uci=payload.move,
-                    username=payload.username,
-                    depth=depth,
-                    pv_len=pv_len,
-                )
-        else:
+        with engine_session(request, "live", payload.username) as engine:
             result = analyze_move_deep(
                 engine=engine,
                 fen=payload.fen,
@@ -84,6 +78,7 @@ def analyze_live_move_deep(payload: MoveAnalysisRequest, request: Request):
                 username=payload.username,
                 depth=depth,
                 pv_len=pv_len,
+                budget=budget,
             )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
@@ -93,31 +88,97 @@ def analyze_live_move_deep(payload: MoveAnalysisRequest, request: Request):
     return result
 
 
+def _produce_stream(websocket: WebSocket, payload: MoveAnalysisRequest, cancel: threading.Event, emit) -> None:
+    """Runs in a worker thread: one engine session per stage, messages handed to ``emit``."""
+    try:
+        for stage in stream_move_deep(
+            session=lambda: engine_session(websocket, "live", payload.username),
+            fen=payload.fen,
+            move_uci=payload.move,
+            username=payload.username,
+            depth=payload.depth or 14,
+            pv_len=payload.pv_len or 8,
+            cancel=cancel,
+        ):
+            emit({"type": "stage", **stage})
+    except ValueError as exc:
+        emit({"type": "error", "status": 400, "detail": str(exc)})
+    except RuntimeError as exc:
+        emit({"type": "error", "status": 500, "detail": str(exc)})
+    except HTTPException as exc:
+        emit({"type": "error", "status": exc.status_code, "detail": exc.detail})
+
+
+async def _send_stream(websocket: WebSocket, payload: MoveAnalysisRequest, cancel: threading.Event) -> None:
+    loop = asyncio.get_running_loop()
+    messages: "asyncio.Queue[Optional[dict]]" = asyncio.Queue()
+    emit = lambda message: loop.call_soon_threadsafe(messages.put_nowait, message)
+
+    def run() -> None:
+        try:
+            _produce_stream(websocket, payload, cancel, emit)
+        finally:
+            emit(None)
+
+    producer = loop.run_in_executor(None, run)
+    while (message := await messages.get()) is not None:
+        if cancel.is_set():
+            continue
+        try:
+            await websocket.send_json(message)
+        except Exception:  # client went away mid-stream
+            cancel.set()
+    await producer
+
+
+@router.websocket("/move/stream")
+async def stream_live_move(websocket: WebSocket):
+    """
+    Progressive deep analysis. The client sends a MoveAnalysisRequest as
+    JSON and gets one {"type": "stage", ...} message per completed depth
+    (same fields as /move/deep), the last with "final": true. Sending a new
+    request or {"type": "cancel"}, or closing the socket, stops the one in
+    flight.
+    """
+    await websocket.accept()
+    cancel: Optional[threading.Event] = None
+    task: Optional[asyncio.Task] = None
+    try:
+        while True:
+            message = await websocket.receive_json()
+            if cancel is not None:
+                cancel.set()
+            if task is not None:
+                await task
+                task = None
+            if not isinstance(message, dict):
+                await websocket.send_json({"type": "error", "status": 422, "detail": "Expected a JSON object"})
+                continue
+            if message.get("type") == "cancel":
+                continue
+            try:
+                payload = MoveAnalysisRequest(**message)
+            except ValidationError as exc:
+                await websocket.send_json({"type": "error", "status": 422, "detail": str(exc)})
+                continue
+            cancel = threading.Event()
+            task = asyncio.create_task(_send_stream(websocket, payload, cancel))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if cancel is not None:
+            cancel.set()
+        if task is not None:
+            await task
+
+
 @router.post("/explain/move")
 def explain_live_move(payload: MoveAnalysisRequest, request: Request):
-    engine = getattr(request.app.state, "stockfish_engine", None)
-    if engine is None:
-        error = getattr(request.app.state, "stockfish_error", None)
-        detail = "Stockfish engine not initialized"
-        if error:
-            detail = f"Stockfish engine failed to start: {error}"
-        raise HTTPException(status_code=500, detail=detail)
-
-    lock = getattr(request.app.state, "stockfish_lock", None)
     depth = payload.depth or 14
     pv_len = payload.pv_len or 8
+    budget = SearchBudget.live(depth)
     try:
-        if lock:
-            with lock:
-                result = explain_move(
-                    engine=engine,
-                    fen=payload.fen,
-                    move_uci=payload.move,
-                    username=payload.username,
-                    depth=depth,
-                    pv_len=pv_len,
-                )
-        else:
+        with engine_session(request, "live", payload.username) as engine:
             result = explain_move(
                 engine=engine,
                 fen=payload.fen,
@@ -125,6 +186,7 @@ def explain_live_move(payload: MoveAnalysisRequest, request: Request):
                 username=payload.username,
                 depth=depth,
                 pv_len=pv_len,
+                budget=budget,
             )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
@@ -132,3 +194,36 @@ def explain_live_move(payload: MoveAnalysisRequest, request: Request):
         raise HTTPException(status_code=500, detail=str(exc))
 
     return result
+
+
+@router.post("/heatmap")
+def move_quality_heatmap(payload: HeatmapRequest, request: Request):
+    """CPL and label of every legal move (or the best top_n) from a single multipv search."""
+    depth = payload.depth or 10
+    budget = SearchBudget.live(depth)
+    try:
+        return move_heatmap(
+            session=lambda: engine_session(request, "live", payload.username),
+            fen=payload.fen,
+            depth=depth,
+            top_n=payload.top_n,
+            budget=budget,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@router.post("/prefetch")
+def prefetch_position(payload: PrefetchRequest, request: Request):
+    """Hint the position the player is now thinking in (opt-in via LIVE_PREFETCH)."""
+    prefetcher = getattr(request.app.state, "prefetcher", None)
+    if prefetcher is None:
+        return {"scheduled": False, "prefetch": {"enabled": False}}
+    try:
+        fen = chess.Board(payload.fen).fen()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid FEN")
+    prefetcher.submit_position(fen)
+    return {"scheduled": True, "prefetch": prefetcher.stats()}
@@ -1,18 +1,47 @@
-from fastapi import APIRouter, Form
+from fastapi import APIRouter, Form, HTTPException, Request
+from routes.dependencies import admission
 from services import ai_service
-from pydantic import BaseModel
+from services.engine_service import SERVICE_ENGINE_NAME
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 router = APIRouter(prefix="/model", tags=["Model"])
 
 class MoveRequest(BaseModel):
     fen: str
+    user_id: Optional[str] = None
+
+class BatchMoveRequest(BaseModel):
+    fens: List[str] = Field(..., min_length=1, max_length=512)
+    user_id: Optional[str] = None
 
 @router.post("/train")
-def train_model(user_id: str = Form(...)):
+def train_model(user_id: str = Form(..., pattern=ai_service.USER_ID_PATTERN)):
     result = ai_service.train_model(user_id)
     return result
 
+def _admit_fallback(http: Request, user_id: Optional[str]):
+    """Admission to the engine pool, taken only when Stockfish answers instead of a model."""
+    return lambda: admission(http, "predict", user_id, pool=SERVICE_ENGINE_NAME)
+
 @router.post("/predict")
-def predict_move(request: MoveRequest):
-    result = ai_service.predict_move(request.fen)
+def predict_move(request: MoveRequest, http: Request):
+    result = ai_service.predict_move(request.fen, request.user_id, admit=_admit_fallback(http, request.user_id))
     return result
+
+@router.post("/predict/batch")
+def predict_moves(request: BatchMoveRequest, http: Request):
+    try:
+        return ai_service.predict_moves(request.fens, request.user_id, admit=_admit_fallback(http, request.user_id))
+    except ai_service.FallbackBatchTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid FEN: {exc}")
+
+@router.get("/batcher")
+def batcher_stats():
+    return ai_service.batcher_stats()
+
+@router.get("/registry")
+def registry_stats():
+    return ai_service.registry_stats()
@@ -1,7 +1,16 @@
 import os
 import json
-from fastapi import APIRouter, HTTPException, Request
-from services.profiling import StockfishEvaluator, build_profile_from_pgn, save_profile
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from routes.dependencies import background_session, engine_session
+from services import feedback_pipeline
+from services.move_store import MoveRecorder, write_store
+from services.profile_views import get_index
+from services.profile_jobs import enqueue_profile
+from services.response_cache import cached_json
+from services.profiling import DEFAULT_MAX_GAMES, StockfishEvaluator, build_profile_from_pgn, save_profile
+from services.work_queue import get_queue
 
 router = APIRouter()
 
@@ -9,13 +18,7 @@ UPLOADS_DIR = os.path.join("data", "uploads")
 PROFILES_DIR = os.path.join("data", "profiles")
 
 
-@router.get("/profile/{username}")
-def get_or_build_profile(username: str, request: Request):
-    profile_path = os.path.join(PROFILES_DIR, f"{username}.json")
-    if os.path.exists(profile_path):
-        with open(profile_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-
+def _user_pgn_path(username: str) -> str:
     # Try to build from existing uploads
     # Prefer chess.com file name convention you already use
     pgn_path = os.path.join(UPLOADS_DIR, f"{username}_chesscom.pgn")
@@ -26,23 +29,67 @@ def get_or_build_profile(username: str, request: Request):
             pgn_path = alt
         else:
             raise HTTPException(status_code=404, detail="No PGN found for this user. Fetch/upload games first.")
+    return pgn_path
 
-    engine = getattr(request.app.state, 'stockfish_engine', None)
-    if engine is None:
-        error = getattr(request.app.state, 'stockfish_error', None)
-        detail = 'Stockfish engine not initialized'
-        if error:
-            detail = f'Stockfish engine failed to start: {error}'
-        raise HTTPException(status_code=500, detail=detail)
-
-    evaluator = StockfishEvaluator(engine)
-    lock = getattr(request.app.state, 'stockfish_lock', None)
-    if lock:
-        with lock:
-            profile = build_profile_from_pgn(username=username, pgn_path=pgn_path, evaluator=evaluator)
-    else:
-        profile = build_profile_from_pgn(username=username, pgn_path=pgn_path, evaluator=evaluator)
+
+@router.post("/profile/{username}/jobs")
+def enqueue_profile_build(username: str, max_games: int = Query(default=DEFAULT_MAX_GAMES, ge=1, le=5000)):
+    """Queue a profile build as per-game tasks for analysis workers (python -m services.analysis_worker)."""
+    return enqueue_profile(get_queue(), username, _user_pgn_path(username), max_games=max_games)
+
+
+@router.get("/profile/jobs/{job_id}")
+def get_profile_job(job_id: str):
+    job = get_queue().job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@router.get("/profile/{username}")
+def get_or_build_profile(username: str, request: Request):
+    profile_path = os.path.join(PROFILES_DIR, f"{username}.json")
+    if os.path.exists(profile_path):
+        return _profile_response(request, username, profile_path)
+
+    pgn_path = _user_pgn_path(username)
+    recorder = MoveRecorder(username)
+    with engine_session(request, "profile", username) as engine:
+        evaluator = StockfishEvaluator(engine)
+        profile = build_profile_from_pgn(username=username, pgn_path=pgn_path, evaluator=evaluator, recorder=recorder)
     out_path = save_profile(profile, PROFILES_DIR)
+    write_store(username, *recorder.frames(), extra={"source": os.path.basename(pgn_path), "eval_mode": profile.eval_mode})
+    feedback_pipeline.get_pipeline().schedule(username, background_session(request.app, "profile", username))
+    return _profile_response(request, username, out_path)
+
+
+def _profile_response(request: Request, username: str, path: str):
+    def load():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    return cached_json(request, ("profile", username), [path], load)
+
+
+@router.get("/profile/{username}/view")
+def get_profile_view(
+    username: str,
+    since: Optional[date] = Query(default=None, description="First game date (inclusive)"),
+    until: Optional[date] = Query(default=None, description="Last game date (inclusive)"),
+    time_control: Optional[str] = Query(default=None, description="bullet, blitz, rapid, daily or a raw TimeControl"),
+    color: Optional[str] = Query(default=None, pattern="^(white|black)$"),
+    eco: Optional[str] = Query(default=None, description="ECO code or prefix, e.g. B or B01"),
+):
+    """Profile recomputed from stored per-move results for a subset of games; no engine work."""
+    index = get_index(username)
+    if index is None:
+        raise HTTPException(status_code=404, detail="No stored move data for this user. Build the profile first.")
+    return index.query(since=since, until=until, time_control=time_control, color=color, eco=eco)
+
 
-    with open(out_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+@router.get("/profile/{username}/view/dimensions")
+def get_profile_view_dimensions(username: str):
+    index = get_index(username)
+    if index is None:
+        raise HTTPException(status_code=404, detail="No stored move data for this user. Build the profile first.")
+    return index.dimensions()
@@ -0,0 +1,217 @@
+"""
+Admission control for engine-bound requests.
+
+Every engine process (one per EngineSupervisor, addressed by its name) has
+an admission pool in front of it. A request names its route class and its
+user, and is either granted the engine, made to wait in the pool, or
+rejected straight away:
+
+  - each route class has a bounded queue; a request arriving to a full
+    queue is rejected (503)
+  - each user may have at most PER_USER_LIMIT requests waiting or running
+    in a pool; beyond that the request is rejected (429), so one user's
+    batch cannot fill the queues
+  - a queued request that is not granted the engine within its class's
+    deadline is shed (503) instead of holding a worker thread until the
+    client has given up anyway
+
+When the engine frees up, the highest-priority class with waiters goes
+first, and within a class users are served round-robin, oldest request
+first. Rejections carry a Retry-After estimated from recent service times.
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+from services.metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+# ---------- Config ----------
+PER_USER_LIMIT = int(os.getenv("ADMISSION_PER_USER", "4"))
+DEADLINE_SCALE = float(os.getenv("ADMISSION_DEADLINE_SCALE", "1.0"))
+MAX_RETRY_AFTER_S = 60
+SERVICE_EWMA_ALPHA = 0.2
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    max_queue: int      # requests of this class allowed to wait at once
+    deadline_s: float   # longest one may wait for the engine before it is shed
+    priority: int       # higher goes first when the engine frees up
+
+
+ROUTE_POLICIES: Dict[str, RoutePolicy] = {
+    "live": RoutePolicy(max_queue=16, deadline_s=5.0, priority=2),      # /analyze/*
+    "predict": RoutePolicy(max_queue=16, deadline_s=5.0, priority=2),   # /model/predict
+    "analysis": RoutePolicy(max_queue=4, deadline_s=30.0, priority=1),  # /analysis/* (whole PGN)
+    "profile": RoutePolicy(max_queue=2, deadline_s=30.0, priority=0),   # /profile/{username} builds
+}
+
+
+class Overloaded(Exception):
+    def __init__(self, status: int, reason: str, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class _Ticket:
+    __slots__ = ("route_class", "user", "granted")
+
+    def __init__(self, route_class: str, user: str):
+        self.route_class = route_class
+        self.user = user
+        self.granted = False
+
+
+class AdmissionPool:
+    def __init__(
+        self,
+        name: str,
+        slots: int = 1,
+        policies: Optional[Dict[str, RoutePolicy]] = None,
+        per_user: int = PER_USER_LIMIT,
+    ):
+        self.name = name
+        self.slots = slots
+        self.policies = dict(policies or ROUTE_POLICIES)
+        self.per_user = per_user
+        self._cond = threading.Condition()
+        self._running = 0
+        # route class -> user -> waiting tickets; user order is the round-robin order
+        self._waiting: Dict[str, "OrderedDict[str, Deque[_Ticket]]"] = {c: OrderedDict() for c in self.policies}
+        self._queued: Dict[str, int] = {c: 0 for c in self.policies}
+        self._outstanding: Dict[str, int] = {}
+        self._service_s: Dict[str, float] = {}
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    @contextmanager
+    def admit(self, route_class: str, user: str):
+        policy = self.policies[route_class]
+        waited = time.perf_counter()
+        with self._cond:
+            if self._outstanding.get(user, 0) >= self.per_user:
+                raise self._reject(route_class, 429, "user_quota", f"Too many requests in flight for {user}")
+            ticket = _Ticket(route_class, user)
+            if self._running < self.slots and not any(self._queued.values()):
+                ticket.granted = True
+                self._running += 1
+            elif self._queued[route_class] >= policy.max_queue:
+                raise self._reject(route_class, 503, "queue_full", f"Engine busy: {route_class} queue is full")
+            else:
+                self._enqueue(ticket)
+            self._outstanding[user] = self._outstanding.get(user, 0) + 1
+
+            deadline = time.monotonic() + policy.deadline_s * DEADLINE_SCALE
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._dequeue(ticket)
+                    self._release_user(user)
+                    raise self._reject(route_class, 503, "deadline", "Engine busy: request waited past its deadline")
+                self._cond.wait(remaining)
+            self.admitted += 1
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - waited, pool=self.name, route_class=route_class)
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._cond:
+                previous = self._service_s.get(route_class)
+                self._service_s[route_class] = (
+                    elapsed if previous is None else previous + SERVICE_EWMA_ALPHA * (elapsed - previous)
+                )
+                self._running -= 1
+                self._release_user(user)
+                self._grant()
+
+    # ----- internals (called with the condition held) -----
+    def _enqueue(self, ticket: _Ticket) -> None:
+        self._waiting[ticket.route_class].setdefault(ticket.user, deque()).append(ticket)
+        self._queued[ticket.route_class] += 1
+
+    def _dequeue(self, ticket: _Ticket) -> None:
+        users = self._waiting[ticket.route_class]
+        tickets = users[ticket.user]
+        tickets.remove(ticket)
+        if not tickets:
+            del users[ticket.user]
+        self._queued[ticket.route_class] -= 1
+
+    def _release_user(self, user: str) -> None:
+        left = self._outstanding[user] - 1
+        if left:
+            self._outstanding[user] = left
+        else:
+            del self._outstanding[user]
+
+    def _grant(self) -> None:
+        by_priority = sorted(self.policies, key=lambda c: self.policies[c].priority, reverse=True)
+        while self._running < self.slots:
+            route_class = next((c for c in by_priority if self._queued[c]), None)
+            if route_class is None:
+                break
+            users = self._waiting[route_class]
+            user, tickets = next(iter(users.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                users.move_to_end(user)  # next grant in this class goes to another user
+            else:
+                del users[user]
+            self._queued[route_class] -= 1
+            ticket.granted = True
+            self._running += 1
+        self._cond.notify_all()
+
+    def _retry_after(self, route_class: str) -> int:
+        service = self._service_s.get(route_class, 1.0)
+        ahead = sum(self._queued.values()) + self._running
+        return max(1, min(MAX_RETRY_AFTER_S, math.ceil(service * ahead / self.slots)))
+
+    def _reject(self, route_class: str, status: int, reason: str, detail: str) -> Overloaded:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        ADMISSION_REJECTIONS.inc(pool=self.name, route_class=route_class, reason=reason)
+        return Overloaded(status, reason, self._retry_after(route_class), detail)
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            return {
+                "name": self.name,
+                "slots": self.slots,
+                "running": self._running,
+                "queued": dict(self._queued),
+                "users": len(self._outstanding),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "service_s": {c: round(s, 3) for c, s in self._service_s.items()},
+            }
+
+
+_pools: Dict[str, AdmissionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> AdmissionPool:
+    """The admission pool in front of the engine supervisor called ``name``."""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = AdmissionPool(name)
+    return pool
+
+
+def pool_stats() -> Dict[str, Dict[str, object]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.stats() for pool in pools}
@@ -1,16 +1,132 @@
-import chess, random, time
+import os
+import re
+import threading
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Dict, List, Optional
+
+import chess
+
 from .engine_service import best_move_san
+from .metrics import MODEL_BATCH_SIZE, MODEL_INFERENCE_SECONDS
+
+UPLOAD_DIR = "data/uploads"
+USER_ID_PATTERN = r"^[A-Za-z0-9_-]+$"   # user ids name model, dataset and upload paths
+# Without a model, a batch is one 350 ms engine move per FEN holding the
+# engine-service slot; larger batches are refused.
+FALLBACK_MAX_FENS = int(os.getenv("PREDICT_FALLBACK_MAX_FENS", "8"))
+
+
+class FallbackBatchTooLarge(Exception):
+    pass
+
+# The registry and batcher import torch (~2s), so they are created on first
+# use rather than when the app starts.
+_registry = None
+_batcher = None
+_runtime_lock = threading.Lock()
+
+# Wraps the Stockfish fallback only (the route's admission to the engine
+# pool); model predictions do not touch the engine and are not admitted.
+Admit = Callable[[], ContextManager[None]]
+
+
+def _runtime():
+    global _registry, _batcher
+    with _runtime_lock:
+        if _registry is None:
+            from .model_registry import ModelRegistry
+            from .predict_batcher import MicroBatcher
+
+            _registry = ModelRegistry()
+            _batcher = MicroBatcher()
+    return _registry, _batcher
+
+
+def _user_pgn_path(user_id: str) -> Optional[str]:
+    for name in (f"{user_id}_chesscom.pgn", f"{user_id}.pgn"):
+        path = os.path.join(UPLOAD_DIR, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def valid_user_id(user_id: str) -> bool:
+    return re.fullmatch(USER_ID_PATTERN, user_id) is not None
+
+
+def _load_user_model(user_id: str):
+    if not valid_user_id(user_id):
+        return None  # no model can exist under such an id; Stockfish answers
+    registry, _ = _runtime()
+    return registry.get(user_id)
+
+
 def train_model(user_id: str):
+    if not valid_user_id(user_id):
+        return {"status": "error", "message": f"Invalid user id: {user_id!r}."}
+    pgn_path = _user_pgn_path(user_id)
+    if pgn_path is None:
+        return {"status": "error", "message": f"No PGN found for {user_id}."}
+    from . import move_model
 
-    time.sleep(5)
+    return move_model.train_user_model(user_id, pgn_path)
 
-    with open(f"saved_models/{user_id}_model.txt", "w") as f:
-        f.write("Pretend Maia-2 fine-tuned weights")
-    return {"status": "success", "message": "Model fine-tuning completed (simulated)."}
 
-def predict_move(fen: str):
+def predict_move(fen: str, user_id: Optional[str] = None, admit: Optional[Admit] = None):
     board = chess.Board(fen)
     if board.is_game_over():
         return {"move": None, "message": "Game over"}
-    san = best_move_san(fen, movetime_ms=350)
+    model = _load_user_model(user_id) if user_id else None
+    if model is not None:
+        _, batcher = _runtime()
+        move = batcher.predict(model, board)
+        return {"move": board.san(move), "message": "Personalized model move"}
+    with admit() if admit else nullcontext():
+        san = best_move_san(fen, movetime_ms=350)
     return {"move": san, "message": "Stockfish-based move"}
+
+
+def predict_moves(fens: List[str], user_id: Optional[str] = None, admit: Optional[Admit] = None):
+    """Predict a move for each FEN; with a trained model this is one forward pass per MAX_BATCH."""
+    boards = [chess.Board(fen) for fen in fens]
+    model = _load_user_model(user_id) if user_id else None
+    if model is None:
+        if len(boards) > FALLBACK_MAX_FENS:
+            raise FallbackBatchTooLarge(
+                f"No trained model for this user; Stockfish predicts at most {FALLBACK_MAX_FENS} positions per batch"
+            )
+        with admit() if admit else nullcontext():
+            moves = [
+                None if board.is_game_over() else best_move_san(board.fen(), movetime_ms=350)
+                for board in boards
+            ]
+        return {"moves": moves, "source": "stockfish"}
+
+    from . import move_model
+    from .predict_batcher import MAX_BATCH
+
+    moves: List[Optional[str]] = []
+    for start in range(0, len(boards), MAX_BATCH):
+        chunk = boards[start:start + MAX_BATCH]
+        with MODEL_INFERENCE_SECONDS.time(source="batch_endpoint"):
+            predicted = move_model.predict_moves(model, chunk)
+        MODEL_BATCH_SIZE.observe(len(chunk), source="batch_endpoint")
+        moves.extend(board.san(move) if move else None for board, move in zip(chunk, predicted))
+    return {"moves": moves, "source": "model"}
+
+
+def loaded() -> bool:
+    return _registry is not None
+
+
+def shutdown() -> None:
+    if _batcher is not None:
+        _batcher.stop()
+
+
+def batcher_stats() -> Dict[str, object]:
+    return _runtime()[1].stats()
+
+
+def registry_stats() -> Dict[str, object]:
+    return _runtime()[0].stats()
@@ -1,5 +1,7 @@
 import os, glob, chess.pgn, io, chess
-from .engine_service import analyse_fen_cp, best_move_san
+from . import game_cache
+from .engine_service import SearchBudget, analyse_fen_cp, best_move_san, get_supervisor
+from .metrics import ENGINE_SEARCHES_AVOIDED, PGN_PARSE_SECONDS
 from database import get_conn
 
 UPLOAD_DIR = "data/uploads"
@@ -8,12 +10,12 @@ def _latest_pgn():
     files = sorted(glob.glob(os.path.join(UPLOAD_DIR, "*.pgn")), key=os.path.getmtime)
     return files[-1] if files else None
 
-def analyze_pgn_file(pgn_filename: str | None):
+def analyze_pgn_file(pgn_filename: str | None, budget: SearchBudget | None = None):
     path = os.path.join(UPLOAD_DIR, pgn_filename) if pgn_filename else _latest_pgn()
     if not path or not os.path.exists(path):
         return {"error": "No PGN found. Upload or specify pgn_filename."}
 
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f, PGN_PARSE_SECONDS.time(site="analysis"):
         game = chess.pgn.read_game(f)
     if game is None:
         return {"error": "PGN parse failed"}
@@ -23,20 +25,47 @@ def analyze_pgn_file(pgn_filename: str | None):
     move_summaries = []
     total_cpl = 0
     blunders = mistakes = inaccuracies = 0
+    budget = (budget or SearchBudget(depth=8, site="analysis")).for_game()
+    settings = game_cache.engine_settings(get_supervisor().engine, budget.depth, budget.mode, "analysis:play200")
+    evals = game_cache.load(game_cache.game_key(board.fen(), moves, settings), len(moves) + 1)
 
+    def cached(value):
+        if value is not None:
+            budget.stats["cached"] += 1
+            ENGINE_SEARCHES_AVOIDED.inc(site=budget.site, reason="game_cache")
+        return value
+
+    def eval_cp(ply: int, board: chess.Board) -> int:
+        # evals are cached from White's side, returned from the side to move
+        sign = 1 if board.turn == chess.WHITE else -1
+        cp = cached(evals.get_cp(ply))
+        if cp is None:
+            degraded = budget.exhausted
+            cp = sign * analyse_fen_cp(board.fen(), budget=budget)
+            evals.put(ply, cp=cp, shallow=degraded)
+        return sign * cp
+
+    cp_after = None
     for ply_idx, move in enumerate(moves, start=1):
         fen_before = board.fen()
-        
-        best_san = best_move_san(fen_before, movetime_ms=200) or ""
-        cp_before = analyse_fen_cp(fen_before, depth=8)  
+
+        best_uci = cached(evals.get_best(ply_idx - 1))
+        if best_uci is not None:
+            best_san = board.san(chess.Move.from_uci(best_uci))
+        else:
+            degraded = budget.exhausted
+            best_san = best_move_san(fen_before, movetime_ms=200, budget=budget) or ""
+            if best_san:
+                evals.put(ply_idx - 1, best=board.parse_san(best_san).uci(), shallow=degraded)
+        # the previous ply's "after" eval is this position, same side to move
+        cp_before = cp_after if cp_after is not None else eval_cp(ply_idx - 1, board)
 
         try:
             played_san = board.san(move)
         except Exception:
             played_san = ""
         board.push(move)
-        fen_after = board.fen()
-        cp_after = analyse_fen_cp(fen_after, depth=8)
+        cp_after = eval_cp(ply_idx, board)
 
         cpl = (cp_before - cp_after) if board.turn else (cp_after - cp_before) 
         cpl = abs(cpl)
@@ -59,6 +88,7 @@ def analyze_pgn_file(pgn_filename: str | None):
             "tag": tag
         })
 
+    game_cache.save(evals)
     avg_cpl = int(total_cpl / max(1, len(moves)))
     
     accuracy = max(0, min(100, 100 - avg_cpl/10))
@@ -71,7 +101,8 @@ def analyze_pgn_file(pgn_filename: str | None):
         "inaccuracies": inaccuracies,
         "mistakes": mistakes,
         "blunders": blunders,
-        "moves": move_summaries
+        "moves": move_summaries,
+        "search": dict(budget.stats),
     }
 
 def save_analysis(summary: dict):
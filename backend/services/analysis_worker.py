@@ -0,0 +1,133 @@
+"""
+Standalone analysis worker.
+
+Leases tasks from the work queue, runs them on its own Stockfish, and acks
+the results. Start as many as there are cores to spare, on this host or on
+any machine that sees the same queue file and data/ directory; analysis
+capacity then scales independently of the API processes.
+
+While a task runs, a heartbeat thread keeps extending its lease. If the
+worker dies, the lease runs out and another worker retries the task. The
+worker whose ack completes a job also finalizes it.
+
+Run (from backend/):
+  python -m services.analysis_worker [--worker-id NAME] [--max-tasks N] [--exit-when-idle]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+import chess.engine
+
+from services import profile_jobs
+from services.engine_service import ENGINE_PATH
+from services.engine_supervisor import EngineSupervisor
+from services.work_queue import LEASE_S, Task, WorkQueue, get_queue
+
+# ---------- Config ----------
+POLL_S = 1.0
+
+TASK_HANDLERS: Dict[str, Callable[[Task, chess.engine.SimpleEngine], Dict]] = {
+    profile_jobs.TASK_KIND: profile_jobs.run_game_task,
+}
+JOB_FINALIZERS: Dict[str, Callable[[WorkQueue, str, Callable], Optional[Dict]]] = {
+    profile_jobs.JOB_KIND: profile_jobs.finalize_profile,
+}
+
+
+class _Heartbeat:
+    def __init__(self, queue: WorkQueue, task: Task, lease_s: float):
+        self.queue = queue
+        self.task = task
+        self.lease_s = lease_s
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{task.id}", daemon=True)
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.lease_s / 3):
+            if not self.queue.heartbeat(self.task, self.lease_s):
+                self.lost = True
+                return
+
+
+def finalize(queue: WorkQueue, job: str, supervisor: EngineSupervisor) -> None:
+    if not queue.claim_job(job):
+        return  # someone else got there first
+    info = queue.job(job)
+    finalizer = JOB_FINALIZERS.get(info["kind"]) if info else None
+    try:
+        if finalizer is None:
+            queue.finish_job(job, "done")
+        else:
+            finalizer(queue, job, supervisor.session)
+    except Exception as exc:
+        queue.finish_job(job, "failed", {"error": repr(exc)})
+
+
+def run_task(queue: WorkQueue, supervisor: EngineSupervisor, task: Task, lease_s: float) -> bool:
+    handler = TASK_HANDLERS.get(task.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"no handler for task kind {task.kind!r}")
+        with _Heartbeat(queue, task, lease_s) as heartbeat, supervisor.session() as engine:
+            result = handler(task, engine)
+        if heartbeat.lost:
+            return False  # the task was handed to another worker; drop our result
+        remaining = queue.ack(task, result)
+    except Exception:
+        remaining = queue.fail(task, traceback.format_exc(limit=5))
+    if remaining == 0:
+        finalize(queue, task.job, supervisor)
+    return remaining is not None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run analysis tasks from the work queue.")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+    parser.add_argument("--lease-s", type=float, default=LEASE_S)
+    parser.add_argument("--max-tasks", type=int, default=None)
+    parser.add_argument("--exit-when-idle", action="store_true", help="stop once the queue is empty")
+    args = parser.parse_args()
+
+    queue = get_queue()
+    supervisor = EngineSupervisor(ENGINE_PATH, name=f"worker-{args.worker_id}").start()
+    done = 0
+    started = time.perf_counter()
+    try:
+        while args.max_tasks is None or done < args.max_tasks:
+            task = queue.lease(args.worker_id, kinds=list(TASK_HANDLERS), lease_s=args.lease_s)
+            if task is None:
+                # Jobs whose last task failed for good never see a final ack.
+                for job in queue.completed_jobs():
+                    finalize(queue, job, supervisor)
+                if args.exit_when_idle:
+                    break
+                time.sleep(POLL_S)
+                continue
+            run_task(queue, supervisor, task, args.lease_s)
+            done += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+    elapsed = time.perf_counter() - started
+    print(f"[worker {args.worker_id}] {done} tasks in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Offline batch profiler.
+
+Builds the profile of every user with an archive in data/uploads
+(<username>_chesscom.pgn, or <username>.pgn for manual uploads) without
+going through the API. Games are analyzed by a process pool, one
+Stockfish per process, so all cores are used across users.
+
+Each analyzed game is checkpointed to data/profile_checkpoints/<username>/
+as soon as it is done (temp file, then rename), so an interrupted run
+resumes where it stopped: games that already have a checkpoint are not
+analyzed again. The checkpoint directory also records the archive's size
+and mtime and the build settings; if any of them changed, it is discarded.
+A game that fails (engine unavailable, unreadable game) is not
+checkpointed, so the next run tries it again. Once all of a user's games
+are in, the profile and the move store are written (both atomically) and
+the checkpoints are removed; if some games failed, the checkpoints are
+kept so a rerun only retries those, and if all of them failed the
+existing profile is left alone. The profile's
+feedback stage (services.feedback_pipeline) then runs on a thread of the
+driver, with its own engine for missing best moves, while the pool keeps
+analyzing the other users' games.
+
+Run (from backend/):
+  python -m services.batch_profiler [--users a,b] [--workers N] [--max-games N] [--skip-current]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.engine_service import ENGINE_PATH, SearchBudget
+from services.engine_supervisor import EngineSupervisor
+from services.feedback_pipeline import FeedbackPipeline
+from services.profile_jobs import run_game, user_games, write_profile
+from services.profiling import DEFAULT_MAX_GAMES, DEFAULT_MAX_PLIES_PER_GAME, EVAL_DEPTH
+
+# ---------- Config ----------
+UPLOADS_DIR = os.path.join("data", "uploads")
+PROFILES_DIR = os.path.join("data", "profiles")
+CHECKPOINT_DIR = os.path.join("data", "profile_checkpoints")
+MANIFEST = "manifest.json"
+GAME_ATTEMPTS = 2
+_UPLOAD_STAMP = re.compile(r"^\d{8}_\d{6}_")   # timestamped files from /games/upload
+
+
+def find_archives(uploads_dir: str = UPLOADS_DIR) -> Dict[str, str]:
+    """username -> PGN path; a chess.com archive wins over a manual <username>.pgn."""
+    archives: Dict[str, str] = {}
+    for name in sorted(os.listdir(uploads_dir)) if os.path.isdir(uploads_dir) else []:
+        if not name.endswith(".pgn") or _UPLOAD_STAMP.match(name):
+            continue
+        path = os.path.join(uploads_dir, name)
+        if name.endswith("_chesscom.pgn"):
+            archives[name[: -len("_chesscom.pgn")]] = path
+        else:
+            archives.setdefault(name[: -len(".pgn")], path)
+    return archives
+
+
+def _write_json(path: str, payload: Any) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """Per-user directory of finished games (one JSON file per game index)."""
+
+    def __init__(self, username: str, pgn_path: str, settings: Dict[str, Any], root: str = CHECKPOINT_DIR):
+        self.dir = os.path.join(root, username)
+        st = os.stat(pgn_path)
+        self.manifest = {"pgn_path": os.path.abspath(pgn_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns, **settings}
+        manifest_path = os.path.join(self.dir, MANIFEST)
+        current = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                current = json.load(f)
+        if current != self.manifest:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            os.makedirs(self.dir)
+            _write_json(manifest_path, self.manifest)
+
+    def game_path(self, game_index: int) -> str:
+        return os.path.join(self.dir, f"game-{game_index:06d}.json")
+
+    def has(self, game_index: int) -> bool:
+        return os.path.exists(self.game_path(game_index))
+
+    def load(self, game_index: int) -> Dict[str, Any]:
+        with open(self.game_path(game_index), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def clear(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# ---------- worker processes ----------
+_supervisor: Optional[EngineSupervisor] = None
+
+
+def _init_worker(engine_path: str) -> None:
+    global _supervisor
+    _supervisor = EngineSupervisor(engine_path, name=f"batch-{os.getpid()}").start()
+    multiprocessing.util.Finalize(None, _supervisor.stop, exitpriority=10)
+
+
+def _analyze(unit: Tuple[str, Dict[str, Any], str]) -> Dict[str, Any]:
+    """Analyze one game and checkpoint it; the checkpoint is written here so it survives the parent."""
+    username, payload, checkpoint_path = unit
+    started = time.perf_counter()
+    error = None
+    for _ in range(GAME_ATTEMPTS):
+        try:
+            with _supervisor.session() as engine:
+                result = run_game(payload, engine)
+            break
+        except Exception as exc:  # the supervisor restarts a crashed engine; try once more
+            error = repr(exc)
+    else:
+        # Not checkpointed: the next run tries this game again.
+        return {
+            "username": username,
+            "game_index": payload["game_index"],
+            "failed": True,
+            "error": error,
+            "positions": 0,
+            "searches": 0,
+            "seconds": time.perf_counter() - started,
+        }
+    _write_json(checkpoint_path, result)
+    return {
+        "username": username,
+        "game_index": payload["game_index"],
+        "failed": False,
+        "positions": len(result["rows"]["moves"]["ply"]),
+        "searches": result["search"].get("searches", 0),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+# ---------- driver ----------
+@dataclass
+class _UserRun:
+    username: str
+    pgn_path: str
+    checkpoint: Checkpoint
+    game_indexes: List[int]
+    pending: int
+    resumed: int
+    positions: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+
+def _finish_user(run: _UserRun, profiles_dir: str) -> Optional[Dict[str, Any]]:
+    """Write the profile from the checkpointed games; None (nothing written) if none were analyzed."""
+    finished = [run.checkpoint.load(i) for i in run.game_indexes if run.checkpoint.has(i)]
+    if not finished:
+        return None
+    profile = write_profile(run.username, finished, run.pgn_path, profiles_dir, extra={"batch": True})
+    if len(finished) == len(run.game_indexes):
+        run.checkpoint.clear()
+    return {"games_analyzed": profile.games_analyzed, "avg_cpl": profile.avg_cpl}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build profiles for every user archive in data/uploads.")
+    parser.add_argument("--users", default=None, help="comma-separated usernames (default: every archive)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--max-games", type=int, default=DEFAULT_MAX_GAMES)
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES_PER_GAME)
+    parser.add_argument("--no-feedback", action="store_true", help="skip the proof feedback stage")
+    parser.add_argument("--skip-current", action="store_true", help="skip users whose profile is newer than their archive")
+    parser.add_argument("--uploads-dir", default=UPLOADS_DIR)
+    parser.add_argument("--profiles-dir", default=PROFILES_DIR)
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    args = parser.parse_args()
+
+    archives = find_archives(args.uploads_dir)
+    if args.users:
+        wanted = [u.strip() for u in args.users.split(",") if u.strip()]
+        missing = [u for u in wanted if u not in archives]
+        if missing:
+            parser.error(f"no archive for {', '.join(missing)} in {args.uploads_dir}")
+        archives = {u: archives[u] for u in wanted}
+
+    settings = {
+        "max_games": args.max_games,
+        "max_plies": args.max_plies,
+        "engine": os.path.basename(ENGINE_PATH),
+        "depth": EVAL_DEPTH,
+        "eval_mode": SearchBudget(depth=EVAL_DEPTH).mode,
+    }
+    runs: Dict[str, _UserRun] = {}
+    units = []
+    for username, pgn_path in archives.items():
+        profile_path = os.path.join(args.profiles_dir, f"{username}.json")
+        if args.skip_current and os.path.exists(profile_path) and os.path.getmtime(profile_path) >= os.path.getmtime(pgn_path):
+            print(f"[{username}] profile is current, skipped")
+            continue
+        checkpoint = Checkpoint(username, pgn_path, settings, args.checkpoint_dir)
+        games = user_games(username, pgn_path, args.max_games)
+        todo = [g for g in games if not checkpoint.has(g["game_index"])]
+        run = _UserRun(
+            username, pgn_path, checkpoint, [g["game_index"] for g in games], pending=len(todo), resumed=len(games) - len(todo)
+        )
+        runs[username] = run
+        common = {"username": username, "pgn_path": os.path.abspath(pgn_path), "max_plies": args.max_plies}
+        units.extend((username, {**common, **g}, checkpoint.game_path(g["game_index"])) for g in todo)
+        if run.resumed:
+            print(f"[{username}] resuming: {run.resumed}/{len(games)} games already checkpointed")
+
+    started = time.perf_counter()
+    games_done = games_failed = positions = searches = 0
+    finished_users = 0
+    feedback_engine = None
+    pipeline = None
+    if runs and not args.no_feedback:
+        feedback_engine = EngineSupervisor(ENGINE_PATH, name="batch-feedback").start()
+        pipeline = FeedbackPipeline(profiles_dir=args.profiles_dir)
+
+    def finish(run: _UserRun) -> None:
+        nonlocal finished_users
+        summary = _finish_user(run, args.profiles_dir)
+        if summary is None:
+            print(f"[{run.username}] no game could be analyzed ({run.failed} failed); existing profile kept")
+            return
+        finished_users += 1
+        print(
+            f"[{run.username}] profile written: {summary['games_analyzed']} games, avg CPL {summary['avg_cpl']}, "
+            f"{run.failed} failed, {time.perf_counter() - run.started:.1f}s"
+        )
+        if run.failed:
+            print(f"[{run.username}] run again to retry the {run.failed} failed games")
+        if pipeline is not None:
+            pipeline.schedule(run.username, feedback_engine.session)
+
+    for run in runs.values():
+        if run.pending == 0:
+            finish(run)  # everything was checkpointed by an earlier run
+
+    if units:
+        pool = multiprocessing.Pool(processes=min(args.workers, len(units)), initializer=_init_worker, initargs=(ENGINE_PATH,))
+        try:
+            for done in pool.imap_unordered(_analyze, units):
+                run = runs[done["username"]]
+                run.pending -= 1
+                run.positions += done["positions"]
+                run.failed += done["failed"]
+                games_done += not done["failed"]
+                games_failed += done["failed"]
+                positions += done["positions"]
+                searches += done["searches"]
+                if run.pending == 0:
+                    finish(run)
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            print("\ninterrupted; finished games are checkpointed, run again to resume")
+        finally:
+            pool.join()
+
+    if pipeline is not None:
+        try:
+            for username, status in pipeline.join().items():
+                print(f"[{username}] feedback {status}")
+        finally:
+            pipeline.shutdown()
+            feedback_engine.stop()
+
+    elapsed = time.perf_counter() - started
+    rate = lambda n: n / elapsed if elapsed > 0 else 0.0
+    print(
+        f"\n{finished_users}/{len(runs)} profiles written, {games_done} games analyzed, {games_failed} failed "
+        f"({sum(r.resumed for r in runs.values())} resumed from checkpoints) with {args.workers} workers in {elapsed:.1f}s\n"
+        f"  {rate(games_done):.2f} games/s, {rate(positions):.1f} positions/s, {rate(searches):.1f} engine searches/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Board <-> tensor encoding shared by the move model and the dataset builder.
+
+Positions are encoded from the side to move's point of view (black's boards
+are mirrored) as NUM_PLANES 8x8 planes:
+
+  0-5    our pawns, knights, bishops, rooks, queens, king
+  6-11   their pieces, same order
+  12     side to move (1 = white)
+  13-16  castling rights: ours K, ours Q, theirs K, theirs Q
+  17     en passant square
+
+Piece planes come straight from python-chess bitboards, unpacked with NumPy
+for the whole batch at once, so there is no per-square Python loop.
+"""
+from __future__ import annotations
+
+import sys
+from typing import Sequence
+
+import chess
+import numpy as np
+
+NUM_PLANES = 18
+POLICY_SIZE = 64 * 64      # from-square x to-square, in side-to-move orientation
+PACKED_SIZE = NUM_PLANES * 64 // 8
+
+_BITBOARD_PLANES = 13      # 12 piece planes + en passant
+_PIECE_ATTRS = ("pawns", "knights", "bishops", "rooks", "queens", "kings")
+
+
+def _orient(square: chess.Square, color: chess.Color) -> chess.Square:
+    return square if color == chess.WHITE else chess.square_mirror(square)
+
+
+def encode_boards(boards: Sequence[chess.Board]) -> np.ndarray:
+    """(N, NUM_PLANES, 8, 8) float32 planes for a batch of boards."""
+    return unpack_planes(encode_boards_packed(boards))
+
+
+def encode_board(board: chess.Board) -> np.ndarray:
+    return encode_boards([board])[0]
+
+
+def encode_boards_packed(boards: Sequence[chess.Board]) -> np.ndarray:
+    """(N, PACKED_SIZE) uint8, one bit per plane square. This is the on-disk form."""
+    n = len(boards)
+    bitboards = np.zeros((n, _BITBOARD_PLANES), dtype="<u8")
+    flags = np.zeros((n, 5), dtype=np.uint8)
+    black = np.zeros(n, dtype=bool)
+    for i, board in enumerate(boards):
+        us = board.turn
+        ours, theirs = board.occupied_co[us], board.occupied_co[not us]
+        row = bitboards[i]
+        for p, attr in enumerate(_PIECE_ATTRS):
+            mask = getattr(board, attr)
+            row[p] = mask & ours
+            row[p + 6] = mask & theirs
+        if board.ep_square is not None:
+            row[12] = chess.BB_SQUARES[board.ep_square]
+        flags[i] = (
+            us == chess.WHITE,
+            board.has_kingside_castling_rights(us),
+            board.has_queenside_castling_rights(us),
+            board.has_kingside_castling_rights(not us),
+            board.has_queenside_castling_rights(not us),
+        )
+        black[i] = us == chess.BLACK
+
+    if sys.byteorder != "little":
+        bitboards = bitboards.byteswap()
+    # Byte k of a bitboard is rank k, bit j of that byte is file j.
+    squares = np.unpackbits(bitboards.view(np.uint8).reshape(n, _BITBOARD_PLANES, 8, 1), axis=3, bitorder="little")
+    squares = squares.reshape(n, _BITBOARD_PLANES, 8, 8)
+    squares[black] = squares[black, :, ::-1, :]
+
+    planes = np.empty((n, NUM_PLANES, 8, 8), dtype=np.uint8)
+    planes[:, :12] = squares[:, :12]
+    planes[:, 12:17] = flags[:, :, None, None]
+    planes[:, 17] = squares[:, 12]
+    return np.packbits(planes.reshape(n, -1), axis=1)
+
+
+def unpack_planes(packed: np.ndarray) -> np.ndarray:
+    n = packed.shape[0]
+    bits = np.unpackbits(np.asarray(packed, dtype=np.uint8), axis=1, count=NUM_PLANES * 64)
+    return bits.reshape(n, NUM_PLANES, 8, 8).astype(np.float32)
+
+
+def move_index(move: chess.Move, color: chess.Color) -> int:
+    return _orient(move.from_square, color) * 64 + _orient(move.to_square, color)
+
+
+def legal_masks(boards: Sequence[chess.Board]) -> np.ndarray:
+    masks = np.zeros((len(boards), POLICY_SIZE), dtype=bool)
+    for i, board in enumerate(boards):
+        masks[i, [move_index(move, board.turn) for move in board.legal_moves]] = True
+    return masks
+
+
+def index_to_move(board: chess.Board, index: int) -> chess.Move:
+    from_sq = _orient(index // 64, board.turn)
+    to_sq = _orient(index % 64, board.turn)
+    move = chess.Move(from_sq, to_sq)
+    if move not in board.legal_moves:
+        # The policy has no underpromotion slots; promote to a queen.
+        move = chess.Move(from_sq, to_sq, promotion=chess.QUEEN)
+    return move
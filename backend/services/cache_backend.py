@@ -0,0 +1,201 @@
+"""
+Cache backends for analysis results.
+
+Callers address entries by (namespace, key) and store JSON-serialisable
+values. Two implementations:
+
+  memory   a per-process LRU (the default; what a single worker needs)
+  sqlite   one WAL-mode SQLite file shared by every worker on the host, so
+           `uvicorn --workers N` keeps one copy of each result and a
+           position searched by one worker is a hit for all of them
+
+Select with CACHE_BACKEND=memory|sqlite; CACHE_DB sets the SQLite path.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# ---------- Config ----------
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_DB = os.getenv("CACHE_DB", os.path.join("database", "cache.db"))
+SQLITE_MAX_ROWS = int(os.getenv("CACHE_MAX_ROWS", "500000"))
+MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "50000"))
+SQLITE_TRIM_EVERY = 1000     # writes between size checks
+
+_cache: Optional["CacheBackend"] = None
+_cache_lock = threading.Lock()
+
+
+class CacheBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self, namespace: Optional[str] = None) -> None:
+        ...
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": self.name}
+
+
+class MemoryCache(CacheBackend):
+    """One LRU over all namespaces, evicting the least recently used entry past ``max_entries``."""
+    name = "memory"
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get((namespace, key))
+            if value is not None:
+                self._data.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        with self._lock:
+            if (namespace, key) in self._data:
+                self._data.move_to_end((namespace, key))
+            else:
+                self._counts[namespace] = self._counts.get(namespace, 0) + 1
+            self._data[(namespace, key)] = value
+            while len(self._data) > self.max_entries:
+                (evicted, _), _ = self._data.popitem(last=False)
+                self._counts[evicted] -= 1
+                self.evictions += 1
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        with self._lock:
+            if namespace is None:
+                self._data.clear()
+                self._counts.clear()
+                return
+            for entry in [k for k in self._data if k[0] == namespace]:
+                del self._data[entry]
+            self._counts.pop(namespace, None)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            entries = {ns: n for ns, n in self._counts.items() if n}
+            evictions = self.evictions
+        return {"backend": self.name, "entries": entries, "max_entries": self.max_entries, "evictions": evictions}
+
+
+class SQLiteCache(CacheBackend):
+    """
+    WAL mode lets readers in every process proceed while one writer
+    commits; each thread keeps its own connection. Rows are trimmed oldest
+    first once the table grows past ``max_rows``.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = CACHE_DB, max_rows: int = SQLITE_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache(
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY(namespace, key)
+            )"""
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # Locked or busy past the timeout: a miss, as a failed set() is.
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        conn = self._conn()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache(namespace, key, value) VALUES(?,?,?)",
+                (namespace, key, json.dumps(value, separators=(",", ":"))),
+            )
+            conn.commit()
+        except sqlite3.OperationalError:
+            # Another worker held the write lock past the timeout; a cache
+            # write is not worth failing the request for.
+            conn.rollback()
+            return
+        with self._writes_lock:
+            self._writes += 1
+            trim = self._writes % SQLITE_TRIM_EVERY == 0
+        if trim:
+            self._trim(conn)
+
+    def _trim(self, conn: sqlite3.Connection) -> None:
+        rows = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        excess = rows - self.max_rows
+        if excess > 0:
+            # REPLACE gives a row a new rowid, so the lowest rowids are the oldest writes.
+            conn.execute("DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY rowid LIMIT ?)", (excess,))
+            conn.commit()
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        conn = self._conn()
+        if namespace is None:
+            conn.execute("DELETE FROM cache")
+        else:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+        conn.commit()
+
+    def stats(self) -> Dict[str, object]:
+        rows = self._conn().execute("SELECT namespace, COUNT(*) FROM cache GROUP BY namespace").fetchall()
+        return {"backend": self.name, "path": self.path, "entries": dict(rows), "max_rows": self.max_rows}
+
+
+def make_cache(backend: str = CACHE_BACKEND) -> CacheBackend:
+    if backend == "sqlite":
+        return SQLiteCache()
+    if backend == "memory":
+        return MemoryCache()
+    raise ValueError(f"Unknown CACHE_BACKEND {backend!r} (expected memory or sqlite)")
+
+
+def get_cache() -> CacheBackend:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = make_cache()
+    return _cache
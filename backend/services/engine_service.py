@@ -1,28 +1,361 @@
-import os, chess, chess.engine
+import os, time, threading, chess, chess.engine
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
 
-ENGINE_PATH = os.getenv("STOCKFISH_PATH") or r"D:\engines\stockfish\stockfish-windows-x86-64-avx2.exe" 
-_engine = None
+from .engine_supervisor import EngineSupervisor, EngineUnavailable, watchdog
+from .opening_book import get_book
+from .metrics import ENGINE_SEARCH_NODES, ENGINE_SEARCH_SECONDS, ENGINE_SEARCHES_AVOIDED
+
+ENGINE_PATH = os.getenv("STOCKFISH_PATH") or r"D:\engines\stockfish\stockfish-windows-x86-64-avx2.exe"
+SERVICE_ENGINE_NAME = "engine-service"   # supervisor behind best_move_san/analyse_fen_cp
+_supervisor = None
+_supervisor_lock = threading.Lock()
+
+# ---------- Search budgeting ----------
+FORCED_MOVE_DEPTH = 4      # a single legal move only needs a rough score
+SHALLOW_DEPTH = 6          # callers that will discard the score's precision
+SHALLOW_NODE_DIVISOR = 16  # same idea for fixed-node (deterministic) budgets
+STABLE_DEPTHS = 3          # stop once the best move survives this many iterations
+MIN_DEPTH_RATIO = 0.6      # ...but never before this fraction of the target depth
+LIVE_DEADLINE_S = float(os.getenv("LIVE_DEADLINE_S", "3.0"))
+GAME_NODE_BUDGET = int(os.getenv("GAME_NODE_BUDGET", "20000000"))
+PROFILE_NODE_BUDGET = int(os.getenv("PROFILE_NODE_BUDGET", "1500000000"))
+EXHAUSTED_NODES = 20000    # per-search allowance once a node budget is spent
+
+# ---------- Deterministic mode ----------
+# ENGINE_SEARCH_MODE=deterministic makes every eval a single-threaded,
+# fixed-node search from a cleared hash, so the same FEN always yields the
+# same score and results are safe to cache, memoize and diff across runs.
+SEARCH_MODE = os.getenv("ENGINE_SEARCH_MODE", "adaptive").lower()
+DETERMINISTIC_NODES = int(os.getenv("DETERMINISTIC_NODES", "300000"))
+
+
+def _default_fixed_nodes() -> Optional[int]:
+    return DETERMINISTIC_NODES if SEARCH_MODE == "deterministic" else None
+
+
+class NodeBudget:
+    """
+    Shared node allowance for a batch of searches (one game, one profile).
+    Once spent, searches drop to a small fixed node count instead of failing,
+    so batch jobs stay bounded without losing positions.
+    """
+    def __init__(self, total: int):
+        self.total = total
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.spent)
+
+    def spend(self, nodes: int) -> None:
+        with self._lock:
+            self.spent += max(0, nodes)
+
+
+@dataclass
+class SearchBudget:
+    """Per-search policy: target depth, stability cut-off, deadline and node budgets."""
+    depth: int
+    deadline: Optional[float] = None           # time.monotonic() value
+    time_limit_s: Optional[float] = None       # deadline set relative to the first search (start_clock)
+    node_budgets: Tuple[NodeBudget, ...] = ()
+    stable_depths: int = STABLE_DEPTHS
+    min_depth: Optional[int] = None
+    fixed_nodes: Optional[int] = field(default_factory=_default_fixed_nodes)
+    site: str = "default"                      # metrics label for the caller
+    use_book: bool = True                      # answer known theory from the opening book
+    cancel: Optional[threading.Event] = None   # set to stop the running search early
+    stats: Dict[str, int] = field(default_factory=lambda: {
+        "searches": 0, "short_circuited": 0, "stopped_early": 0, "nodes": 0, "book": 0, "shallow": 0, "cached": 0,
+    })
+
+    @classmethod
+    def live(cls, depth: int, deadline_s: float = LIVE_DEADLINE_S) -> "SearchBudget":
+        # The clock starts with the first search, i.e. once the engine is
+        # held, not while the request waits for admission or the lock.
+        return cls(depth=depth, time_limit_s=deadline_s, site="live")
+
+    def start_clock(self) -> None:
+        if self.deadline is None and self.time_limit_s is not None:
+            self.deadline = time.monotonic() + self.time_limit_s
+
+    def for_game(self, game_nodes: int = GAME_NODE_BUDGET) -> "SearchBudget":
+        """Child budget that also charges a fresh per-game node allowance."""
+        return SearchBudget(
+            depth=self.depth,
+            deadline=self.deadline,
+            time_limit_s=self.time_limit_s,
+            node_budgets=self.node_budgets + (NodeBudget(game_nodes),),
+            stable_depths=self.stable_depths,
+            min_depth=self.min_depth,
+            fixed_nodes=self.fixed_nodes,
+            site=self.site,
+            use_book=self.use_book,
+            cancel=self.cancel,
+            stats=self.stats,
+        )
+
+    def shallow(self) -> "SearchBudget":
+        """Cheaper budget sharing stats and node budgets, for scores the caller will not use in full."""
+        return replace(
+            self,
+            depth=min(self.depth, SHALLOW_DEPTH),
+            min_depth=None,
+            fixed_nodes=max(1, self.fixed_nodes // SHALLOW_NODE_DIVISOR) if self.fixed_nodes else None,
+        )
+
+    @property
+    def exhausted(self) -> bool:
+        """True once a node budget is spent or the deadline has passed; searches are degraded from then on."""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return any(b.remaining == 0 for b in self.node_budgets)
+
+    @property
+    def mode(self) -> str:
+        """Tag identifying how results were produced; part of every cache key."""
+        return f"nodes{self.fixed_nodes}" if self.fixed_nodes else "adaptive"
+
+    def root(self, board: chess.Board) -> chess.Board:
+        # Deterministic searches must not depend on the move history the
+        # caller happens to have (repetition detection), only on the FEN.
+        return board.copy(stack=False) if self.fixed_nodes else board
+
+    def engine_kwargs(self, engine: chess.engine.SimpleEngine) -> Dict:
+        if not self.fixed_nodes:
+            return {}
+        # A fresh game object makes python-chess send ucinewgame, which
+        # clears the hash; one thread removes SMP timing noise.
+        options = {"Threads": 1} if "Threads" in engine.options else {}
+        return {"game": object(), "options": options}
+
+    def limit(self) -> chess.engine.Limit:
+        if self.fixed_nodes:
+            return chess.engine.Limit(nodes=self.fixed_nodes)
+        nodes = None
+        if self.node_budgets:
+            nodes = min(b.remaining for b in self.node_budgets) or EXHAUSTED_NODES
+        time_left = None
+        if self.deadline is not None:
+            time_left = max(0.01, self.deadline - time.monotonic())
+        return chess.engine.Limit(depth=self.depth, nodes=nodes, time=time_left)
+
+    def charge(self, nodes: int) -> None:
+        self.stats["nodes"] += nodes
+        for budget in self.node_budgets:
+            budget.spend(nodes)
+
+
+def classify_position(board: chess.Board) -> Optional[str]:
+    """
+    Why a position needs no full search: "game_over" (result is known, no
+    engine call) or "forced_move" (one legal move, searched shallowly), or
+    None for an ordinary position.
+    """
+    if board.is_game_over():
+        return "game_over"
+    if board.legal_moves.count() == 1:
+        return "forced_move"
+    return None
+
+
+def _terminal_info(board: chess.Board) -> Dict:
+    if board.is_checkmate():
+        score = chess.engine.PovScore(chess.engine.Mate(0), board.turn)
+    else:
+        score = chess.engine.PovScore(chess.engine.Cp(0), board.turn)
+    return {"score": score, "pv": [], "depth": 0, "nodes": 0, "complete": True}
+
+
+def _book_info(board: chess.Board, budget: SearchBudget) -> Optional[Dict]:
+    book = get_book()
+    if book is None or book.mode != budget.mode or book.depth < budget.depth:
+        return None
+    entry = book.lookup(board)
+    if entry is None:
+        return None
+    pv = [entry.best_move] if entry.best_move is not None else []
+    return {
+        "score": entry.score, "pv": pv, "depth": book.depth, "nodes": 0, "book": True, "eco": entry.eco, "complete": True,
+    }
+
+
+def _record_search(budget: SearchBudget, infos: List[Dict], started: float) -> None:
+    nodes = max(int(info.get("nodes", 0) or 0) for info in infos) if infos else 0
+    budget.stats["searches"] += 1
+    budget.charge(nodes)
+    ENGINE_SEARCH_SECONDS.observe(time.perf_counter() - started, site=budget.site)
+    ENGINE_SEARCH_NODES.observe(nodes, site=budget.site)
+
+
+def search(
+    engine: chess.engine.SimpleEngine,
+    board: chess.Board,
+    budget: SearchBudget,
+    multipv: Optional[int] = None,
+):
+    """
+    Budgeted replacement for ``engine.analyse``; returns the same shape
+    (an info dict, or a list of them when ``multipv`` is given).
+
+    - game-over positions never reach the engine
+    - positions in the opening book are answered from it (single-PV only)
+    - a single legal move is searched to FORCED_MOVE_DEPTH only
+    - iterative deepening stops once the best move is stable for
+      ``stable_depths`` iterations past the minimum depth
+    - the deadline and node budgets cap every search
+    - setting ``budget.cancel`` stops a running search at its next iteration
+    - deterministic budgets (``fixed_nodes``) run one fixed-node search
+    - results that stand for the full target depth (game over, book,
+      forced move, fixed nodes, a stability stop) carry ``"complete": True``;
+      see reached_depth()
+    - the engine's supervisor watchdog is armed for this search only
+    """
+    budget.start_clock()
+    trivial = classify_position(board)
+    if trivial == "game_over":
+        budget.stats["short_circuited"] += 1
+        ENGINE_SEARCHES_AVOIDED.inc(site=budget.site, reason="game_over")
+        info = _terminal_info(board)
+        return [info] if multipv else info
+
+    if budget.use_book and not multipv:
+        info = _book_info(board, budget)
+        if info is not None:
+            budget.stats["book"] += 1
+            ENGINE_SEARCHES_AVOIDED.inc(site=budget.site, reason="book")
+            return info
+
+    target = budget.depth
+    if trivial == "forced_move":
+        budget.stats["short_circuited"] += 1
+        ENGINE_SEARCHES_AVOIDED.inc(site=budget.site, reason="forced_move")
+        target = min(target, FORCED_MOVE_DEPTH)
+    min_depth = budget.min_depth or max(1, int(target * MIN_DEPTH_RATIO))
+
+    started = time.perf_counter()
+    limit = budget.limit()
+    if budget.fixed_nodes:
+        # No stability cut-off or deadline: stopping is asynchronous and
+        # would make the node count (and score) vary between runs.
+        if target < budget.depth:
+            limit.depth = target
+        with watchdog(engine):
+            info = engine.analyse(
+                budget.root(board), limit, multipv=multipv, **budget.engine_kwargs(engine)
+            )
+        infos = info if isinstance(info, list) else [info]
+        for entry in infos:
+            entry["complete"] = True
+        _record_search(budget, infos, started)
+        return info
+
+    limit.depth = target
+    best_by_depth: List[Optional[chess.Move]] = []
+    last_depth = 0
+    stopped_early = False
+    with watchdog(engine), engine.analysis(board, limit, multipv=multipv) as analysis:
+        for info in analysis:
+            if budget.cancel is not None and budget.cancel.is_set():
+                analysis.stop()
+                continue
+            depth = info.get("depth")
+            pv = info.get("pv")
+            if depth is None or not pv or info.get("multipv", 1) != 1 or depth == last_depth:
+                continue
+            last_depth = depth
+            best_by_depth.append(pv[0])
+            recent = best_by_depth[-budget.stable_depths:]
+            if (
+                depth >= min_depth
+                and depth < target
+                and len(recent) == budget.stable_depths
+                and all(move == recent[0] for move in recent)
+            ):
+                stopped_early = True
+                analysis.stop()
+        infos = list(analysis.multipv)
+
+    cancelled = budget.cancel is not None and budget.cancel.is_set()
+    if stopped_early:
+        budget.stats["stopped_early"] += 1
+    if trivial == "forced_move" or (stopped_early and not cancelled):
+        # A stability stop is the policy's answer for the target depth: a
+        # repeat request would stop at the same point, so it is cached as one.
+        for entry in infos:
+            entry["complete"] = True
+    _record_search(budget, infos, started)
+    if multipv:
+        return infos
+    return infos[0] if infos else {}
+
+
+def reached_depth(info, budget: SearchBudget) -> int:
+    """
+    Depth a search() result actually stands for: the target for complete
+    results (including a stability stop), otherwise the last depth the
+    engine finished (the shallowest line of a multipv result). The deadline,
+    a node budget or a cancel leave it below ``budget.depth``; such results
+    must not be cached or labelled as target-depth results.
+    """
+    infos = info if isinstance(info, list) else [info]
+    if not infos or not all(entry for entry in infos):
+        return 0
+    if all(entry.get("complete") for entry in infos):
+        return budget.depth
+    return min(min(int(entry.get("depth") or 0), budget.depth) for entry in infos)
+
+
+def get_supervisor() -> EngineSupervisor:
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            # just to check
+            _supervisor = EngineSupervisor(
+                ENGINE_PATH,
+                options={"Skill Level": 6, "UCI_LimitStrength": True, "UCI_Elo": 1500},
+                name=SERVICE_ENGINE_NAME,
+            ).start()
+    return _supervisor
 
 def get_engine():
-    global _engine
-    if _engine is None:
-        _engine = chess.engine.SimpleEngine.popen_uci(ENGINE_PATH)
-        # just to check
-        _engine.configure({"Skill Level": 6, "UCI_LimitStrength": True, "UCI_Elo": 1500})
-    return _engine
-
-def best_move_san(fen: str, movetime_ms: int = 300):
+    engine = get_supervisor().engine
+    if engine is None:
+        raise EngineUnavailable(get_supervisor().error or "engine not initialized")
+    return engine
+
+def best_move_san(fen: str, movetime_ms: int = 300, budget: Optional[SearchBudget] = None):
     board = chess.Board(fen)
-    engine = get_engine()
-    result = engine.play(board, chess.engine.Limit(time=movetime_ms/1000.0))
+    legal = list(board.legal_moves)
+    if not legal:
+        return None
+    if len(legal) == 1:
+        return board.san(legal[0])
+    if budget is not None and budget.use_book:
+        # Game analysis: an opening ply's best move comes from the book, as its eval does in search().
+        info = _book_info(board, budget)
+        if info is not None and info["pv"]:
+            budget.stats["book"] += 1
+            ENGINE_SEARCHES_AVOIDED.inc(site=budget.site, reason="book")
+            return board.san(info["pv"][0])
+    with get_supervisor().session() as engine, watchdog(engine):
+        movetime = movetime_ms / 1000.0
+        if budget is not None:
+            budget.start_clock()
+            if budget.deadline is not None:
+                movetime = max(0.01, min(movetime, budget.deadline - time.monotonic()))
+        result = engine.play(board, chess.engine.Limit(time=movetime))
     if result.move is None:
         return None
     return board.san(result.move)
 
-def analyse_fen_cp(fen: str, depth: int = 10) -> int:
+def analyse_fen_cp(fen: str, depth: int = 10, budget: Optional[SearchBudget] = None) -> int:
     """Return centipawn eval from side to move perspective (cp, not mate)."""
     board = chess.Board(fen)
-    engine = get_engine()
-    info = engine.analyse(board, chess.engine.Limit(depth=depth))
+    budget = budget or SearchBudget(depth=depth)
+    with get_supervisor().session() as engine:
+        info = search(engine, board, budget)
     score = info["score"].pov(board.turn)
-    return score.score(mate_score=100000) 
+    return score.score(mate_score=100000)
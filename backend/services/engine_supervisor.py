@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import chess
+import chess.engine
+
+from services.metrics import ENGINE_QUEUE_WAIT_SECONDS, ENGINE_RESTARTS
+
+# ---------- Config ----------
+PING_INTERVAL_S = float(os.getenv("ENGINE_PING_INTERVAL_S", "5.0"))
+PING_TIMEOUT_S = float(os.getenv("ENGINE_PING_TIMEOUT_S", "2.0"))
+SEARCH_TIMEOUT_S = float(os.getenv("ENGINE_SEARCH_TIMEOUT_S", "60.0"))
+READY_WAIT_S = float(os.getenv("ENGINE_READY_WAIT_S", "10.0"))   # how long a request waits for a starting engine
+WARMUP_DEPTH = 8
+
+
+# engine process -> the supervisor that launched it, for watchdog()
+_owners: "weakref.WeakKeyDictionary[chess.engine.SimpleEngine, EngineSupervisor]" = weakref.WeakKeyDictionary()
+
+
+class EngineUnavailable(RuntimeError):
+    pass
+
+
+class EngineStarting(EngineUnavailable):
+    """The first launch (started in the background) has not finished yet."""
+
+
+class EngineSupervisor:
+    """
+    Owns one UCI engine process and keeps it usable.
+
+    - a background thread pings idle engines with ``isready`` and restarts
+      crashed or unresponsive processes
+    - engines are used inside ``session()``, which serializes access; a
+      session may run any number of searches
+    - each search runs inside ``watchdog(engine)`` (engine_service.search
+      does this), which arms the watchdog: a single search running longer
+      than ``search_timeout`` gets the process killed and replaced
+    - a new process is configured and warmed up (short search + ping)
+      before it is swapped in, so callers never see a cold engine
+    - ``start_background()`` runs the first launch on a thread so the app
+      can serve requests meanwhile; sessions wait up to ``READY_WAIT_S``
+      for it and ``ready`` tells when it is done
+    """
+
+    def __init__(
+        self,
+        path: str,
+        options: Optional[Dict[str, object]] = None,
+        name: str = "stockfish",
+        ping_interval: float = PING_INTERVAL_S,
+        search_timeout: float = SEARCH_TIMEOUT_S,
+    ):
+        self.path = path
+        self.options = dict(options or {})
+        self.name = name
+        self.ping_interval = ping_interval
+        self.search_timeout = search_timeout
+
+        self.lock = threading.Lock()          # held for the duration of every search
+        self._swap_lock = threading.Lock()    # serializes restarts
+        self._engine: Optional[chess.engine.SimpleEngine] = None
+        self._search_started: Optional[float] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.ready = threading.Event()        # set once the first launch attempt has finished
+        self.startup_s: Optional[float] = None
+
+        self.error: Optional[str] = None
+        self.restarts = 0
+        self.watchdog_kills = 0
+
+    # ----- lifecycle -----
+    def start(self, monitor: bool = True) -> "EngineSupervisor":
+        started = time.perf_counter()
+        self._restart(reason=None, failed=None)
+        if not self.ready.is_set():
+            self.startup_s = time.perf_counter() - started
+            self.ready.set()
+        if monitor and self._thread is None:
+            self._thread = threading.Thread(target=self._monitor, name=f"{self.name}-supervisor", daemon=True)
+            self._thread.start()
+        return self
+
+    def start_background(
+        self, on_ready: Optional[Callable[["EngineSupervisor"], None]] = None, monitor: bool = True
+    ) -> "EngineSupervisor":
+        """start() on a thread; ``on_ready`` runs there once the first launch attempt is done."""
+        def run() -> None:
+            self.start(monitor=monitor)
+            if on_ready is not None:
+                on_ready(self)
+
+        threading.Thread(target=run, name=f"{self.name}-startup", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.ping_interval + PING_TIMEOUT_S)
+            self._thread = None
+        with self._swap_lock:
+            self._close(self._engine)
+            self._engine = None
+
+    # ----- access -----
+    @property
+    def engine(self) -> Optional[chess.engine.SimpleEngine]:
+        engine = self._engine
+        if engine is not None and not self._alive(engine):
+            self._restart(reason="engine process exited", failed=engine)
+            engine = self._engine
+        return engine
+
+    @contextmanager
+    def session(self):
+        """Serialized access to a live engine."""
+        if not self.ready.wait(READY_WAIT_S):
+            raise EngineStarting(f"{self.name} engine is still starting")
+        waited = time.perf_counter()
+        with self.lock:
+            ENGINE_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - waited, engine=self.name)
+            engine = self.engine
+            if engine is None:
+                raise EngineUnavailable(self.error or f"{self.name} engine not initialized")
+            try:
+                yield engine
+            except chess.engine.EngineTerminatedError:
+                self._restart(reason="engine terminated during search", failed=engine)
+                raise
+
+    @contextmanager
+    def searching(self):
+        """Arm the watchdog for one search; call with the session held."""
+        self._search_started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._search_started = None
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "ready": self.ready.is_set(),
+            "alive": self._engine is not None and self._alive(self._engine),
+            "busy": self.lock.locked(),
+            "restarts": self.restarts,
+            "watchdog_kills": self.watchdog_kills,
+            "error": self.error,
+            "startup_s": round(self.startup_s, 3) if self.startup_s is not None else None,
+        }
+
+    # ----- internals -----
+    @staticmethod
+    def _alive(engine: chess.engine.SimpleEngine) -> bool:
+        return not engine.returncode.done()
+
+    @staticmethod
+    def _close(engine: Optional[chess.engine.SimpleEngine]) -> None:
+        if engine is None:
+            return
+        try:
+            engine.close()
+        except Exception:
+            pass
+
+    def _launch(self) -> chess.engine.SimpleEngine:
+        engine = chess.engine.SimpleEngine.popen_uci(self.path, timeout=PING_TIMEOUT_S + 8.0)
+        try:
+            if self.options:
+                engine.configure(self.options)
+            # Warm-up: touch the hash, NNUE weights and thread pool once.
+            engine.analyse(chess.Board(), chess.engine.Limit(depth=WARMUP_DEPTH))
+            engine.ping()
+        except Exception:
+            self._close(engine)
+            raise
+        # From here on, isready must answer within the ping timeout.
+        engine.timeout = PING_TIMEOUT_S
+        _owners[engine] = self
+        return engine
+
+    def _restart(self, reason: Optional[str], failed: Optional[chess.engine.SimpleEngine]) -> None:
+        """Replace ``failed`` (None: whatever is current) unless that already happened."""
+        with self._swap_lock:
+            current = self._engine
+            if failed is not None and current is not failed:
+                return
+            if reason is None and current is not None and self._alive(current):
+                return
+            self._close(current)
+            if reason is not None:
+                ENGINE_RESTARTS.inc(engine=self.name, reason=reason.split(";")[0])
+            try:
+                self._engine = self._launch()
+                self.error = None
+                if current is not None:
+                    self.restarts += 1
+            except Exception as exc:
+                self._engine = None
+                self.error = str(exc) if reason is None else f"{reason}; restart failed: {exc}"
+
+    def _monitor(self) -> None:
+        while not self._stopped.wait(self.ping_interval):
+            started = self._search_started
+            if started is not None:
+                if time.monotonic() - started > self.search_timeout:
+                    # Hung search: killing the process unblocks the caller,
+                    # whose session() then sees EngineTerminatedError.
+                    self._search_started = None
+                    self.watchdog_kills += 1
+                    self._restart(
+                        reason=f"search exceeded {self.search_timeout:.0f}s watchdog",
+                        failed=self._engine,
+                    )
+                continue
+            if not self.lock.acquire(blocking=False):
+                continue
+            try:
+                engine = self._engine
+                if engine is None:
+                    self._restart(reason="engine unavailable", failed=None)
+                    continue
+                try:
+                    engine.ping()
+                except Exception:
+                    self._restart(reason="engine failed isready ping", failed=engine)
+            finally:
+                self.lock.release()
+
+
+@contextmanager
+def watchdog(engine: chess.engine.SimpleEngine):
+    """Arm the owning supervisor's watchdog around one search (no-op for unsupervised engines)."""
+    supervisor = _owners.get(engine)
+    if supervisor is None:
+        yield
+        return
+    with supervisor.searching():
+        yield
@@ -1,6 +1,8 @@
 import os
+import time
 from dotenv import load_dotenv
-from google import genai
+
+from services.metrics import GEMINI_FAILURES, GEMINI_REQUEST_SECONDS
 
 MODEL_NAME = "gemini-2.0-flash"
 
@@ -11,6 +13,8 @@ def _get_client():
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         return None
+    from google import genai  # ~0.5s to import; only paid once feedback is requested
+
     return genai.Client(api_key=api_key)
 
 
@@ -21,11 +25,40 @@ def _missing_key_message() -> str:
     )
 
 
+def is_fallback(text: str) -> bool:
+    """True for the canned message returned when Gemini could not be used."""
+    return text == _missing_key_message()
+
+
+def _generate_text(prompt: str, kind: str) -> str:
+    client = _get_client()
+    if not client:
+        GEMINI_FAILURES.inc(kind=kind, reason="no_api_key")
+        return _missing_key_message()
+
+    start = time.perf_counter()
+    try:
+        response = client.models.generate_content(
+            model=MODEL_NAME,
+            contents=prompt,
+        )
+        text = getattr(response, "text", None)
+        if not text:
+            GEMINI_FAILURES.inc(kind=kind, reason="empty_response")
+        return text.strip() if text else _missing_key_message()
+    except Exception as exc:
+        GEMINI_FAILURES.inc(kind=kind, reason=exc.__class__.__name__)
+        return _missing_key_message()
+    finally:
+        GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - start, kind=kind)
+
+
 def generate_feedback(profile: dict, proof: dict) -> str:
     """
     Generates personalised chess feedback for a single proof position.
     """
 
+    better = f"- Better move (UCI): {proof['best_move']}\n" if proof.get("best_move") else ""
     prompt = f"""
 You are a chess coach explaining mistakes to a human player.
 
@@ -40,7 +73,7 @@ PLAYER PROFILE:
 POSITION:
 - FEN: {proof['fen']}
 - Move played: {proof['played_move']}
-- Centipawn loss: {proof['cpl']}
+{better}- Centipawn loss: {proof['cpl']}
 - Classification: {proof['label']}
 - Phase: {proof['phase']}
 
@@ -57,19 +90,7 @@ RULES:
 - Be encouraging, not insulting
 """
 
-    client = _get_client()
-    if not client:
-        return _missing_key_message()
-
-    try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-        )
-        text = getattr(response, "text", None)
-        return text.strip() if text else _missing_key_message()
-    except Exception:
-        return _missing_key_message()
+    return _generate_text(prompt, kind="proof")
 
 
 def generate_live_explanation(profile: dict, analysis: dict, fen: str, move_uci: str) -> str:
@@ -118,16 +139,4 @@ RULES:
 - Keep it concise and encouraging.
 """
 
-    client = _get_client()
-    if not client:
-        return _missing_key_message()
-
-    try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-        )
-        text = getattr(response, "text", None)
-        return text.strip() if text else _missing_key_message()
-    except Exception:
-        return _missing_key_message()
+    return _generate_text(prompt, kind="live")
@@ -0,0 +1,154 @@
+"""
+Feedback precomputation: the last stage of a profile build.
+
+Once a profile is written, its proof positions get their best move (when
+the build left it unknown) and their Gemini feedback, and both are stored
+in the profile JSON next to each proof. The profile is then marked with
+
+  feedback_status = "ready"         every proof has stored feedback
+                    "unavailable"   Gemini could not be used (no key, call
+                                    failed); the canned message is stored and
+                                    a view after RETRY_UNAVAILABLE_S runs the
+                                    stage again
+                    "pending"       not done yet (what a fresh build writes)
+
+/feedback/{username} only serves what is stored. The API and the batch
+profiler run the stage on a background thread (FeedbackPipeline), analysis
+workers call precompute() directly.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, ContextManager, Dict, Optional
+
+import chess
+import chess.engine
+
+from services.engine_service import SearchBudget, search
+from services.feedback import generate_feedback, is_fallback
+from services.profiling import profile_stamp, save_profile_dict
+
+# ---------- Config ----------
+PROFILES_DIR = os.path.join("data", "profiles")
+FEEDBACK_CONCURRENCY = int(os.getenv("FEEDBACK_CONCURRENCY", "4"))   # Gemini calls in flight per profile
+BEST_MOVE_DEPTH = 14
+MAX_STALE_RETRIES = 3
+RETRY_UNAVAILABLE_S = 300
+
+READY = "ready"
+PENDING = "pending"
+UNAVAILABLE = "unavailable"
+STALE = "stale"        # the profile was rebuilt while its feedback was being generated
+
+EngineSession = Callable[[], ContextManager[chess.engine.SimpleEngine]]
+
+
+def best_move_for(engine: chess.engine.SimpleEngine, fen: str) -> Optional[str]:
+    info = search(engine, chess.Board(fen), SearchBudget(depth=BEST_MOVE_DEPTH, site="feedback"))
+    pv = info.get("pv")
+    return pv[0].uci() if pv else None
+
+
+def precompute(username: str, profiles_dir: str = PROFILES_DIR, session: Optional[EngineSession] = None) -> str:
+    """Fill in best moves and feedback for the user's proofs and store them; returns the new status."""
+    path = os.path.join(profiles_dir, f"{username}.json")
+    stamp = profile_stamp(path)
+    with open(path, "r", encoding="utf-8") as f:
+        profile = json.load(f)
+    proofs = profile.get("profile_proofs") or []
+
+    if session is not None:
+        for proof in proofs:
+            if proof.get("best_move"):
+                continue
+            try:
+                with session() as engine:
+                    proof["best_move"] = best_move_for(engine, proof["fen"])
+            except Exception:
+                pass  # engine busy or down: the feedback does not depend on it
+
+    with ThreadPoolExecutor(max_workers=max(1, min(FEEDBACK_CONCURRENCY, len(proofs)))) as pool:
+        texts = list(pool.map(partial(generate_feedback, profile), proofs))
+    for proof, text in zip(proofs, texts):
+        proof["feedback"] = text
+    status = UNAVAILABLE if any(is_fallback(text) for text in texts) else READY
+    profile["feedback_status"] = status
+
+    # A rebuild that landed meanwhile has other proofs; it gets its own run.
+    if save_profile_dict(profile, profiles_dir, expect_stamp=stamp) is None:
+        return STALE
+    return status
+
+
+class FeedbackPipeline:
+    """Runs precompute() in the background, at most once at a time per user."""
+
+    def __init__(self, workers: int = 1, profiles_dir: str = PROFILES_DIR):
+        self.profiles_dir = profiles_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="feedback")
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.completed: Dict[str, int] = {}
+
+    def schedule(self, username: str, session: Optional[EngineSession] = None) -> bool:
+        """Queue the user's profile; False if a run for it is already queued or running."""
+        with self._lock:
+            running = self._inflight.get(username)
+            if running is not None and not running.done():
+                return False
+            self._inflight[username] = self._executor.submit(self._run, username, session)
+        return True
+
+    def pending(self, username: str) -> bool:
+        with self._lock:
+            running = self._inflight.get(username)
+        return running is not None and not running.done()
+
+    def _run(self, username: str, session: Optional[EngineSession]) -> str:
+        status = STALE
+        for _ in range(MAX_STALE_RETRIES):
+            try:
+                status = precompute(username, self.profiles_dir, session)
+            except FileNotFoundError:
+                status = PENDING
+            if status != STALE:
+                break
+        with self._lock:
+            self.completed[status] = self.completed.get(status, 0) + 1
+        return status
+
+    def join(self) -> Dict[str, str]:
+        """Wait for everything scheduled so far; username -> final status."""
+        with self._lock:
+            futures = dict(self._inflight)
+        return {username: future.result() for username, future in futures.items()}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            inflight = sorted(u for u, f in self._inflight.items() if not f.done())
+            return {"inflight": inflight, "completed": dict(self.completed)}
+
+
+_pipeline: Optional[FeedbackPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> FeedbackPipeline:
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = FeedbackPipeline()
+    return _pipeline
+
+
+def shutdown() -> None:
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.shutdown()
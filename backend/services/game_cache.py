@@ -0,0 +1,122 @@
+"""
+Game-level analysis cache.
+
+A game is identified by its starting FEN and UCI mainline; together with
+the engine settings (engine name, depth, search mode, caller) that gives
+the cache key. The value holds one slot per position of the mainline: the
+eval from White's side, the best move, and whether the eval came from a
+shallow search. When the same game comes back (re-fetched archive, manual
+upload of the same games, the opponent's profile) its evals are read from
+here instead of searching again.
+
+Entries live in the game_evals table of the app database.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+import chess
+
+from database import get_conn
+from services.metrics import record_cache
+
+# ---------- Config ----------
+GAME_CACHE_ENABLED = os.getenv("GAME_CACHE", "1") != "0"
+
+
+def game_key(start_fen: str, moves: Iterable[chess.Move], settings: str) -> str:
+    mainline = " ".join(move.uci() for move in moves)
+    raw = f"{start_fen}|{mainline}|{settings}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def engine_settings(engine, depth: int, mode: str, caller: str) -> str:
+    """Everything besides the game that changes the evals: engine build, depth, mode, caller policy."""
+    name = (getattr(engine, "id", None) or {}).get("name", "")
+    return f"{name}|depth{depth}|{mode}|{caller}"
+
+
+@dataclass
+class GameEvals:
+    key: str
+    cp: List[Optional[int]]              # White's side, per position (0 = start)
+    best: List[Optional[str]]            # UCI
+    shallow: List[bool]
+    dirty: bool = field(default=False, compare=False)
+    stored: bool = field(default=False, compare=False)
+
+    @classmethod
+    def empty(cls, key: str, positions: int) -> "GameEvals":
+        return cls(key, [None] * positions, [None] * positions, [False] * positions)
+
+    def _grow(self, positions: int) -> None:
+        missing = positions - len(self.cp)
+        if missing > 0:
+            self.cp.extend([None] * missing)
+            self.best.extend([None] * missing)
+            self.shallow.extend([False] * missing)
+
+    def get_cp(self, ply: int, shallow_ok: bool = False) -> Optional[int]:
+        if ply >= len(self.cp) or (self.shallow[ply] and not shallow_ok):
+            return None
+        return self.cp[ply]
+
+    def get_best(self, ply: int, shallow_ok: bool = False) -> Optional[str]:
+        if ply >= len(self.best) or (self.shallow[ply] and not shallow_ok):
+            return None
+        return self.best[ply]
+
+    def put(self, ply: int, cp: Optional[int] = None, best: Optional[str] = None, shallow: bool = False) -> None:
+        """Record a result; a shallow eval never replaces a full one."""
+        if cp is None and best is None:
+            return
+        self._grow(ply + 1)
+        if shallow and self.cp[ply] is not None and not self.shallow[ply]:
+            return
+        if cp is not None:
+            self.cp[ply] = int(cp)
+            self.shallow[ply] = shallow
+        elif shallow:
+            self.shallow[ply] = True
+        if best is not None:
+            self.best[ply] = best
+        self.dirty = True
+
+
+def load(key: str, positions: int) -> GameEvals:
+    """Cached evals for a game (empty slots where nothing is known yet)."""
+    if not GAME_CACHE_ENABLED:
+        return GameEvals.empty(key, positions)
+    conn = get_conn()
+    try:
+        row = conn.execute("SELECT payload FROM game_evals WHERE key = ?", (key,)).fetchone()
+    finally:
+        conn.close()
+    record_cache("game", row is not None)
+    if row is None:
+        return GameEvals.empty(key, positions)
+    payload = json.loads(row["payload"])
+    entry = GameEvals(key, payload["cp"], payload["best"], payload["shallow"], stored=True)
+    entry._grow(positions)
+    return entry
+
+
+def save(entry: GameEvals) -> None:
+    if not GAME_CACHE_ENABLED or not entry.dirty:
+        return
+    payload = json.dumps({"cp": entry.cp, "best": entry.best, "shallow": entry.shallow}, separators=(",", ":"))
+    conn = get_conn()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO game_evals(key, positions, payload) VALUES(?,?,?)",
+            (entry.key, len(entry.cp), payload),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    entry.dirty = False
+    entry.stored = True
@@ -3,12 +3,17 @@ from __future__ import annotations
 import hashlib
 import os
 import threading
-from typing import Dict, List, Optional
+import time
+from dataclasses import replace
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional
 
 import chess
 import chess.engine
 
+from services.cache_backend import get_cache
+from services.engine_service import SearchBudget, reached_depth, search
 from services.feedback import generate_live_explanation
+from services.metrics import record_cache
 from services.profiling import (
     BLUNDER_CPL,
     INACCURACY_CPL,
@@ -18,14 +23,29 @@ from services.profiling import (
     classify_phase,
 )
 
-_DEEP_CACHE: Dict[str, Dict] = {}
-_DEEP_CACHE_LOCK = threading.Lock()
-_EXPLAIN_CACHE: Dict[str, Dict] = {}
-_EXPLAIN_CACHE_LOCK = threading.Lock()
+# ---------- Config ----------
+STREAM_FIRST_DEPTH = 4       # first streamed stage; arrives in milliseconds
+STREAM_DEPTH_STEP = 2
+STREAM_DEADLINE_S = float(os.getenv("STREAM_DEADLINE_S", "10.0"))
 
+# Namespaces in the shared cache backend (memory or SQLite, see cache_backend).
+DEEP_CACHE = "deep"
+EXPLAIN_CACHE = "explain"
+EVAL_CACHE = "eval"
+SUGGEST_CACHE = "suggest"
+HEATMAP_CACHE = "heatmap"
 
-def _cache_key(username: str, fen: str, move_uci: str, depth: int, pv_len: int) -> str:
-    raw = f"{username}|{move_uci}|{fen}|{depth}|{pv_len}"
+SUGGEST_TOP_K = 5            # suggested moves per graded move (the prefetcher fills the same entry)
+HEATMAP_LINE_LEN = 4         # SAN plies of each move's line in the heatmap
+
+
+def _cache_key(username: str, fen: str, move_uci: str, depth: int, pv_len: int, mode: str) -> str:
+    raw = f"{username}|{move_uci}|{fen}|{depth}|{pv_len}|{mode}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _position_key(fen: str, depth: int, mode: str, top_k: int = 1) -> str:
+    raw = f"{fen}|{depth}|{mode}|{top_k}"
     return hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
 
@@ -35,9 +55,38 @@ def _score_from_info(info: Dict) -> Optional[int]:
     return int(cp) if cp is not None else None
 
 
-def _score_cp(engine: chess.engine.SimpleEngine, board: chess.Board, depth: int) -> Optional[int]:
-    info = engine.analyse(board, chess.engine.Limit(depth=depth))
-    return _score_from_info(info)
+def cached_eval(fen: str, depth: int, mode: str, record: bool = True) -> Optional[int]:
+    cp = get_cache().get(EVAL_CACHE, _position_key(fen, depth, mode))
+    if record:
+        record_cache("eval", cp is not None)
+    return cp
+
+
+def store_eval(fen: str, depth: int, mode: str, cp: Optional[int]) -> None:
+    if cp is None:
+        return
+    get_cache().set(EVAL_CACHE, _position_key(fen, depth, mode), cp)
+
+
+def cached_suggestions(fen: str, depth: int, mode: str, top_k: int, record: bool = True) -> Optional[List[str]]:
+    moves = get_cache().get(SUGGEST_CACHE, _position_key(fen, depth, mode, top_k))
+    if record:
+        record_cache("suggest", moves is not None)
+    return moves
+
+
+def store_suggestions(fen: str, depth: int, mode: str, top_k: int, moves: List[str]) -> None:
+    get_cache().set(SUGGEST_CACHE, _position_key(fen, depth, mode, top_k), moves)
+
+
+def _search_eval(engine: chess.engine.SimpleEngine, board: chess.Board, budget: SearchBudget) -> Optional[int]:
+    """Search ``board`` and cache its eval; callers look in cached_eval() first."""
+    info = search(engine, board, budget)
+    cp = _score_from_info(info)
+    reached = reached_depth(info, budget)
+    if reached:
+        store_eval(board.fen(), reached, budget.mode, cp)
+    return cp
 
 
 def _label_for_cpl(cpl: float) -> str:
@@ -50,6 +99,95 @@ def _label_for_cpl(cpl: float) -> str:
     return "good"
 
 
+def _move_cpl(best: int, cp: int) -> float:
+    """CPL of a move scored ``cp`` where the best move scores ``best`` (both side-to-move POV)."""
+    if best >= MATE_SCORE_ABS and cp >= MATE_SCORE_ABS:
+        return 0  # still mating, just not the fastest way
+    if abs(best) >= MATE_SCORE_ABS or abs(cp) >= MATE_SCORE_ABS:
+        return 0 if cp >= best else MAX_CPL_PER_MOVE
+    return min(max(0, best - cp), MAX_CPL_PER_MOVE)
+
+
+def move_heatmap(
+    *,
+    session: Callable[[], ContextManager[chess.engine.SimpleEngine]],
+    fen: str,
+    depth: int = 10,
+    top_n: Optional[int] = None,
+    budget: Optional[SearchBudget] = None,
+) -> Dict:
+    """
+    CPL and label for every legal move (or the best ``top_n``) from one
+    multipv search over the position, best first. Cached per position,
+    depth, mode and width; a cached full table also answers top-N requests,
+    so only a table with every line at the full depth is cached. ``session``
+    is entered only on a miss.
+    """
+    # The stability stop only watches the first line; the others must
+    # reach the depth too, so only the deadline may cut this search.
+    budget = replace(budget or SearchBudget.live(depth), min_depth=depth)
+    board = chess.Board(fen)
+    fen = board.fen()
+    legal = board.legal_moves.count()
+    width = min(top_n, legal) if top_n else legal
+
+    cache = get_cache()
+    table = cache.get(HEATMAP_CACHE, _position_key(fen, depth, budget.mode, width))
+    if table is None and width < legal:
+        full = cache.get(HEATMAP_CACHE, _position_key(fen, depth, budget.mode, legal))
+        if full is not None:
+            table = {**full, "moves": full["moves"][:width], "evaluated": min(width, full["evaluated"])}
+    record_cache("heatmap", table is not None)
+    if table is not None:
+        return {**table, "cached": True}
+
+    moves: List[Dict] = []
+    best_cp: Optional[int] = None
+    reached = depth
+    if width:
+        with session() as engine:
+            infos = search(engine, board, budget, multipv=width)
+        reached = reached_depth(infos, budget)
+        for info in infos if isinstance(infos, list) else [infos]:
+            pv = info.get("pv")
+            if not pv or pv[0] in (m["move"] for m in moves):
+                continue
+            cp = info["score"].pov(board.turn).score(mate_score=100000)
+            if cp is None:
+                continue
+            moves.append({"move": pv[0], "cp": int(cp), "pv": pv})
+        moves.sort(key=lambda m: -m["cp"])
+        if moves:
+            best_cp = moves[0]["cp"]
+            if reached:
+                store_eval(fen, reached, budget.mode, best_cp if board.turn == chess.WHITE else -best_cp)
+
+    rows = []
+    for rank, entry in enumerate(moves, start=1):
+        cpl = _move_cpl(best_cp, entry["cp"])
+        rows.append({
+            "rank": rank,
+            "uci": entry["move"].uci(),
+            "san": board.san(entry["move"]),
+            "cp": entry["cp"],
+            "cpl": round(cpl, 2),
+            "label": _label_for_cpl(cpl),
+            "line": _pv_to_san(board.copy(), entry["pv"], HEATMAP_LINE_LEN),
+        })
+    table = {
+        "fen": fen,
+        "depth": reached,
+        "mode": budget.mode,
+        "legal_moves": legal,
+        "evaluated": len(rows),
+        "best_move": rows[0]["uci"] if rows else None,
+        "moves": rows,
+    }
+    if len(rows) == width and reached == depth:
+        cache.set(HEATMAP_CACHE, _position_key(fen, depth, budget.mode, width), table)
+    return {**table, "cached": False}
+
+
 def _profile_path(username: str) -> str:
     return os.path.join("data", "profiles", f"{username}.json")
 
@@ -63,14 +201,24 @@ def _load_profile(username: str) -> Optional[Dict]:
         return json.load(f)
 
 
-def _suggested_good_moves(
+def _search_suggestions(
     engine: chess.engine.SimpleEngine,
-    fen: str,
-    depth: int = 10,
-    top_k: int = 5,
+    board: chess.Board,
+    top_k: int,
+    budget: SearchBudget,
 ) -> List[str]:
-    board = chess.Board(fen)
-    infos = engine.analyse(board, chess.engine.Limit(depth=depth), multipv=top_k)
+    """Search ``board`` for its ``top_k`` moves and cache them; callers look in cached_suggestions() first."""
+    infos = search(engine, board, budget, multipv=top_k)
+    moves = moves_from_infos(infos, top_k)
+    reached = reached_depth(infos, budget)
+    # A search cut short may be missing lines as well as depth.
+    if reached and len(moves) == min(top_k, board.legal_moves.count()):
+        store_suggestions(board.fen(), reached, budget.mode, top_k, moves)
+    return moves
+
+
+def moves_from_infos(infos, top_k: int) -> List[str]:
+    """Return the distinct first moves of multipv infos, best first."""
     if isinstance(infos, dict):
         infos = [infos]
     moves = []
@@ -97,12 +245,20 @@ def _pv_to_san(board: chess.Board, pv: List[chess.Move], max_len: int) -> List[s
 
 def analyze_move(
     *,
-    engine: chess.engine.SimpleEngine,
+    session: Callable[[], ContextManager[chess.engine.SimpleEngine]],
     fen: str,
     move_uci: str,
     username: str,
     depth: int = 10,
+    budget: Optional[SearchBudget] = None,
 ) -> Dict:
+    """
+    Grade one move. The evals on either side of it and the suggested moves
+    are looked up first (the prefetcher fills them while the player
+    thinks); ``session`` is entered only if one of them is missing, so a
+    fully cached move does not wait for the engine.
+    """
+    budget = budget or SearchBudget.live(depth)
     board_before = chess.Board(fen)
     try:
         move = chess.Move.from_uci(move_uci)
@@ -113,16 +269,25 @@ def analyze_move(
         raise ValueError("Illegal move for this position")
 
     fullmove_before = board_before.fullmove_number
-    before_cp = _score_cp(engine, board_before, depth)
-    if before_cp is None:
-        raise RuntimeError("Stockfish evaluation failed (before)")
-
     player_color = board_before.turn
     board_after = board_before.copy()
     board_after.push(move)
-    after_cp = _score_cp(engine, board_after, depth)
-    if after_cp is None:
-        raise RuntimeError("Stockfish evaluation failed (after)")
+
+    before_cp = cached_eval(board_before.fen(), depth, budget.mode)
+    after_cp = cached_eval(board_after.fen(), depth, budget.mode)
+    suggested_good_moves = cached_suggestions(board_before.fen(), depth, budget.mode, SUGGEST_TOP_K)
+    if before_cp is None or after_cp is None or suggested_good_moves is None:
+        with session() as engine:
+            if before_cp is None:
+                before_cp = _search_eval(engine, board_before, budget)
+                if before_cp is None:
+                    raise RuntimeError("Stockfish evaluation failed (before)")
+            if after_cp is None:
+                after_cp = _search_eval(engine, board_after, budget)
+                if after_cp is None:
+                    raise RuntimeError("Stockfish evaluation failed (after)")
+            if suggested_good_moves is None:
+                suggested_good_moves = _search_suggestions(engine, board_before, SUGGEST_TOP_K, budget)
 
     before = before_cp if player_color == chess.WHITE else -before_cp
     after = after_cp if player_color == chess.WHITE else -after_cp
@@ -145,8 +310,6 @@ def analyze_move(
         if weak_phase == phase and label in {"mistake", "blunder"}:
             matches_profile_weakness = True
 
-    suggested_good_moves = _suggested_good_moves(engine, fen, depth=depth, top_k=5)
-
     feedback = None
     if label in {"mistake", "blunder"}:
         feedback = "This move worsens your position. Focus on safety, development, and solid plans."
@@ -163,36 +326,32 @@ def analyze_move(
     }
 
 
-def analyze_move_deep(
-    *,
-    engine: chess.engine.SimpleEngine,
-    fen: str,
-    move_uci: str,
-    username: str,
-    depth: int = 14,
-    pv_len: int = 8,
-    use_cache: bool = True,
-) -> Dict:
-    cache_key = _cache_key(username, fen, move_uci, depth, pv_len)
-    if use_cache:
-        with _DEEP_CACHE_LOCK:
-            cached = _DEEP_CACHE.get(cache_key)
-        if cached:
-            return cached
-
-    board_before = chess.Board(fen)
+def _legal_move(board: chess.Board, move_uci: str) -> chess.Move:
     try:
         move = chess.Move.from_uci(move_uci)
     except ValueError:
         raise ValueError("Invalid UCI move")
-
-    if move not in board_before.legal_moves:
+    if move not in board.legal_moves:
         raise ValueError("Illegal move for this position")
+    return move
+
 
+def _deep_result(
+    username: str,
+    board_before: chess.Board,
+    move: chess.Move,
+    best_info,
+    played_info,
+    depth: int,
+    pv_len: int,
+    mode: str,
+) -> Dict:
+    """Deep-analysis payload from the searches of the position before and after ``move``."""
     player_color = board_before.turn
     fullmove_before = board_before.fullmove_number
+    board_after = board_before.copy()
+    board_after.push(move)
 
-    best_info = engine.analyse(board_before, chess.engine.Limit(depth=depth), multipv=1)
     if isinstance(best_info, list):
         best_info = best_info[0] if best_info else {}
     best_pv = best_info.get("pv") or []
@@ -200,9 +359,6 @@ def analyze_move_deep(
     if best_eval_white is None:
         raise RuntimeError("Stockfish evaluation failed (best)")
 
-    board_after = board_before.copy()
-    board_after.push(move)
-    played_info = engine.analyse(board_after, chess.engine.Limit(depth=depth), multipv=1)
     if isinstance(played_info, list):
         played_info = played_info[0] if played_info else {}
     played_pv = played_info.get("pv") or []
@@ -241,7 +397,7 @@ def analyze_move_deep(
     eval_played = after
     eval_delta = eval_best - eval_played
 
-    result = {
+    return {
         "cpl": round(cpl, 2),
         "label": label,
         "phase": phase,
@@ -253,15 +409,141 @@ def analyze_move_deep(
         "eval_played": int(eval_played),
         "eval_delta": int(eval_delta),
         "depth": depth,
+        "eval_mode": mode,
     }
 
+
+def analyze_move_deep(
+    *,
+    engine: chess.engine.SimpleEngine,
+    fen: str,
+    move_uci: str,
+    username: str,
+    depth: int = 14,
+    pv_len: int = 8,
+    use_cache: bool = True,
+    budget: Optional[SearchBudget] = None,
+) -> Dict:
+    budget = budget or SearchBudget.live(depth)
+    cache_key = _cache_key(username, fen, move_uci, depth, pv_len, budget.mode)
     if use_cache:
-        with _DEEP_CACHE_LOCK:
-            _DEEP_CACHE[cache_key] = result
+        cached = get_cache().get(DEEP_CACHE, cache_key)
+        record_cache("deep", bool(cached))
+        if cached:
+            return cached
+
+    board_before = chess.Board(fen)
+    move = _legal_move(board_before, move_uci)
+
+    board_after = board_before.copy()
+    board_after.push(move)
+    best_info = search(engine, board_before, budget, multipv=1)
+    played_info = search(engine, board_after, budget, multipv=1)
+    # Labelled and cached at the depth both searches actually reached,
+    # which the deadline can leave below ``depth``.
+    reached = min(reached_depth(best_info, budget), reached_depth(played_info, budget))
+    result = _deep_result(username, board_before, move, best_info, played_info, reached, pv_len, budget.mode)
+
+    if use_cache and reached:
+        get_cache().set(DEEP_CACHE, _cache_key(username, fen, move_uci, reached, pv_len, budget.mode), result)
 
     return result
 
 
+def stream_depths(depth: int, mode: str) -> List[int]:
+    """Depths the stream reports at; fixed-node searches have only one stage."""
+    if mode != "adaptive":
+        return [depth]
+    first = min(STREAM_FIRST_DEPTH, depth)
+    return list(range(first, depth, STREAM_DEPTH_STEP)) + [depth]
+
+
+def stream_move_deep(
+    *,
+    session: Callable[[], ContextManager[chess.engine.SimpleEngine]],
+    fen: str,
+    move_uci: str,
+    username: str,
+    depth: int = 14,
+    pv_len: int = 8,
+    cancel: Optional[threading.Event] = None,
+) -> Iterator[Dict]:
+    """
+    Progressive version of analyze_move_deep(): yields the full deep-analysis
+    payload once per stage of stream_depths(), shallow first, with "final"
+    set on the last one. Each stage holds the engine only for its own two
+    searches and is cached under its depth, so /move/deep at that depth (or
+    a reconnecting client) gets it without searching; a stage whose search
+    stopped below its depth is sent with "partial" set and not cached. The
+    STREAM_DEADLINE_S clock starts once the engine is first held, and the
+    stage that runs past it is the final one. Setting ``cancel``
+    stops the running search and ends the stream without a partial stage.
+    """
+    started = time.perf_counter()
+    board_before = chess.Board(fen)
+    move = _legal_move(board_before, move_uci)
+    board_after = board_before.copy()
+    board_after.push(move)
+
+    mode = SearchBudget(depth=depth).mode
+    cached = get_cache().get(DEEP_CACHE, _cache_key(username, fen, move_uci, depth, pv_len, mode))
+    if cached:
+        # Already analysed to full depth: answer in one message.
+        record_cache("stream", True)
+        yield {**cached, "final": True, "cached": True, "elapsed_ms": _elapsed_ms(started)}
+        return
+
+    deadline: Optional[float] = None   # set once the engine is first held
+    depths = stream_depths(depth, mode)
+    for stage_depth in depths:
+        if cancel is not None and cancel.is_set():
+            return
+        # The stages already step through depths, so no stability stop.
+        budget = SearchBudget(
+            depth=stage_depth, deadline=deadline, min_depth=stage_depth, site="stream", cancel=cancel
+        )
+        cache_key = _cache_key(username, fen, move_uci, stage_depth, pv_len, budget.mode)
+        result = get_cache().get(DEEP_CACHE, cache_key)
+        hit = result is not None
+        record_cache("stream", hit)
+        partial = False
+        if not hit:
+            with session() as engine:
+                if deadline is None:
+                    deadline = budget.deadline = time.monotonic() + STREAM_DEADLINE_S
+                best_info = search(engine, board_before, budget)
+                played_info = search(engine, board_after, budget)
+            if cancel is not None and cancel.is_set():
+                return
+            reached = min(reached_depth(best_info, budget), reached_depth(played_info, budget))
+            partial = reached < stage_depth
+            result = _deep_result(
+                username, board_before, move, best_info, played_info, reached, pv_len, budget.mode
+            )
+            if reached:
+                store_eval(board_before.fen(), reached, budget.mode, _score_from_info(best_info))
+                store_eval(board_after.fen(), reached, budget.mode, _score_from_info(played_info))
+            if not partial:
+                # A stage stopped short (deadline, stability) must not answer
+                # later requests for its full depth.
+                get_cache().set(DEEP_CACHE, cache_key, result)
+        # Once the deadline has passed, later stages would only be shallower.
+        final = stage_depth == depth or (deadline is not None and time.monotonic() >= deadline)
+        yield {
+            **result,
+            "final": final,
+            "partial": partial,
+            "cached": hit,
+            "elapsed_ms": _elapsed_ms(started),
+        }
+        if final:
+            return
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000.0, 1)
+
+
 def explain_move(
     *,
     engine: chess.engine.SimpleEngine,
@@ -270,10 +552,12 @@ def explain_move(
     username: str,
     depth: int = 14,
     pv_len: int = 8,
+    budget: Optional[SearchBudget] = None,
 ) -> Dict:
-    cache_key = _cache_key(username, fen, move_uci, depth, pv_len)
-    with _EXPLAIN_CACHE_LOCK:
-        cached = _EXPLAIN_CACHE.get(cache_key)
+    budget = budget or SearchBudget.live(depth)
+    cache_key = _cache_key(username, fen, move_uci, depth, pv_len, budget.mode)
+    cached = get_cache().get(EXPLAIN_CACHE, cache_key)
+    record_cache("explain", bool(cached))
     if cached:
         return cached
 
@@ -285,6 +569,7 @@ def explain_move(
         depth=depth,
         pv_len=pv_len,
         use_cache=True,
+        budget=budget,
     )
     profile = _load_profile(username) or {}
     explanation = generate_live_explanation(profile, analysis, fen, move_uci)
@@ -294,7 +579,8 @@ def explain_move(
         "explanation": explanation,
     }
 
-    with _EXPLAIN_CACHE_LOCK:
-        _EXPLAIN_CACHE[cache_key] = payload
+    if analysis["depth"]:
+        reached_key = _cache_key(username, fen, move_uci, analysis["depth"], pv_len, budget.mode)
+        get_cache().set(EXPLAIN_CACHE, reached_key, payload)
 
     return payload
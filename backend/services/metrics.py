@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Prometheus text exposition without the client library: a handful of
+# counters and fixed-bucket histograms, each guarded by its own lock so the
+# hot path costs one dict lookup and one increment.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+NODE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+_REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Sample lines for the exposition, without the HELP/TYPE header."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[key] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(c), s[0])) for key, (c, s) in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    out: List[str] = []
+    for metric in _REGISTRY:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.render())
+    return "\n".join(out) + "\n"
+
+
+# ---------- Application metrics ----------
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status")
+)
+ENGINE_SEARCH_SECONDS = Histogram(
+    "engine_search_duration_seconds", "Wall time of one engine search by call site.", ("site",)
+)
+ENGINE_SEARCH_NODES = Histogram(
+    "engine_search_nodes", "Nodes searched per engine call by call site.", ("site",), buckets=NODE_BUCKETS
+)
+ENGINE_SEARCHES_AVOIDED = Counter(
+    "engine_searches_avoided_total", "Searches skipped or shortened before reaching the engine.", ("site", "reason")
+)
+ENGINE_QUEUE_WAIT_SECONDS = Histogram(
+    "engine_queue_wait_seconds", "Time spent waiting for the engine lock.", ("engine",)
+)
+ENGINE_RESTARTS = Counter("engine_restarts_total", "Supervisor engine restarts.", ("engine", "reason"))
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
+GEMINI_REQUEST_SECONDS = Histogram("gemini_request_duration_seconds", "Gemini API call latency.", ("kind",))
+GEMINI_FAILURES = Counter("gemini_failures_total", "Gemini calls that fell back to the canned message.", ("kind", "reason"))
+PGN_PARSE_SECONDS = Histogram("pgn_parse_duration_seconds", "Time to parse one PGN game.", ("site",))
+MODEL_BATCH_SIZE = Histogram(
+    "model_batch_size", "Positions per move-model forward pass.", ("source",), buckets=BATCH_BUCKETS
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds", "Time a request waited in an engine admission pool.", ("pool", "route_class")
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total", "Requests shed by engine admission control.", ("pool", "route_class", "reason")
+)
+MODEL_INFERENCE_SECONDS = Histogram("model_inference_duration_seconds", "Move-model forward pass latency.", ("source",))
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class RequestMetricsMiddleware:
+    """Plain ASGI middleware (no extra task per request) timing every HTTP call."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template, not raw path, to keep cardinality bounded.
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status[0]),
+            )
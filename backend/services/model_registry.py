@@ -0,0 +1,183 @@
+"""
+Per-user move-model registry.
+
+Checkpoints are loaded on first use and kept in an LRU bounded by
+MODEL_MEMORY_BUDGET_MB. Adapter checkpoints share one base model, which is
+loaded once and counted once; only the per-user adapter bytes count against
+each entry.
+
+Reads never wait on a load. A hit is a dict lookup plus an mtime check at
+most every RELOAD_CHECK_S. When a retrain replaces a checkpoint, one caller
+loads the new weights while concurrent callers keep getting the previous
+model, and the entry is swapped in a single assignment once it is ready.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from torch import nn
+
+from services import move_model
+
+# ---------- Config ----------
+MEMORY_BUDGET_BYTES = int(float(os.getenv("MODEL_MEMORY_BUDGET_MB", "256")) * 1024 * 1024)
+RELOAD_CHECK_S = float(os.getenv("MODEL_RELOAD_CHECK_S", "1.0"))
+
+
+@dataclass
+class _Entry:
+    model: nn.Module
+    mtime: float
+    nbytes: int
+    checked: float
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        models_dir: str = move_model.MODELS_DIR,
+        memory_budget: int = MEMORY_BUDGET_BYTES,
+        check_interval: float = RELOAD_CHECK_S,
+    ):
+        self.models_dir = models_dir
+        self.memory_budget = memory_budget
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._base: Optional[_Entry] = None
+        self._lock = threading.Lock()               # guards LRU order and accounting
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._bytes = 0
+        self.counters = {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0, "stale_adapters": 0}
+
+    # ---------- public ----------
+    def get(self, user_id: str) -> Optional[nn.Module]:
+        entry = self._entries.get(user_id)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked < self.check_interval:
+            self._touch(user_id)
+            return entry.model
+
+        path = move_model.checkpoint_path(user_id, self.models_dir)
+        mtime = _mtime(path)
+        if mtime is None:
+            self._drop(user_id)
+            return None
+        if entry is not None and entry.mtime == mtime and not self._base_changed(entry):
+            entry.checked = now
+            self._touch(user_id)
+            return entry.model
+        return self._load(user_id, path, mtime, entry)
+
+    def evict(self, user_id: str) -> None:
+        self._drop(user_id)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "models": len(self._entries),
+                "bytes": self._bytes,
+                "budget_bytes": self.memory_budget,
+                "base_loaded": self._base is not None,
+                "base_bytes": self._base.nbytes if self._base else 0,
+                **self.counters,
+            }
+
+    # ---------- internals ----------
+    def _touch(self, user_id: str) -> None:
+        with self._lock:
+            if user_id in self._entries:
+                self._entries.move_to_end(user_id)
+                self.counters["hits"] += 1
+
+    def _drop(self, user_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    def _base_changed(self, entry: _Entry) -> bool:
+        base = getattr(entry.model, "base", None)
+        return base is not None and self._get_base() is not base
+
+    def _get_base(self) -> Optional[move_model.MovePolicyNet]:
+        path = move_model.base_checkpoint_path(self.models_dir)
+        now = time.monotonic()
+        base = self._base
+        if base is not None and now - base.checked < self.check_interval:
+            return base.model
+        mtime = _mtime(path)
+        if mtime is None:
+            self._base = None
+            return None
+        if base is not None and base.mtime == mtime:
+            base.checked = now
+            return base.model
+        with self._lock:
+            load_lock = self._load_locks.setdefault("\0base", threading.Lock())
+        with load_lock:
+            if self._base is not None and self._base.mtime == mtime:
+                return self._base.model
+            model = move_model.load_base_model(self.models_dir)
+            if model is None:
+                return None
+            self._base = _Entry(model, mtime, move_model.parameter_bytes(model), time.monotonic())
+            return model
+
+    def _load(self, user_id: str, path: str, mtime: float, stale: Optional[_Entry]) -> Optional[nn.Module]:
+        with self._lock:
+            load_lock = self._load_locks.setdefault(user_id, threading.Lock())
+        if not load_lock.acquire(blocking=stale is None):
+            # Someone else is loading the new checkpoint; serve the old one meanwhile.
+            return stale.model
+        try:
+            current = self._entries.get(user_id)
+            if current is not None and current.mtime == mtime and not self._base_changed(current):
+                return current.model
+
+            payload = move_model.read_checkpoint(path)
+            if payload is None:
+                self._drop(user_id)
+                return None
+            base = self._get_base() if payload.get("kind") == "adapter" else None
+            model = move_model.model_from_payload(payload, base)
+            if model is None:
+                # Adapter trained against a different base: unusable until retrained.
+                self.counters["stale_adapters"] += 1
+                self._drop(user_id)
+                return None
+
+            nbytes = move_model.parameter_bytes(getattr(model, "adapter", model))
+            entry = _Entry(model, mtime, nbytes, time.monotonic())
+            with self._lock:
+                old = self._entries.pop(user_id, None)
+                if old is not None:
+                    self._bytes -= old.nbytes
+                self._entries[user_id] = entry
+                self._bytes += nbytes
+                self.counters["reloads" if old is not None else "loads"] += 1
+                self._evict_locked(keep=user_id)
+            return model
+        finally:
+            load_lock.release()
+
+    def _evict_locked(self, keep: str) -> None:
+        while self._bytes > self.memory_budget and len(self._entries) > 1:
+            user_id = next(iter(self._entries))
+            if user_id == keep:
+                self._entries.move_to_end(user_id)
+                continue
+            entry = self._entries.pop(user_id)
+            self._bytes -= entry.nbytes
+            self.counters["evictions"] += 1
@@ -0,0 +1,174 @@
+"""
+Streaming training-set builder for the move model.
+
+Walks a PGN archive one game at a time and writes the user's positions as
+fixed-size shards, so memory stays bounded by the shard size rather than the
+archive. Each shard is a group of plain .npy files that training opens with
+mmap_mode="r":
+
+  shard-00000.planes.npy  uint8  (N, PACKED_SIZE)  bit-packed planes
+  shard-00000.moves.npy   int16  (N,)              policy index of the move played
+  shard-00000.color.npy   int8   (N,)              1 if the user was white
+  shard-00000.phase.npy   int8   (N,)              index into PHASES
+
+Bit-packing the planes (144 bytes per position instead of 4.6 KB of float32)
+is the compression; it keeps the files memory-mappable, which .npz is not.
+A manifest.json lists the shards and their sizes. The directory is
+versioned (services.versioned_dir); readers take the logical path.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import chess
+import chess.pgn
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from services import versioned_dir
+from services.versioned_dir import safe_child
+from services.board_encoding import PACKED_SIZE, encode_boards_packed, move_index, unpack_planes
+from services.profiling import classify_phase, side_from_username
+
+# ---------- Config ----------
+DATASETS_DIR = "data/datasets"
+SHARD_SIZE = 65536
+ENCODE_BATCH = 2048
+PHASES = ("opening", "middlegame", "endgame")
+MANIFEST = "manifest.json"
+FIELDS = ("planes", "moves", "color", "phase")
+
+
+def dataset_dir(user_id: str, datasets_dir: str = DATASETS_DIR) -> str:
+    return safe_child(datasets_dir, user_id)
+
+
+class _ShardWriter:
+    def __init__(self, out_dir: str, shard_size: int):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.shards: List[Dict[str, object]] = []
+        self._planes: List[np.ndarray] = []
+        self._moves: List[int] = []
+        self._color: List[int] = []
+        self._phase: List[int] = []
+        self._pending: List[chess.Board] = []
+        self._buffered = 0
+
+    def add(self, board: chess.Board, move: chess.Move, ply_index: int) -> None:
+        self._pending.append(board.copy(stack=False))
+        self._moves.append(move_index(move, board.turn))
+        self._color.append(1 if board.turn == chess.WHITE else 0)
+        self._phase.append(PHASES.index(classify_phase(board, ply_index)))
+        if len(self._pending) >= ENCODE_BATCH:
+            self._encode_pending()
+        if len(self._moves) >= self.shard_size:
+            self.flush()
+
+    def _encode_pending(self) -> None:
+        if self._pending:
+            self._planes.append(encode_boards_packed(self._pending))
+            self._pending = []
+
+    def flush(self) -> None:
+        self._encode_pending()
+        if not self._moves:
+            return
+        name = f"shard-{len(self.shards):05d}"
+        arrays = {
+            "planes": np.concatenate(self._planes),
+            "moves": np.asarray(self._moves, dtype=np.int16),
+            "color": np.asarray(self._color, dtype=np.int8),
+            "phase": np.asarray(self._phase, dtype=np.int8),
+        }
+        for field, array in arrays.items():
+            np.save(os.path.join(self.out_dir, f"{name}.{field}.npy"), array)
+        self.shards.append({"name": name, "positions": len(self._moves)})
+        self._planes, self._moves, self._color, self._phase = [], [], [], []
+
+
+def build_shards(
+    pgn_path: str,
+    username: str,
+    out_dir: str,
+    max_games: Optional[int] = None,
+    shard_size: int = SHARD_SIZE,
+) -> Dict[str, object]:
+    """Encode every position where ``username`` was to move, with the move they played."""
+    started = time.perf_counter()
+    tmp_dir = versioned_dir.new_version(out_dir)
+
+    writer = _ShardWriter(tmp_dir, shard_size)
+    games = 0
+    with open(pgn_path, "r", encoding="utf-8", errors="ignore") as f:
+        while max_games is None or games < max_games:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            side = side_from_username(game, username)
+            if side is None:
+                continue
+            games += 1
+            board = game.board()
+            for ply_index, move in enumerate(game.mainline_moves(), start=1):
+                if board.turn == side:
+                    writer.add(board, move, ply_index)
+                board.push(move)
+    writer.flush()
+
+    manifest = {
+        "username": username,
+        "source": os.path.basename(pgn_path),
+        "games": games,
+        "positions": sum(s["positions"] for s in writer.shards),
+        "packed_size": PACKED_SIZE,
+        "phases": list(PHASES),
+        "shards": writer.shards,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Switch to the finished version so readers never see half a dataset.
+    versioned_dir.publish(out_dir, tmp_dir, MANIFEST)
+    return manifest
+
+
+def load_manifest(data_dir: str) -> Optional[Dict[str, object]]:
+    path = os.path.join(versioned_dir.resolve(data_dir), MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ShardDataset(Dataset):
+    """Memory-mapped view over a shard directory; yields (planes, move index)."""
+
+    def __init__(self, data_dir: str):
+        data_dir = versioned_dir.resolve(data_dir)
+        manifest = load_manifest(data_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"No dataset manifest in {data_dir}")
+        self.manifest = manifest
+        self.shards = [
+            {field: np.load(os.path.join(data_dir, f"{s['name']}.{field}.npy"), mmap_mode="r") for field in FIELDS}
+            for s in manifest["shards"]
+        ]
+        self.offsets = np.cumsum([0] + [s["positions"] for s in manifest["shards"]])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def _locate(self, index: int):
+        shard = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return self.shards[shard], index - int(self.offsets[shard])
+
+    def __getitem__(self, index: int):
+        shard, row = self._locate(index)
+        planes = unpack_planes(shard["planes"][row:row + 1])[0]
+        return torch.from_numpy(planes), int(shard["moves"][row])
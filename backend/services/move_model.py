@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import chess
+import torch
+from torch import nn
+from torch.utils.data import ConcatDataset, DataLoader, Dataset
+
+from services import move_dataset, versioned_dir
+from services.board_encoding import NUM_PLANES, POLICY_SIZE, encode_boards, index_to_move, legal_masks
+
+# ---------- Config ----------
+MODELS_DIR = "saved_models"
+BASE_MODEL_NAME = "base_model.pt"
+ENCODER_VERSION = 1
+CHANNELS = 64
+BLOCKS = 4
+ADAPTER_RANK = 8
+DEFAULT_EPOCHS = 6
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_MAX_GAMES = 500
+LOADER_WORKERS = int(os.getenv("MODEL_LOADER_WORKERS", "0"))
+
+
+# ---------- Model ----------
+def _policy_logits(head: nn.Module, features: torch.Tensor) -> torch.Tensor:
+    logits = head(features)                     # (B, to, 8, 8 from)
+    logits = logits.flatten(2).transpose(1, 2)  # (B, from, to)
+    return logits.reshape(features.shape[0], POLICY_SIZE)
+
+
+class MovePolicyNet(nn.Module):
+    """
+    Small residual conv net. The policy head is a 1x1 conv with 64 output
+    channels: channel t at square f scores the move f -> t, so the head has
+    4k weights instead of a dense 4096-way layer.
+    """
+
+    def __init__(self, channels: int = CHANNELS, blocks: int = BLOCKS):
+        super().__init__()
+        self.version: Optional[int] = None  # set on base models loaded from disk
+        self.stem = nn.Sequential(nn.Conv2d(NUM_PLANES, channels, 3, padding=1), nn.ReLU())
+        self.blocks = nn.ModuleList(
+            nn.Sequential(
+                nn.Conv2d(channels, channels, 3, padding=1),
+                nn.ReLU(),
+                nn.Conv2d(channels, channels, 3, padding=1),
+            )
+            for _ in range(blocks)
+        )
+        self.head = nn.Conv2d(channels, 64, 1)
+
+    def features(self, planes: torch.Tensor) -> torch.Tensor:
+        x = self.stem(planes)
+        for block in self.blocks:
+            x = torch.relu(x + block(x))
+        return x
+
+    def forward(self, planes: torch.Tensor) -> torch.Tensor:
+        return _policy_logits(self.head, self.features(planes))
+
+
+class PolicyAdapter(nn.Module):
+    """
+    Per-user delta on top of a shared base: a low-rank residual over the
+    trunk features plus a private policy head. About 5k parameters, so
+    hundreds of users fit in the memory of one full model.
+    """
+
+    def __init__(self, channels: int = CHANNELS, rank: int = ADAPTER_RANK):
+        super().__init__()
+        self.down = nn.Conv2d(channels, rank, 1, bias=False)
+        self.up = nn.Conv2d(rank, channels, 1, bias=False)
+        self.head = nn.Conv2d(channels, 64, 1)
+        nn.init.zeros_(self.up.weight)
+
+    @classmethod
+    def from_base(cls, base: MovePolicyNet, rank: int = ADAPTER_RANK) -> "PolicyAdapter":
+        adapter = cls(base.head.in_channels, rank)
+        adapter.head.load_state_dict(base.head.state_dict())
+        return adapter
+
+    def forward(self, features: torch.Tensor) -> torch.Tensor:
+        x = features + self.up(torch.relu(self.down(features)))
+        return _policy_logits(self.head, x)
+
+
+class PersonalizedPolicy(nn.Module):
+    """Frozen shared base trunk + one user's adapter."""
+
+    def __init__(self, base: MovePolicyNet, adapter: PolicyAdapter):
+        super().__init__()
+        self.adapter = adapter
+        # Not registered as a submodule: the base is shared and never trained here.
+        self.__dict__["base"] = base
+
+    def forward(self, planes: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            features = self.base.features(planes)
+        return self.adapter(features)
+
+
+def parameter_bytes(module: nn.Module) -> int:
+    return sum(p.numel() * p.element_size() for p in module.parameters())
+
+
+# ---------- Training / checkpoints ----------
+def checkpoint_path(user_id: str, models_dir: str = MODELS_DIR) -> str:
+    return versioned_dir.safe_child(models_dir, f"{user_id}_model.pt")
+
+
+def base_checkpoint_path(models_dir: str = MODELS_DIR) -> str:
+    return os.path.join(models_dir, BASE_MODEL_NAME)
+
+
+def train(
+    dataset: Dataset,
+    epochs: int = DEFAULT_EPOCHS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    seed: int = 0,
+    base: Optional[MovePolicyNet] = None,
+) -> Tuple[nn.Module, Dict[str, float]]:
+    """Train a full model, or only an adapter when a shared ``base`` is given."""
+    torch.manual_seed(seed)
+    if base is None:
+        model: nn.Module = MovePolicyNet()
+        params = model.parameters()
+    else:
+        base.requires_grad_(False).eval()
+        model = PersonalizedPolicy(base, PolicyAdapter.from_base(base))
+        params = model.adapter.parameters()
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=LOADER_WORKERS)
+    optimizer = torch.optim.AdamW(params, lr=2e-3, weight_decay=1e-4)
+    loss_fn = nn.CrossEntropyLoss()
+
+    model.train()
+    loss_value = 0.0
+    correct = seen = 0
+    for _epoch in range(epochs):
+        loss_value, correct, seen = 0.0, 0, 0
+        for batch_planes, batch_targets in loader:
+            optimizer.zero_grad()
+            logits = model(batch_planes)
+            loss = loss_fn(logits, batch_targets)
+            loss.backward()
+            optimizer.step()
+            loss_value += loss.item() * len(batch_targets)
+            correct += (logits.argmax(dim=1) == batch_targets).sum().item()
+            seen += len(batch_targets)
+    model.eval()
+    return model, {
+        "final_loss": round(loss_value / max(1, seen), 4),
+        "train_top1": round(correct / max(1, seen), 4),
+    }
+
+
+def save_checkpoint(model: nn.Module, path: str, meta: Dict[str, object]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if isinstance(model, PersonalizedPolicy):
+        payload = {"kind": "adapter", "state_dict": model.adapter.state_dict(), "base_version": model.base.version}
+    else:
+        payload = {"kind": "full", "state_dict": model.state_dict()}
+    payload.update(encoder_version=ENCODER_VERSION, meta=meta)
+    tmp_path = path + ".tmp"
+    torch.save(payload, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path: str) -> Optional[Dict[str, object]]:
+    if not os.path.exists(path):
+        return None
+    payload = torch.load(path, map_location="cpu", weights_only=True)
+    if payload.get("encoder_version") != ENCODER_VERSION:
+        return None
+    return payload
+
+
+def model_from_payload(payload: Dict[str, object], base: Optional[MovePolicyNet] = None) -> Optional[nn.Module]:
+    """Build a model from a checkpoint payload; adapters need the base they were trained on."""
+    if payload.get("kind", "full") == "adapter":
+        if base is None or payload.get("base_version") != base.version:
+            return None
+        adapter = PolicyAdapter()
+        adapter.load_state_dict(payload["state_dict"])
+        model: nn.Module = PersonalizedPolicy(base, adapter)
+    else:
+        model = MovePolicyNet()
+        model.load_state_dict(payload["state_dict"])
+        model.version = payload.get("meta", {}).get("version")
+    return model.eval()
+
+
+def load_checkpoint(path: str, base: Optional[MovePolicyNet] = None) -> Optional[nn.Module]:
+    payload = read_checkpoint(path)
+    return model_from_payload(payload, base) if payload is not None else None
+
+
+def load_base_model(models_dir: str = MODELS_DIR) -> Optional[MovePolicyNet]:
+    model = load_checkpoint(base_checkpoint_path(models_dir))
+    return model if isinstance(model, MovePolicyNet) else None
+
+
+def train_user_model(
+    user_id: str,
+    pgn_path: str,
+    epochs: int = DEFAULT_EPOCHS,
+    max_games: int = DEFAULT_MAX_GAMES,
+    models_dir: str = MODELS_DIR,
+) -> Dict[str, object]:
+    """Fit an adapter on the shared base when one exists, otherwise a full model."""
+    started = time.perf_counter()
+    data_dir = move_dataset.dataset_dir(user_id)
+    manifest = move_dataset.build_shards(pgn_path, user_id, data_dir, max_games=max_games)
+    if not manifest["positions"]:
+        return {"status": "error", "message": f"No games found for {user_id} in {os.path.basename(pgn_path)}."}
+
+    base = load_base_model(models_dir)
+    model, stats = train(move_dataset.ShardDataset(data_dir), epochs=epochs, base=base)
+    meta = {
+        "user_id": user_id,
+        "games": manifest["games"],
+        "positions": manifest["positions"],
+        "epochs": epochs,
+        "kind": "adapter" if base is not None else "full",
+        **stats,
+    }
+    path = checkpoint_path(user_id, models_dir)
+    save_checkpoint(model, path, meta)
+    return {
+        "status": "success",
+        "message": f"Trained on {manifest['positions']} positions from {manifest['games']} games.",
+        "checkpoint": path,
+        "seconds": round(time.perf_counter() - started, 2),
+        **meta,
+    }
+
+
+def train_base_model(
+    sources: Dict[str, str],
+    epochs: int = DEFAULT_EPOCHS,
+    max_games: int = DEFAULT_MAX_GAMES,
+    models_dir: str = MODELS_DIR,
+) -> Dict[str, object]:
+    """Train the shared base on every user's archive ({username: pgn_path})."""
+    started = time.perf_counter()
+    datasets = []
+    for username, pgn_path in sources.items():
+        data_dir = move_dataset.dataset_dir(username)
+        if move_dataset.build_shards(pgn_path, username, data_dir, max_games=max_games)["positions"]:
+            datasets.append(move_dataset.ShardDataset(data_dir))
+    if not datasets:
+        return {"status": "error", "message": "No training positions found."}
+
+    model, stats = train(ConcatDataset(datasets), epochs=epochs)
+    # Adapters record this version and refuse to load against a different base.
+    meta = {"version": int(time.time() * 1000), "users": sorted(sources), "epochs": epochs, **stats}
+    model.version = meta["version"]
+    save_checkpoint(model, base_checkpoint_path(models_dir), meta)
+    return {
+        "status": "success",
+        "positions": sum(len(d) for d in datasets),
+        "seconds": round(time.perf_counter() - started, 2),
+        **meta,
+    }
+
+
+# ---------- Inference ----------
+def _decode(boards: Sequence[chess.Board], logits: torch.Tensor, masks: torch.Tensor) -> List[chess.Move]:
+    indices = logits.masked_fill(~masks, float("-inf")).argmax(dim=1).tolist()
+    return [index_to_move(board, index) for board, index in zip(boards, indices)]
+
+
+@torch.inference_mode()
+def predict_moves(model: nn.Module, boards: List[chess.Board]) -> List[Optional[chess.Move]]:
+    """One forward pass for the whole batch; illegal moves are masked out."""
+    return predict_grouped([(model, boards)])[0]
+
+
+@torch.inference_mode()
+def predict_grouped(groups: List[Tuple[nn.Module, List[chess.Board]]]) -> List[List[Optional[chess.Move]]]:
+    """
+    Predict for several (model, boards) groups at once. Personalized models
+    that share a base run the trunk once over all their positions; only the
+    adapters run per user.
+    """
+    results: List[List[Optional[chess.Move]]] = [[None] * len(boards) for _, boards in groups]
+    by_base: Dict[int, List[Tuple[int, List[int]]]] = {}
+    for g, (model, boards) in enumerate(groups):
+        indices = [i for i, board in enumerate(boards) if not board.is_game_over()]
+        if not indices:
+            continue
+        if isinstance(model, PersonalizedPolicy):
+            by_base.setdefault(id(model.base), []).append((g, indices))
+            continue
+        live = [boards[i] for i in indices]
+        logits = model(torch.from_numpy(encode_boards(live)))
+        for i, move in zip(indices, _decode(live, logits, torch.from_numpy(legal_masks(live)))):
+            results[g][i] = move
+
+    for members in by_base.values():
+        base = groups[members[0][0]][0].base
+        live = [groups[g][1][i] for g, indices in members for i in indices]
+        features = base.features(torch.from_numpy(encode_boards(live)))
+        masks = torch.from_numpy(legal_masks(live))
+        offset = 0
+        for g, indices in members:
+            span = slice(offset, offset + len(indices))
+            logits = groups[g][0].adapter(features[span])
+            for i, move in zip(indices, _decode(live[span], logits, masks[span])):
+                results[g][i] = move
+            offset += len(indices)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the shared base move model on every uploaded archive.")
+    parser.add_argument("--uploads", default="data/uploads")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS)
+    parser.add_argument("--max-games", type=int, default=DEFAULT_MAX_GAMES)
+    args = parser.parse_args()
+
+    suffix = "_chesscom.pgn"
+    sources = {
+        name[: -len(suffix)]: os.path.join(args.uploads, name)
+        for name in sorted(os.listdir(args.uploads))
+        if name.endswith(suffix)
+    }
+    print(train_base_model(sources, epochs=args.epochs, max_games=args.max_games))
+
+
+if __name__ == "__main__":
+    main()
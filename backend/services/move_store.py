@@ -0,0 +1,286 @@
+"""
+Columnar store of per-move analysis results.
+
+Every user move walked by the profiler is kept as one row, with enough raw
+data (player-POV evals before and after, flags, phase) to recompute profile
+statistics under different thresholds without touching the engine. A
+second, per-game table holds headers (opening, ECO, date, time control,
+colour) and whether the game counted towards the profile.
+
+Storage follows the dataset shards: one directory per user under
+data/moves/ (versioned, see services.versioned_dir), one .npy per column,
+memory-mapped on load. Categorical
+columns are stored as integer codes with their categories in meta.json.
+String columns that are only needed for proofs (fen, played, best) are
+fixed-width bytes, so they also map straight from disk and are only loaded
+when asked for.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import chess
+import chess.pgn
+import numpy as np
+
+from services import versioned_dir
+
+if TYPE_CHECKING:
+    import pandas as pd  # imported where frames are built, to keep it off the app's import path
+
+# ---------- Config ----------
+MOVES_DIR = os.path.join("data", "moves")
+META = "meta.json"
+STORE_VERSION = 1
+
+MOVE_COLUMNS = {
+    "user": "category",
+    "game_id": np.int32,
+    "ply": np.int16,
+    "move_number": np.int16,
+    "phase": "category",
+    "cp_before": np.float32,     # player POV, NaN when the eval failed
+    "cp_after": np.float32,
+    "cpl": np.float32,           # NaN when the move did not count towards CPL
+    "label": "category",         # good / inaccuracy / mistake / blunder, "" when not counted
+    "eco": "category",
+    "is_capture": np.bool_,
+    "gives_check": np.bool_,
+    "is_castle": np.bool_,
+    "early_queen": np.bool_,
+    "castle_ply": np.int16,      # first castling ply of this game for the user, -1 if none
+    "fen": "bytes",
+    "played": "bytes",
+    "best": "bytes",
+}
+GAME_COLUMNS = {
+    "user": "category",
+    "game_id": np.int32,
+    "counted": np.bool_,         # False when the game was skipped (initial eval failed)
+    "color": "category",
+    "opening": "category",
+    "eco": "category",
+    "date": np.int32,            # yyyymmdd, 0 when unknown
+    "time_control": "category",
+    "result": "category",
+    "site": "bytes",
+}
+
+
+def store_dir(username: str, root: str = MOVES_DIR) -> str:
+    """Directory of the user's current store; ValueError for names that would leave ``root``."""
+    return versioned_dir.resolve(versioned_dir.safe_child(root, username))
+
+
+def game_date(game: chess.pgn.Game) -> int:
+    raw = game.headers.get("UTCDate") or game.headers.get("Date") or ""
+    digits = raw.replace(".", "").replace("-", "")
+    return int(digits) if len(digits) == 8 and digits.isdigit() else 0
+
+
+class MoveRecorder:
+    """Row buffer the profiler appends to while it walks games."""
+
+    def __init__(self, username: str):
+        self.username = username
+        self._moves: Dict[str, List[object]] = {name: [] for name in MOVE_COLUMNS}
+        self._games: Dict[str, List[object]] = {name: [] for name in GAME_COLUMNS}
+        self._game_start = 0
+
+    def start_game(self, game_id: int, game: chess.pgn.Game, color: chess.Color, opening: Optional[str]) -> None:
+        headers = game.headers
+        self._game_start = len(self._moves["game_id"])
+        row = {
+            "user": self.username,
+            "game_id": game_id,
+            "counted": False,
+            "color": "white" if color == chess.WHITE else "black",
+            "opening": opening or "",
+            "eco": headers.get("ECO", ""),
+            "date": game_date(game),
+            "time_control": headers.get("TimeControl", ""),
+            "result": headers.get("Result", ""),
+            "site": headers.get("Link") or headers.get("Site", ""),
+        }
+        for name, value in row.items():
+            self._games[name].append(value)
+
+    def add_move(self, **row: object) -> None:
+        row.setdefault("user", self.username)
+        row.setdefault("eco", self._games["eco"][-1] if self._games["eco"] else "")
+        row.setdefault("castle_ply", -1)
+        for name in MOVE_COLUMNS:
+            self._moves[name].append(row.get(name))
+
+    def finish_game(self, counted: bool) -> None:
+        if not self._games["counted"]:
+            return
+        self._games["counted"][-1] = counted
+        plies = [
+            p for p, castle in zip(self._moves["ply"][self._game_start:], self._moves["is_castle"][self._game_start:])
+            if castle
+        ]
+        castle_ply = min(plies) if plies else -1
+        column = self._moves["castle_ply"]
+        for i in range(self._game_start, len(column)):
+            column[i] = castle_ply
+
+    def frames(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        return _frame(self._moves, MOVE_COLUMNS), _frame(self._games, GAME_COLUMNS)
+
+    def rows(self) -> Dict[str, Dict[str, List[object]]]:
+        """Buffered columns as plain lists (JSON-serialisable), e.g. to ship one game's rows elsewhere."""
+        return {"moves": self._moves, "games": self._games}
+
+    def extend(self, rows: Dict[str, Dict[str, List[object]]]) -> None:
+        """Append rows produced by another recorder's rows()."""
+        for name in MOVE_COLUMNS:
+            self._moves[name].extend(rows["moves"][name])
+        for name in GAME_COLUMNS:
+            self._games[name].extend(rows["games"][name])
+
+
+def _frame(data: Dict[str, List[object]], schema: Dict[str, object]) -> pd.DataFrame:
+    import pandas as pd
+
+    columns = {}
+    for name, kind in schema.items():
+        values = data[name]
+        if kind == "category":
+            columns[name] = pd.Categorical(["" if v is None else v for v in values])
+        elif kind == "bytes":
+            columns[name] = pd.Series(["" if v is None else v for v in values], dtype=object)
+        elif kind is np.float32:
+            columns[name] = np.asarray([np.nan if v is None else v for v in values], dtype=np.float32)
+        else:
+            columns[name] = np.asarray(values, dtype=kind)
+    return pd.DataFrame(columns)
+
+
+# ---------- persistence ----------
+def _write_table(out_dir: str, table: str, frame: pd.DataFrame, schema: Dict[str, object]) -> Dict[str, object]:
+    import pandas as pd
+
+    meta: Dict[str, object] = {"rows": int(len(frame)), "categories": {}, "columns": list(schema)}
+    for name, kind in schema.items():
+        path = os.path.join(out_dir, f"{table}.{name}.npy")
+        if kind == "category":
+            cat = pd.Categorical(frame[name])
+            meta["categories"][name] = [str(c) for c in cat.categories]
+            dtype = np.int16 if len(cat.categories) < 2 ** 15 else np.int32
+            np.save(path, np.asarray(cat.codes, dtype=dtype))
+        elif kind == "bytes":
+            encoded = [str(v).encode("utf-8") for v in frame[name]]
+            width = max((len(v) for v in encoded), default=1) or 1
+            np.save(path, np.asarray(encoded, dtype=f"S{width}"))
+        else:
+            np.save(path, np.asarray(frame[name], dtype=kind))
+    return meta
+
+
+def write_store(
+    username: str,
+    moves: pd.DataFrame,
+    games: pd.DataFrame,
+    root: str = MOVES_DIR,
+    extra: Optional[Dict[str, object]] = None,
+) -> str:
+    """Replace the user's store atomically (write a new version, then switch to it)."""
+    base = versioned_dir.safe_child(root, username)
+    out_dir = versioned_dir.new_version(base)
+    meta = {
+        "version": STORE_VERSION,
+        "username": username,
+        "moves": _write_table(out_dir, "moves", moves, MOVE_COLUMNS),
+        "games": _write_table(out_dir, "games", games, GAME_COLUMNS),
+        **(extra or {}),
+    }
+    with open(os.path.join(out_dir, META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    versioned_dir.publish(base, out_dir, META)
+    return out_dir
+
+
+def load_meta(username: str, root: str = MOVES_DIR) -> Optional[Dict[str, object]]:
+    return read_meta(store_dir(username, root))
+
+
+def read_meta(in_dir: str) -> Optional[Dict[str, object]]:
+    path = os.path.join(in_dir, META)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta if meta.get("version") == STORE_VERSION else None
+
+
+def _read_table(
+    in_dir: str,
+    table: str,
+    meta: Dict[str, object],
+    schema: Dict[str, object],
+    columns: Optional[Iterable[str]],
+) -> pd.DataFrame:
+    import pandas as pd
+
+    wanted = list(columns) if columns is not None else [n for n, k in schema.items() if k != "bytes"]
+    data = {}
+    for name in wanted:
+        array = np.load(os.path.join(in_dir, f"{table}.{name}.npy"), mmap_mode="r")
+        kind = schema[name]
+        if kind == "category":
+            data[name] = pd.Categorical.from_codes(np.asarray(array), categories=meta["categories"][name])
+        elif kind == "bytes":
+            data[name] = np.char.decode(np.asarray(array), "utf-8")
+        else:
+            data[name] = array
+    return pd.DataFrame(data, copy=False)
+
+
+def load_store(
+    username: str,
+    root: str = MOVES_DIR,
+    move_columns: Optional[Iterable[str]] = None,
+    game_columns: Optional[Iterable[str]] = None,
+    in_dir: Optional[str] = None,
+) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    (moves, games) frames for a user, or None if nothing is stored. The byte
+    columns (fen, played, best, site) are skipped unless named explicitly.
+    ``in_dir`` pins a version already resolved with store_dir().
+    """
+    in_dir = in_dir or store_dir(username, root)   # resolved once: meta and columns come from one version
+    meta = read_meta(in_dir)
+    if meta is None:
+        return None
+    return (
+        _read_table(in_dir, "moves", meta["moves"], MOVE_COLUMNS, move_columns),
+        _read_table(in_dir, "games", meta["games"], GAME_COLUMNS, game_columns),
+    )
+
+
+def load_rows(
+    username: str,
+    rows: np.ndarray,
+    columns: Iterable[str],
+    root: str = MOVES_DIR,
+    in_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    """Selected move rows only; used to fetch proof strings for a handful of moves."""
+    import pandas as pd
+
+    in_dir = in_dir or store_dir(username, root)
+    meta = read_meta(in_dir)
+    data = {}
+    for name in columns:
+        array = np.load(os.path.join(in_dir, f"moves.{name}.npy"), mmap_mode="r")[rows]
+        kind = MOVE_COLUMNS[name]
+        if kind == "category":
+            data[name] = pd.Categorical.from_codes(array, categories=meta["moves"]["categories"][name])
+        elif kind == "bytes":
+            data[name] = np.char.decode(array, "utf-8")
+        else:
+            data[name] = array
+    return pd.DataFrame(data)
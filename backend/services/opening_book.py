@@ -0,0 +1,255 @@
+"""
+Opening-book eval table.
+
+Built offline from the local PGN archives: every position in the first
+BOOK_PLIES plies that occurs in at least --min-count games is searched once
+at --depth and stored as
+
+  keys.npy   uint64  polyglot Zobrist hash, sorted
+  cp.npy     int32   score from White's side (0 when mate is set)
+  mate.npy   int16   mate distance from White's side, 0 if none
+  best.npy   uint16  best move: from | to << 6 | promotion << 12, 0xFFFF if none
+  eco.npy    int16   index into meta.json "ecos" (most common ECO of the games)
+
+The files are memory-mapped on first use and engine_service.search()
+probes them before touching the engine; a hit costs one binary search.
+Hits are only used when the book was built in the same search mode and at
+least as deep as the caller asked for, so a book hit is a deeper eval than
+a fresh search at the requested depth would give, never a shallower one.
+Game analysis also takes an opening ply's best move from the book
+(engine_service.best_move_san with a budget).
+
+Build (from backend/):
+  python -m services.opening_book [--plies 16] [--min-count 2] [--depth 16]
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+import numpy as np
+
+from services import versioned_dir
+
+# ---------- Config ----------
+BOOK_DIR = os.getenv("OPENING_BOOK_DIR", os.path.join("data", "opening_book"))
+BOOK_ENABLED = os.getenv("OPENING_BOOK", "1") != "0"
+BOOK_PLIES = 16
+NO_MOVE = 0xFFFF
+
+_book: Optional["OpeningBook"] = None
+_book_checked = False
+_book_lock = threading.Lock()
+
+
+@dataclass
+class BookEntry:
+    score: chess.engine.PovScore
+    best_move: Optional[chess.Move]
+    eco: str
+
+
+def _encode_move(move: Optional[chess.Move]) -> int:
+    if move is None:
+        return NO_MOVE
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def _decode_move(value: int) -> Optional[chess.Move]:
+    if value == NO_MOVE:
+        return None
+    return chess.Move(value & 63, (value >> 6) & 63, promotion=(value >> 12) or None)
+
+
+class OpeningBook:
+    def __init__(self, book_dir: str = BOOK_DIR):
+        book_dir = versioned_dir.resolve(book_dir)
+        with open(os.path.join(book_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.depth = int(self.meta["depth"])
+        self.mode = self.meta["mode"]
+        self.plies = int(self.meta["plies"])
+        self.ecos: List[str] = self.meta["ecos"]
+        load = lambda name: np.load(os.path.join(book_dir, f"{name}.npy"), mmap_mode="r")
+        self.keys = load("keys")
+        self.cp = load("cp")
+        self.mate = load("mate")
+        self.best = load("best")
+        self.eco = load("eco")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, board: chess.Board) -> Optional[BookEntry]:
+        if board.ply() > self.plies or not len(self.keys):
+            return None
+        key = np.uint64(chess.polyglot.zobrist_hash(board))
+        i = int(np.searchsorted(self.keys, key))
+        if i >= len(self.keys) or self.keys[i] != key:
+            return None
+        mate = int(self.mate[i])
+        raw = chess.engine.Mate(mate) if mate else chess.engine.Cp(int(self.cp[i]))
+        best = _decode_move(int(self.best[i]))
+        if best is not None and best not in board.legal_moves:
+            return None  # hash collision
+        eco_index = int(self.eco[i])
+        return BookEntry(
+            score=chess.engine.PovScore(raw, chess.WHITE),
+            best_move=best,
+            eco=self.ecos[eco_index] if 0 <= eco_index < len(self.ecos) else "",
+        )
+
+
+def get_book() -> Optional[OpeningBook]:
+    """The memory-mapped book, or None when disabled or not built."""
+    global _book, _book_checked
+    if _book_checked:
+        return _book
+    with _book_lock:
+        if not _book_checked:
+            if BOOK_ENABLED and os.path.exists(os.path.join(versioned_dir.resolve(BOOK_DIR), "meta.json")):
+                _book = OpeningBook(BOOK_DIR)
+            _book_checked = True
+    return _book
+
+
+def reload_book() -> Optional[OpeningBook]:
+    global _book_checked
+    with _book_lock:
+        _book_checked = False
+    return get_book()
+
+
+# ---------- Offline build ----------
+def collect_positions(pgn_paths: List[str], plies: int) -> Dict[int, Dict[str, object]]:
+    """Zobrist hash -> {fen, count, ecos} for the first ``plies`` plies of every game."""
+    positions: Dict[int, Dict[str, object]] = {}
+    ecos: Dict[int, Counter] = defaultdict(Counter)
+    seen_files = set()
+    for path in pgn_paths:
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        if digest in seen_files:  # manual uploads are often the same file again
+            continue
+        seen_files.add(digest)
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                eco = game.headers.get("ECO", "")
+                board = game.board()
+                for ply, move in enumerate(game.mainline_moves()):
+                    if ply > plies:
+                        break
+                    key = chess.polyglot.zobrist_hash(board)
+                    entry = positions.get(key)
+                    if entry is None:
+                        positions[key] = {"fen": board.fen(), "count": 1}
+                    else:
+                        entry["count"] += 1
+                    if eco:
+                        ecos[key][eco] += 1
+                    board.push(move)
+    for key, counter in ecos.items():
+        positions[key]["eco"] = counter.most_common(1)[0][0]
+    return positions
+
+
+def build_book(
+    engine: chess.engine.SimpleEngine,
+    pgn_paths: List[str],
+    out_dir: str = BOOK_DIR,
+    plies: int = BOOK_PLIES,
+    min_count: int = 2,
+    depth: int = 16,
+) -> Dict[str, object]:
+    # Imported here: engine_service probes this module on every search.
+    from services.engine_service import SearchBudget, search
+
+    started = time.perf_counter()
+    positions = collect_positions(pgn_paths, plies)
+    selected = sorted(key for key, p in positions.items() if p["count"] >= min_count)
+    # min_depth=depth: no stability stop, so every entry really is a depth-``depth`` eval
+    # (the book answers searches up to that depth).
+    budget = SearchBudget(depth=depth, min_depth=depth, site="book", use_book=False)
+
+    eco_names = sorted({positions[k].get("eco", "") for k in selected} - {""})
+    eco_index = {name: i for i, name in enumerate(eco_names)}
+    n = len(selected)
+    arrays = {
+        "keys": np.asarray(selected, dtype=np.uint64),
+        "cp": np.zeros(n, dtype=np.int32),
+        "mate": np.zeros(n, dtype=np.int16),
+        "best": np.full(n, NO_MOVE, dtype=np.uint16),
+        "eco": np.full(n, -1, dtype=np.int16),
+    }
+    for i, key in enumerate(selected):
+        board = chess.Board(positions[key]["fen"])
+        info = search(engine, board, budget)
+        score = info["score"].white()
+        if score.is_mate():
+            arrays["mate"][i] = score.mate()
+        else:
+            arrays["cp"][i] = score.score()
+        pv = info.get("pv")
+        arrays["best"][i] = _encode_move(pv[0] if pv else None)
+        arrays["eco"][i] = eco_index.get(positions[key].get("eco", ""), -1)
+
+    tmp_dir = versioned_dir.new_version(out_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    meta = {
+        "depth": depth,
+        "mode": budget.mode,
+        "plies": plies,
+        "min_count": min_count,
+        "positions": n,
+        "positions_seen": len(positions),
+        "ecos": eco_names,
+        "sources": sorted(os.path.basename(p) for p in pgn_paths),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    versioned_dir.publish(out_dir, tmp_dir, "meta.json")
+    return meta
+
+
+def main() -> None:
+    from services.engine_service import ENGINE_PATH
+    from services.engine_supervisor import EngineSupervisor
+
+    parser = argparse.ArgumentParser(description="Build the opening-book eval table from local PGN archives.")
+    parser.add_argument("--uploads", default=os.path.join("data", "uploads"))
+    parser.add_argument("--out", default=BOOK_DIR)
+    parser.add_argument("--plies", type=int, default=BOOK_PLIES)
+    parser.add_argument("--min-count", type=int, default=2)
+    parser.add_argument("--depth", type=int, default=16)
+    args = parser.parse_args()
+
+    pgn_paths = sorted(glob.glob(os.path.join(args.uploads, "*.pgn")))
+    supervisor = EngineSupervisor(ENGINE_PATH, name="book").start(monitor=False)
+    try:
+        with supervisor.session() as engine:
+            meta = build_book(engine, pgn_paths, args.out, args.plies, args.min_count, args.depth)
+    finally:
+        supervisor.stop()
+    print({k: v for k, v in meta.items() if k not in {"ecos", "sources"}})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Micro-batching for move-model inference.
+
+Concurrent /model/predict calls each submit one board and block on a
+Future. A single worker thread drains the queue, waits up to MAX_WAIT_MS
+for more requests (or until MAX_BATCH are pending), groups them by model and
+runs the whole batch through move_model.predict_grouped, so users on the
+shared base also share one trunk pass. Under bot-play load that turns N tiny
+forward passes into one, which is where CPU inference gets its throughput.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import chess
+
+from services import move_model
+from services.metrics import MODEL_BATCH_SIZE, MODEL_INFERENCE_SECONDS
+
+# ---------- Config ----------
+MAX_BATCH = int(os.getenv("MODEL_MAX_BATCH", "64"))
+MAX_WAIT_MS = float(os.getenv("MODEL_BATCH_WAIT_MS", "3"))
+RESULT_TIMEOUT_S = 10.0
+
+_Item = Tuple[object, chess.Board, Future]
+
+
+class MicroBatcher:
+    def __init__(self, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Optional[_Item]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.positions = 0
+
+    def start(self) -> "MicroBatcher":
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="model-batcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=5)
+        self._thread = None
+
+    def submit(self, model, board: chess.Board) -> Future:
+        future: Future = Future()
+        self._queue.put((model, board, future))
+        return future
+
+    def predict(self, model, board: chess.Board) -> Optional[chess.Move]:
+        self.start()
+        return self.submit(model, board).result(timeout=RESULT_TIMEOUT_S)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "batches": self.batches,
+            "positions": self.positions,
+            "mean_batch": round(self.positions / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+    # ---------- worker ----------
+    def _collect(self, first: _Item) -> Tuple[List[_Item], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect(first)
+            self._run_batch(batch)
+            if stopping:
+                return
+
+    def _run_batch(self, batch: List[_Item]) -> None:
+        groups: Dict[int, List[_Item]] = {}
+        for item in batch:
+            groups.setdefault(id(item[0]), []).append(item)
+        grouped = list(groups.values())
+        try:
+            with MODEL_INFERENCE_SECONDS.time(source="batcher"):
+                results = move_model.predict_grouped(
+                    [(items[0][0], [board for _, board, _ in items]) for items in grouped]
+                )
+        except Exception as exc:  # surface the failure to every waiter
+            for _, _, future in batch:
+                future.set_exception(exc)
+            return
+        MODEL_BATCH_SIZE.observe(len(batch), source="batcher")
+        self.batches += 1
+        self.positions += len(batch)
+        for items, moves in zip(grouped, results):
+            for (_, _, future), move in zip(items, moves):
+                future.set_result(move)
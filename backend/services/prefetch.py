@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import chess
+import chess.engine
+
+from services.engine_service import SearchBudget
+from services.engine_supervisor import EngineSupervisor, watchdog
+from services.metrics import ENGINE_SEARCH_SECONDS
+from services.live_analysis import (
+    SUGGEST_TOP_K,
+    _score_from_info,
+    cached_eval,
+    cached_suggestions,
+    moves_from_infos,
+    store_eval,
+    store_suggestions,
+)
+
+# ---------- Config ----------
+PREFETCH_ENABLED = os.getenv("LIVE_PREFETCH", "0").lower() in {"1", "true", "yes"}
+PREFETCH_DEPTH = 10     # must match the /analyze/move default to produce cache hits
+PREFETCH_TOP_K = 3      # candidate replies / moves expanded per position
+IDLE_GRACE_S = 0.05     # wait this long after the last real request before resuming
+
+
+class Prefetcher:
+    """
+    Speculative analysis of the positions a live player is likely to reach next.
+
+    While the engine is idle, a background thread evaluates the opponent's
+    top-k replies to the position after the player's move, then the player's
+    top-k candidate moves in each of those positions, and stores the results
+    in the live eval caches. Real requests take priority: entering
+    ``priority()`` stops the running speculative search immediately and
+    keeps the prefetcher parked until no real request is waiting.
+    """
+
+    def __init__(
+        self,
+        supervisor: EngineSupervisor,
+        depth: int = PREFETCH_DEPTH,
+        top_k: int = PREFETCH_TOP_K,
+    ):
+        self.supervisor = supervisor
+        self.depth = depth
+        self.top_k = top_k
+        # Results are stored under the same mode tag real requests look up.
+        self.mode = SearchBudget(depth=depth).mode
+
+        self._mutex = threading.Lock()
+        self._wakeup = threading.Condition(self._mutex)
+        self._demand = 0
+        self._current: Optional[chess.engine.SimpleAnalysisResult] = None
+        self._preempted = False
+        self._pending: Optional[Tuple[str, bool]] = None
+        self._generation = 0
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.searches_done = 0
+        self.searches_interrupted = 0
+
+    # ----- lifecycle -----
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="live-prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._mutex:
+            self._stopped = True
+            self._pending = None
+            self._generation += 1
+            self._preempt_locked()
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _preempt_locked(self) -> None:
+        if self._current is not None:
+            self._preempted = True
+            self._current.stop()
+
+    # ----- public API -----
+    def submit(self, fen: str) -> None:
+        """Replace any queued speculation with the position after the player's move."""
+        self._enqueue(fen, expand_replies=True)
+
+    def submit_position(self, fen: str) -> None:
+        """Replace any queued speculation with the position the player is thinking in."""
+        self._enqueue(fen, expand_replies=False)
+
+    def _enqueue(self, fen: str, expand_replies: bool) -> None:
+        with self._mutex:
+            self._pending = (fen, expand_replies)
+            self._generation += 1
+            self._preempt_locked()
+            self._wakeup.notify_all()
+
+    @contextmanager
+    def priority(self):
+        """Hold the engine for a real request, pre-empting speculative work."""
+        with self._mutex:
+            self._demand += 1
+            self._preempt_locked()
+        try:
+            yield
+        finally:
+            with self._mutex:
+                self._demand -= 1
+                self._wakeup.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "depth": self.depth,
+            "top_k": self.top_k,
+            "mode": self.mode,
+            "searches_done": self.searches_done,
+            "searches_interrupted": self.searches_interrupted,
+        }
+
+    # ----- worker -----
+    def _run(self) -> None:
+        while True:
+            with self._mutex:
+                while not self._stopped and (self._pending is None or self._demand):
+                    self._wakeup.wait()
+                if self._stopped:
+                    return
+                fen, expand_replies = self._pending
+                self._pending = None
+                generation = self._generation
+            try:
+                if expand_replies:
+                    self._speculate_replies(chess.Board(fen), generation)
+                else:
+                    self._speculate_position(chess.Board(fen), generation)
+            except Exception:
+                # Speculation is best effort; the real request will search itself.
+                pass
+
+    def _wait_until_idle(self, generation: int) -> bool:
+        with self._mutex:
+            while True:
+                while not self._stopped and self._demand:
+                    self._wakeup.wait()
+                # Let a burst of real requests finish before resuming. stop(),
+                # a newer submission and new demand all notify the condition,
+                # so they cut the grace period short.
+                grace_end = time.monotonic() + IDLE_GRACE_S
+                while not self._stopped and generation == self._generation and not self._demand:
+                    remaining = grace_end - time.monotonic()
+                    if remaining <= 0:
+                        return True
+                    self._wakeup.wait(remaining)
+                if self._stopped or generation != self._generation:
+                    return False
+
+    def _search(self, board: chess.Board, multipv: int, generation: int) -> Optional[List[dict]]:
+        """Run one interruptible search; return None if it was pre-empted."""
+        if not self._wait_until_idle(generation):
+            return None
+        budget = SearchBudget(depth=self.depth, site="prefetch")
+        started = time.perf_counter()
+        with self.supervisor.session() as engine, watchdog(engine):
+            with self._mutex:
+                if self._demand or self._stopped or generation != self._generation:
+                    return None
+                self._preempted = False
+                self._current = engine.analysis(
+                    budget.root(board),
+                    budget.limit(),
+                    multipv=multipv,
+                    **budget.engine_kwargs(engine),
+                )
+            try:
+                with self._current as analysis:
+                    for _info in analysis:
+                        pass
+                    infos = list(analysis.multipv)
+            finally:
+                with self._mutex:
+                    self._current = None
+                    preempted = self._preempted
+
+        ENGINE_SEARCH_SECONDS.observe(time.perf_counter() - started, site="prefetch")
+        if preempted or not infos:
+            self.searches_interrupted += 1
+            return None
+        self.searches_done += 1
+        return infos
+
+    def _ensure_eval(self, board: chess.Board, generation: int) -> bool:
+        fen = board.fen()
+        if cached_eval(fen, self.depth, self.mode, record=False) is not None or board.is_game_over():
+            return True
+        infos = self._search(board, 1, generation)
+        if infos is None:
+            return False
+        store_eval(fen, self.depth, self.mode, _score_from_info(infos[0]))
+        return True
+
+    def _ensure_suggestions(self, board: chess.Board, generation: int) -> Optional[List[str]]:
+        fen = board.fen()
+        cached = cached_suggestions(fen, self.depth, self.mode, SUGGEST_TOP_K, record=False)
+        if cached is not None:
+            return cached
+        if board.is_game_over():
+            return []
+        infos = self._search(board, SUGGEST_TOP_K, generation)
+        if infos is None:
+            return None
+        moves = moves_from_infos(infos, SUGGEST_TOP_K)
+        store_suggestions(fen, self.depth, self.mode, SUGGEST_TOP_K, moves)
+        return moves
+
+    def _speculate_position(self, position: chess.Board, generation: int) -> bool:
+        # /analyze/move on this position needs: eval before the move, the
+        # suggestion list, and the eval after each candidate move.
+        if position.is_game_over():
+            return True
+        if not self._ensure_eval(position, generation):
+            return False
+        candidates = self._ensure_suggestions(position, generation)
+        if candidates is None:
+            return False
+        for move_uci in candidates[: self.top_k]:
+            child = position.copy()
+            child.push(chess.Move.from_uci(move_uci))
+            if not self._ensure_eval(child, generation):
+                return False
+        return True
+
+    def _speculate_replies(self, after_player: chess.Board, generation: int) -> None:
+        if after_player.is_game_over():
+            return
+
+        # Opponent's likely replies; the multipv width matches the suggestion
+        # search so the same table also serves /analyze/move on this position.
+        replies = self._ensure_suggestions(after_player, generation)
+        if replies is None:
+            return
+
+        for reply_uci in replies[: self.top_k]:
+            position = after_player.copy()
+            position.push(chess.Move.from_uci(reply_uci))
+            if not self._speculate_position(position, generation):
+                return
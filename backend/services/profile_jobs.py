@@ -0,0 +1,167 @@
+"""
+Profile builds split into per-game tasks on the work queue.
+
+enqueue_profile() scans the user's PGN headers (no engine) and enqueues
+one task per game the user played, up to max_games. A worker runs each
+task with collect_game() and returns that game's move-store rows as the
+task result; whoever acks the last task finalizes the job: the rows are
+concatenated in game order, aggregated into the profile, and written to
+data/profiles and the move store exactly as an in-process build would.
+
+Difference from build_profile_from_pgn(): max_games counts the games
+enqueued, so a game whose initial eval fails is not replaced by the next
+one in the archive.
+"""
+from __future__ import annotations
+
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+import chess
+import chess.engine
+import chess.pgn
+
+from services import feedback_pipeline
+from services.feedback_pipeline import EngineSession
+from services.move_store import MoveRecorder, write_store
+from services.profiling import (
+    DEFAULT_MAX_GAMES,
+    DEFAULT_MAX_PLIES_PER_GAME,
+    PlayerProfile,
+    StockfishEvaluator,
+    aggregate_profile,
+    collect_game,
+    save_profile,
+    side_from_username,
+)
+from services.work_queue import Task, WorkQueue
+
+PROFILES_DIR = os.path.join("data", "profiles")
+JOB_KIND = "profile"
+TASK_KIND = "profile_game"
+
+
+def user_games(username: str, pgn_path: str, max_games: int) -> List[Dict[str, Any]]:
+    """
+    Index and start position of each game the user played, without parsing
+    the moves. The "offset" is a text-mode tell() cookie, not a byte offset:
+    it is only valid for seek() on the file opened as run_game() opens it.
+    """
+    tasks = []
+    with open(pgn_path, "r", encoding="utf-8", errors="ignore") as f:
+        game_index = -1
+        while len(tasks) < max_games:
+            offset = f.tell()
+            headers = chess.pgn.read_headers(f)
+            if headers is None:
+                break
+            game_index += 1
+            white = (headers.get("White") or "").strip().lower()
+            black = (headers.get("Black") or "").strip().lower()
+            if username.strip().lower() in {white, black}:
+                tasks.append({"game_index": game_index, "offset": offset})
+    return tasks
+
+
+def enqueue_profile(
+    queue: WorkQueue,
+    username: str,
+    pgn_path: str,
+    max_games: int = DEFAULT_MAX_GAMES,
+    max_plies_per_game: int = DEFAULT_MAX_PLIES_PER_GAME,
+) -> Dict[str, Any]:
+    job = f"profile-{username}-{uuid.uuid4().hex[:12]}"
+    games = user_games(username, pgn_path, max_games)
+    common = {"username": username, "pgn_path": os.path.abspath(pgn_path), "max_plies": max_plies_per_game}
+    queue.create_job(
+        job,
+        JOB_KIND,
+        {**common, "max_games": max_games},
+        ({**common, **game} for game in games),
+        task_kind=TASK_KIND,
+    )
+    return queue.job(job)
+
+
+def run_game_task(task: Task, engine: chess.engine.SimpleEngine) -> Dict[str, Any]:
+    return run_game(task.payload, engine)
+
+
+def run_game(payload: Dict[str, Any], engine: chess.engine.SimpleEngine) -> Dict[str, Any]:
+    """Analyze one game (username, pgn_path, offset, game_index, max_plies); rows come back as plain lists."""
+    with open(payload["pgn_path"], "r", encoding="utf-8", errors="ignore") as f:
+        f.seek(payload["offset"])
+        game = chess.pgn.read_game(f)
+    if game is None:
+        raise ValueError(f"no game at offset {payload['offset']} in {payload['pgn_path']}")
+    player_side = side_from_username(game, payload["username"])
+    if player_side is None:
+        raise ValueError(f"{payload['username']} did not play game {payload['game_index']}")
+
+    recorder = MoveRecorder(payload["username"])
+    evaluator = StockfishEvaluator(engine)
+    counted = collect_game(payload["game_index"], game, player_side, evaluator, recorder, payload["max_plies"])
+    return {
+        "counted": counted,
+        "eval_mode": evaluator.budget.mode,
+        "search": dict(evaluator.budget.stats),
+        "rows": recorder.rows(),
+    }
+
+
+def finalize_profile(
+    queue: WorkQueue,
+    job: str,
+    session: Optional[EngineSession] = None,
+    profiles_dir: str = PROFILES_DIR,
+) -> Optional[Dict[str, Any]]:
+    info = queue.job(job)
+    if info is None:
+        return None
+    username = info["payload"]["username"]
+    results = queue.job_results(job)
+    finished = [r for r in results if r is not None]
+    if not finished:
+        # Nothing was analyzed (every task failed, or the user has no games):
+        # keep whatever profile and move store the user already has.
+        summary = {"games_analyzed": 0, "tasks_failed": len(results), "profile_written": False}
+        queue.finish_job(job, "failed", summary)
+        return summary
+    profile = write_profile(username, finished, info["payload"]["pgn_path"], profiles_dir, extra={"job": job})
+    summary = {
+        "games_analyzed": profile.games_analyzed,
+        "avg_cpl": profile.avg_cpl,
+        "tasks_failed": len(results) - len(finished),
+        "profile_written": True,
+        # Workers are background processes already; the feedback stage runs inline.
+        "feedback_status": feedback_pipeline.precompute(username, profiles_dir, session),
+    }
+    queue.finish_job(job, "done", summary)
+    return summary
+
+
+def write_profile(
+    username: str,
+    results: List[Dict[str, Any]],
+    pgn_path: str,
+    profiles_dir: str = PROFILES_DIR,
+    extra: Optional[Dict[str, Any]] = None,
+) -> PlayerProfile:
+    """Aggregate run_game() results (in game order) and write the profile and the move store."""
+    if not results:
+        raise ValueError(f"no analyzed games for {username}; the existing profile is kept")
+    recorder = MoveRecorder(username)
+    for result in results:
+        recorder.extend(result["rows"])
+    moves, games = recorder.frames()
+    eval_mode = results[0]["eval_mode"]
+    profile = aggregate_profile(username, moves, games, eval_mode=eval_mode)
+    save_profile(profile, profiles_dir)
+    write_store(
+        username,
+        moves,
+        games,
+        extra={"source": os.path.basename(pgn_path), "eval_mode": eval_mode, **(extra or {})},
+    )
+    return profile
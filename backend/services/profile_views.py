@@ -0,0 +1,173 @@
+"""
+Filtered profile views served from the columnar move store.
+
+A ProfileIndex is built once per user (and rebuilt when the store is
+rewritten): per-game arrays for date, colour, ECO and time class, plus each
+game's row range in the moves table. A query turns its filters into boolean
+masks over games, gathers the matching move rows by range, and hands both
+to aggregate_profile(). No engine search is involved.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import asdict
+from datetime import date
+from typing import TYPE_CHECKING, Dict, Optional
+
+import numpy as np
+
+from services import move_store
+from services.profiling import aggregate_profile
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+TIME_CLASSES = ("bullet", "blitz", "rapid", "daily", "unknown")
+
+_INDEXES: Dict[str, "ProfileIndex"] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def time_class(time_control: str) -> str:
+    """chess.com-style class from a PGN TimeControl (estimated game length base + 40 * increment)."""
+    if not time_control or time_control in {"-", "?"}:
+        return "unknown"
+    if "/" in time_control:
+        return "daily"
+    base, _, inc = time_control.partition("+")
+    try:
+        seconds = int(base) + 40 * int(inc or 0)
+    except ValueError:
+        return "unknown"
+    if seconds < 180:
+        return "bullet"
+    if seconds < 600:
+        return "blitz"
+    return "rapid"
+
+
+def _date_key(value: Optional[date]) -> Optional[int]:
+    return value.year * 10000 + value.month * 100 + value.day if value else None
+
+
+class ProfileIndex:
+    def __init__(self, username: str, root: str = move_store.MOVES_DIR):
+        # One version throughout, including proof rows fetched later.
+        self.store_dir = move_store.store_dir(username, root)
+        loaded = move_store.load_store(username, root, in_dir=self.store_dir)
+        if loaded is None:
+            raise FileNotFoundError(username)
+        self.username = username
+        self.root = root
+        self.moves, self.games = loaded
+        self.meta = move_store.read_meta(self.store_dir) or {}
+        self.mtime = os.path.getmtime(os.path.join(self.store_dir, move_store.META))
+
+        games = self.games
+        self.date = games["date"].to_numpy()
+        self.color = games["color"].astype(str).to_numpy()
+        self.eco = games["eco"].astype(str).to_numpy().astype(str)
+        tc = games["time_control"].cat
+        class_of_category = np.array([time_class(c) for c in tc.categories] or ["unknown"], dtype=object)
+        self.time_class = class_of_category[tc.codes] if len(games) else np.array([], dtype=object)
+        self.time_control = games["time_control"].astype(str).to_numpy()
+
+        # Moves are written game by game, so each game's rows are one contiguous range.
+        move_games = self.moves["game_id"].to_numpy()
+        game_ids = games["game_id"].to_numpy()
+        self.move_start = np.searchsorted(move_games, game_ids, side="left")
+        self.move_end = np.searchsorted(move_games, game_ids, side="right")
+
+    def _game_mask(
+        self,
+        since: Optional[date],
+        until: Optional[date],
+        time_control: Optional[str],
+        color: Optional[str],
+        eco: Optional[str],
+    ) -> np.ndarray:
+        mask = np.ones(len(self.games), dtype=bool)
+        since_key, until_key = _date_key(since), _date_key(until)
+        if since_key is not None:
+            mask &= self.date >= since_key
+        if until_key is not None:
+            mask &= (self.date <= until_key) & (self.date > 0)
+        if time_control:
+            tc = time_control.lower()
+            mask &= (self.time_class == tc) if tc in TIME_CLASSES else (self.time_control == time_control)
+        if color:
+            mask &= self.color == color.lower()
+        if eco:
+            mask &= np.char.startswith(self.eco, eco.upper())
+        return mask
+
+    def query(
+        self,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        time_control: Optional[str] = None,
+        color: Optional[str] = None,
+        eco: Optional[str] = None,
+    ) -> Dict[str, object]:
+        mask = self._game_mask(since, until, time_control, color, eco)
+        selected = np.flatnonzero(mask)
+        ranges = [np.arange(s, e) for s, e in zip(self.move_start[selected], self.move_end[selected])]
+        rows = np.concatenate(ranges) if ranges else np.array([], dtype=np.int64)
+        games = self.games.iloc[selected]
+        moves = self.moves.iloc[rows]
+
+        profile = aggregate_profile(
+            self.username,
+            moves,
+            games,
+            eval_mode=self.meta.get("eval_mode", "adaptive"),
+            proof_source=lambda labels: move_store.load_rows(
+                self.username, labels, ["fen", "played", "best"], root=self.root, in_dir=self.store_dir
+            ),
+        )
+        return {
+            **asdict(profile),
+            "view": {
+                "since": since.isoformat() if since else None,
+                "until": until.isoformat() if until else None,
+                "time_control": time_control,
+                "color": color,
+                "eco": eco,
+                "games_matched": int(len(selected)),
+                "games_stored": int(len(self.games)),
+                "moves_matched": int(len(rows)),
+            },
+        }
+
+    def dimensions(self) -> Dict[str, object]:
+        import pandas as pd
+
+        dated = self.date[self.date > 0]
+        return {
+            "time_classes": pd.Series(self.time_class).value_counts().to_dict(),
+            "colors": pd.Series(self.color).value_counts().to_dict(),
+            "ecos": pd.Series(self.eco[self.eco != ""]).value_counts().head(20).to_dict(),
+            "first_date": int(dated.min()) if dated.size else None,
+            "last_date": int(dated.max()) if dated.size else None,
+        }
+
+
+def get_index(username: str, root: str = move_store.MOVES_DIR) -> Optional[ProfileIndex]:
+    """Cached index for a user; rebuilt when the store has been rewritten."""
+    try:
+        meta_path = os.path.join(move_store.store_dir(username, root), move_store.META)
+        mtime = os.path.getmtime(meta_path)
+    except (ValueError, OSError):   # no store can exist under a name that leaves the root
+        return None
+    key = f"{root}:{username}"
+    index = _INDEXES.get(key)
+    if index is not None and index.mtime == mtime:
+        return index
+    try:
+        index = ProfileIndex(username, root)
+    except FileNotFoundError:
+        return None
+    with _INDEXES_LOCK:
+        _INDEXES[key] = index
+    return index
@@ -2,12 +2,22 @@ from __future__ import annotations
 
 import json
 import os
+import threading
 from dataclasses import dataclass, asdict
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 
 import chess
 import chess.engine
 import chess.pgn
+import numpy as np
+
+from services import game_cache
+from services.engine_service import PROFILE_NODE_BUDGET, NodeBudget, SearchBudget, search
+from services.metrics import ENGINE_SEARCHES_AVOIDED, PGN_PARSE_SECONDS
+from services.move_store import MoveRecorder
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 # ---------- Config ----------
@@ -23,6 +33,13 @@ MAX_CPL_PER_MOVE = 300
 IGNORE_POSITION_BELOW = -500
 MATE_SCORE_ABS = 10000
 
+# Profile heuristics
+PROOF_MIN_CPL = 150              # moves this bad become profile proofs
+MAX_PROOFS = 10
+TOP_OPENINGS = 5
+AGGRESSIVE_RATIO = 0.45          # share of captures/checks among counted moves
+LATE_CASTLE_PLY = 16             # average castling ply above this is "late"
+
 
 @dataclass
 class StyleFlags:
@@ -52,6 +69,8 @@ class PlayerProfile:
     style: StyleFlags
     phase_breakdown: PhaseWeakness
     profile_proofs: List[Dict[str, object]]
+    eval_mode: str = "adaptive"
+    feedback_status: str = "pending"     # set by services.feedback_pipeline once proof feedback is stored
 
 
 # ---------- Helpers ----------
@@ -104,6 +123,35 @@ def classify_phase(board: chess.Board, ply_index: int) -> str:
     return "middlegame"
 
 
+def cpl_discarded(before: Optional[float]) -> bool:
+    """
+    True when a move's CPL will be thrown away whatever it turns out to be:
+    the eval before it is missing, a mate score, or already lost beyond
+    IGNORE_POSITION_BELOW. The search after such a move can be shallow.
+    """
+    return before is None or abs(before) >= MATE_SCORE_ABS or before < IGNORE_POSITION_BELOW
+
+
+def player_cpl(before: Optional[float], after: Optional[float]) -> Optional[int]:
+    """
+    Capped centipawn loss for one user move from player-POV evals, or None
+    when the move does not count (missing eval, mate scores, lost position).
+    """
+    if cpl_discarded(before) or after is None or abs(after) >= MATE_SCORE_ABS:
+        return None
+    return min(max(0, -(after - before)), MAX_CPL_PER_MOVE)
+
+
+def cpl_label(cpl: float) -> str:
+    if cpl >= BLUNDER_CPL:
+        return "blunder"
+    if cpl >= MISTAKE_CPL:
+        return "mistake"
+    if cpl >= INACCURACY_CPL:
+        return "inaccuracy"
+    return "good"
+
+
 def is_castle_move(move: chess.Move, board: chess.Board) -> bool:
     return board.is_castling(move)
 
@@ -121,257 +169,415 @@ class StockfishEvaluator:
     """
     Minimal wrapper around python-chess engine API.
     If your project already has a Stockfish service, adapt this to call it instead.
+    Searches go through the engine layer's budgeting policy: one node budget
+    for the whole profile, plus a fresh per-game budget from ``start_game()``.
     """
-    def __init__(self, engine: chess.engine.SimpleEngine, depth: int = EVAL_DEPTH):
+    def __init__(
+        self,
+        engine: chess.engine.SimpleEngine,
+        depth: int = EVAL_DEPTH,
+        budget: Optional[SearchBudget] = None,
+    ):
         self.engine = engine
         self.depth = depth
-
-    def eval_cp(self, board: chess.Board) -> Optional[int]:
+        self.budget = budget or SearchBudget(
+            depth=depth,
+            node_budgets=(NodeBudget(PROFILE_NODE_BUDGET),),
+            site="profile",
+        )
+        self._game_budget = self.budget
+        self._game_evals: Optional[game_cache.GameEvals] = None
+
+    def cache_settings(self) -> str:
+        return game_cache.engine_settings(self.engine, self.budget.depth, self.budget.mode, "profile")
+
+    def start_game(self, game: Optional[chess.pgn.Game] = None, positions: int = 0) -> None:
+        """
+        Fresh per-game node budget. With ``game``, evals are also looked up
+        in (and later written to) the game cache; pass the number of
+        positions that will be evaluated.
         """
-        Returns evaluation in centipawns from White's perspective.
+        self._game_budget = self.budget.for_game()
+        self._game_evals = None
+        if game is not None:
+            key = game_cache.game_key(game.board().fen(), game.mainline_moves(), self.cache_settings())
+            self._game_evals = game_cache.load(key, positions)
+
+    def finish_game(self) -> None:
+        if self._game_evals is not None:
+            game_cache.save(self._game_evals)
+            self._game_evals = None
+
+    def evaluate(
+        self,
+        board: chess.Board,
+        shallow: bool = False,
+        ply: Optional[int] = None,
+    ) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Returns (evaluation in centipawns from White's perspective, best move UCI).
         If mate is detected, return large cp with sign.
+        ``shallow`` searches to SHALLOW_DEPTH only, for evals whose precision
+        the caller is going to discard.
+        ``ply`` is the position's index in the game started with
+        ``start_game(game)``; it enables the game cache.
         """
-        import chess.engine
-
+        evals = self._game_evals if ply is not None else None
+        if evals is not None:
+            cached = evals.get_cp(ply, shallow_ok=shallow)
+            if cached is not None:
+                self._game_budget.stats["cached"] += 1
+                ENGINE_SEARCHES_AVOIDED.inc(site=self._game_budget.site, reason="game_cache")
+                return cached, evals.get_best(ply, shallow_ok=shallow)
+        # Searches after a budget ran out are degraded: cache them as shallow.
+        degraded = self._game_budget.exhausted
+        cp, best_move_uci = self._search(board, shallow)
+        if evals is not None:
+            evals.put(ply, cp, best_move_uci, shallow=shallow or degraded)
+        return cp, best_move_uci
+
+    def _search(self, board: chess.Board, shallow: bool) -> Tuple[Optional[int], Optional[str]]:
+        budget = self._game_budget
+        if shallow:
+            budget = budget.shallow()
+            budget.stats["shallow"] += 1
+            ENGINE_SEARCHES_AVOIDED.inc(site=budget.site, reason="ignored_position")
         try:
-            limit = chess.engine.Limit(depth=self.depth)
-            info = self.engine.analyse(board, limit)
+            info = search(self.engine, board, budget)
+            pv = info.get("pv")
+            best_move_uci = pv[0].uci() if pv else None
             score = info["score"].pov(chess.WHITE)
             if score.is_mate():
                 mate = score.mate()
                 # Map mate score to big cp (sign preserved)
-                return 100000 if mate is not None and mate > 0 else -100000
+                return (100000 if mate is not None and mate > 0 else -100000), best_move_uci
             cp = score.score(mate_score=100000)
-            return int(cp) if cp is not None else None
+            return (int(cp) if cp is not None else None), best_move_uci
         except Exception:
-            return None
+            return None, None
 
+    def eval_cp(self, board: chess.Board) -> Optional[int]:
+        return self.evaluate(board)[0]
 
-# ---------- Main profiler ----------
-def build_profile_from_pgn(
+
+# ---------- Engine stage ----------
+def collect_game(
+    game_index: int,
+    game: chess.pgn.Game,
+    player_side: chess.Color,
+    evaluator: StockfishEvaluator,
+    recorder: MoveRecorder,
+    max_plies_per_game: int = DEFAULT_MAX_PLIES_PER_GAME,
+) -> bool:
+    """
+    Evaluate one game and record a row per move of ``player_side``.
+    Returns False when the game could not be evaluated (it is recorded as
+    not counted).
+    """
+    recorder.start_game(game_index, game, player_side, game_opening_name(game))
+
+    board = game.board()
+    plies = sum(1 for _ in game.mainline_moves())
+    evaluator.start_game(game, positions=min(plies, max_plies_per_game) + 1)
+
+    # Evaluate initial position once; each eval search also yields the
+    # best move for the position, so user moves need no second search.
+    prev_eval, position_best = evaluator.evaluate(board, ply=0)
+    if prev_eval is None:
+        evaluator.finish_game()
+        recorder.finish_game(counted=False)
+        return False
+
+    sign = 1 if player_side == chess.WHITE else -1
+    for ply_index, move in enumerate(game.mainline_moves(), start=1):
+        if ply_index > max_plies_per_game:
+            break
+
+        row = None
+        before = None
+        if board.turn == player_side:
+            # Evals are from White's side; store them from the player's.
+            before = sign * prev_eval if prev_eval is not None else None
+            row = {
+                "game_id": game_index,
+                "ply": ply_index,
+                "move_number": ply_index // 2 + 1,
+                "is_capture": board.is_capture(move),
+                "gives_check": board.gives_check(move),
+                "is_castle": is_castle_move(move, board),
+                "early_queen": queen_moved_early(move, board, player_side, ply_index),
+                "fen": board.fen(),
+                "played": move.uci(),
+                "best": position_best,
+            }
+
+        board.push(move)
+        # After a user move whose CPL is discarded anyway this eval is
+        # only stored as cp_after; nothing downstream counts it.
+        shallow = row is not None and cpl_discarded(before)
+        curr_eval, position_best = evaluator.evaluate(board, shallow=shallow, ply=ply_index)
+
+        if row is not None:
+            after = sign * curr_eval if curr_eval is not None else None
+            cpl = player_cpl(before, after)
+            recorder.add_move(
+                # Phase bucket based on board AFTER move (reasonable & simple)
+                phase=classify_phase(board, ply_index),
+                cp_before=before,
+                cp_after=after,
+                cpl=cpl,
+                label=cpl_label(cpl) if cpl is not None else "",
+                **row,
+            )
+        prev_eval = curr_eval
+
+    evaluator.finish_game()
+    recorder.finish_game(counted=True)
+    return True
+
+
+def collect_moves(
     username: str,
     pgn_path: str,
     evaluator: StockfishEvaluator,
+    recorder: MoveRecorder,
     max_games: int = DEFAULT_MAX_GAMES,
     max_plies_per_game: int = DEFAULT_MAX_PLIES_PER_GAME,
-) -> PlayerProfile:
+) -> int:
+    """
+    Walk the user's games with the engine and record one row per user move.
+    All statistics are left to aggregate_profile(). Returns the number of
+    games that counted.
+    """
     games = 0
-
-    cpl_sum = 0
-    cpl_count = 0
-
-    inacc = 0
-    mistake = 0
-    blunder = 0
-    total_user_moves = 0
-
-    # Phase tracking
-    phase_cpl_sum = {"opening": 0, "middlegame": 0, "endgame": 0}
-    phase_cpl_cnt = {"opening": 0, "middlegame": 0, "endgame": 0}
-
-    # Style indicators
-    early_queen_flag = False
-    castled_ply: List[int] = []
-    aggressive_moves = 0
-    quiet_moves = 0
-
-    opening_counts: Dict[str, int] = {}
-    proof_positions: List[Dict[str, object]] = []
-    MAX_PROOFS = 10
-
+    game_index = -1
     with open(pgn_path, "r", encoding="utf-8", errors="ignore") as f:
         while games < max_games:
-            game = chess.pgn.read_game(f)
+            with PGN_PARSE_SECONDS.time(site="profile"):
+                game = chess.pgn.read_game(f)
             if game is None:
                 break
+            game_index += 1
 
             player_side = side_from_username(game, username)
             if player_side is None:
                 continue
+            if collect_game(game_index, game, player_side, evaluator, recorder, max_plies_per_game):
+                games += 1
+    return games
 
-            opening_name = game_opening_name(game)
-            if opening_name:
-                opening_counts[opening_name] = opening_counts.get(opening_name, 0) + 1
 
-            board = game.board()
-            node = game
+# ---------- Aggregation stage ----------
+@dataclass(frozen=True)
+class ProfileThresholds:
+    inaccuracy_cpl: int = INACCURACY_CPL
+    mistake_cpl: int = MISTAKE_CPL
+    blunder_cpl: int = BLUNDER_CPL
+    max_cpl_per_move: int = MAX_CPL_PER_MOVE
+    ignore_position_below: int = IGNORE_POSITION_BELOW
+    mate_score_abs: int = MATE_SCORE_ABS
+    proof_min_cpl: int = PROOF_MIN_CPL
+    max_proofs: int = MAX_PROOFS
+    top_openings: int = TOP_OPENINGS
+    aggressive_ratio: float = AGGRESSIVE_RATIO
+    late_castle_ply: int = LATE_CASTLE_PLY
 
-            # Evaluate initial position once
-            prev_eval = evaluator.eval_cp(board)
-            if prev_eval is None:
-                continue
 
-            ply_index = 0
-            user_castled = False
-
-            # Walk moves
-            for move in game.mainline_moves():
-                ply_index += 1
-                if ply_index > max_plies_per_game:
-                    break
-
-                # For aggression heuristic: captures/checks are "aggressive"
-                is_capture = board.is_capture(move)
-                gives_check = board.gives_check(move)
-
-                # User move?
-                best_move_uci = None
-                fen_before_move = None
-                if board.turn == player_side:
-                    total_user_moves += 1
-
-                    if queen_moved_early(move, board, player_side, ply_index):
-                        early_queen_flag = True
-
-                    if is_castle_move(move, board) and not user_castled:
-                        user_castled = True
-                        castled_ply.append(ply_index)
-                    fen_before_move = board.fen()
-                    try:
-                        best = evaluator.engine.analyse(
-                            board,
-                            chess.engine.Limit(depth=evaluator.depth),
-                            multipv=1,
-                        )
-                        pv = best.get("pv")
-                        best_move_uci = pv[0].uci() if pv else None
-                    except Exception:
-                        best_move_uci = None
-
-                # Make the move
-                board.push(move)
-
-                curr_eval = evaluator.eval_cp(board)
-                if curr_eval is None:
-                    prev_eval = curr_eval
-                    continue
-
-                # Only compute CPL on user's moves: compare eval before user's move vs after user's move
-                # But note: eval is from White perspective. Convert to player's POV.
-                if (ply_index % 2 == 1 and player_side == chess.WHITE) or (ply_index % 2 == 0 and player_side == chess.BLACK):
-                    # This ply was made by player
-                    if prev_eval is not None:
-                        # For player's POV, if player is Black, flip sign
-                        before = prev_eval if player_side == chess.WHITE else -prev_eval
-                        after = curr_eval if player_side == chess.WHITE else -curr_eval
-
-                        # Skip forced mates/extreme evals and already-lost positions
-                        if abs(before) >= MATE_SCORE_ABS or abs(after) >= MATE_SCORE_ABS:
-                            continue
-                        if before < IGNORE_POSITION_BELOW:
-                            continue
-
-                        # A drop in eval (after - before) negative means player worsened position
-                        delta = after - before
-                        raw_cpl = max(0, -delta)  # only count losses
-                        cpl = min(raw_cpl, MAX_CPL_PER_MOVE)
-                        cpl_sum += cpl
-                        cpl_count += 1
-
-                        # Phase bucket based on board AFTER move (reasonable & simple)
-                        phase = classify_phase(board, ply_index)
-                        phase_cpl_sum[phase] += cpl
-                        phase_cpl_cnt[phase] += 1
-
-                        # ---- store proof positions (only significant mistakes) ----
-                        if cpl >= 150 and fen_before_move:
-                            proof_positions.append({
-                                "fen": fen_before_move,
-                                "played_move": move.uci(),
-                                "best_move": best_move_uci,
-                                "cpl": round(cpl, 2),
-                                "phase": phase,
-                                "label": (
-                                    "blunder" if cpl >= 200
-                                    else "mistake" if cpl >= 100
-                                    else "inaccuracy"
-                                ),
-                                "opening": opening_name,
-                                "move_number": ply_index // 2 + 1,
-                            })
-
-                        # Mistake categories
-                        if cpl >= BLUNDER_CPL:
-                            blunder += 1
-                        elif cpl >= MISTAKE_CPL:
-                            mistake += 1
-                        elif cpl >= INACCURACY_CPL:
-                            inacc += 1
-
-                # Aggression heuristic counts only for user's moves
-                if (board.turn != player_side):  # after push, turn switched; so if now it's opponent, last move was user's
-                    if is_capture or gives_check:
-                        aggressive_moves += 1
-                    else:
-                        quiet_moves += 1
-
-                prev_eval = curr_eval
-
-            games += 1
-
-    proof_positions = sorted(
-        proof_positions,
-        key=lambda x: x["cpl"],
-        reverse=True
-    )[:MAX_PROOFS]
-
-    avg_cpl = (cpl_sum / cpl_count) if cpl_count else 0.0
-
-    def rate(x: int) -> float:
-        return (x / total_user_moves) if total_user_moves else 0.0
-
-    # Weak phase
-    opening_avg = (phase_cpl_sum["opening"] / phase_cpl_cnt["opening"]) if phase_cpl_cnt["opening"] else 0.0
-    middle_avg = (phase_cpl_sum["middlegame"] / phase_cpl_cnt["middlegame"]) if phase_cpl_cnt["middlegame"] else 0.0
-    end_avg = (phase_cpl_sum["endgame"] / phase_cpl_cnt["endgame"]) if phase_cpl_cnt["endgame"] else 0.0
-
-    phase_map = {"opening": opening_avg, "middlegame": middle_avg, "endgame": end_avg}
-    weak_phase = max(phase_map, key=lambda k: phase_map[k]) if games else "middlegame"
-
-    # Opening preferences (top 5)
-    top_openings = sorted(opening_counts.items(), key=lambda kv: kv[1], reverse=True)[:5]
-    opening_pref_list = [name for name, _cnt in top_openings]
+DEFAULT_THRESHOLDS = ProfileThresholds()
+PHASES = ("opening", "middlegame", "endgame")
 
-    # Style flags
-    total_style_moves = aggressive_moves + quiet_moves
-    aggressive_ratio = (aggressive_moves / total_style_moves) if total_style_moves else 0.0
-    aggressive_flag = aggressive_ratio >= 0.45  # heuristic threshold
 
-    # late castling: castling after ply 16 (after 8 moves) OR never castled in many games
-    if castled_ply:
-        avg_castle_ply = sum(castled_ply) / len(castled_ply)
-        late_castling_flag = avg_castle_ply > 16
-    else:
-        late_castling_flag = True  # if never castled, treat as "late/absent" for profile
+def move_cpl(moves: pd.DataFrame, thresholds: ProfileThresholds = DEFAULT_THRESHOLDS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized player_cpl(): (cpl, style_counted). cpl is NaN for moves that
+    do not count. style_counted marks moves that feed the aggression ratio,
+    which skips the same moves as CPL except those with no eval beforehand.
+    """
+    before = moves["cp_before"].to_numpy(dtype=np.float64)
+    after = moves["cp_after"].to_numpy(dtype=np.float64)
+    has_before = ~np.isnan(before)
+    has_after = ~np.isnan(after)
+    with np.errstate(invalid="ignore"):
+        excluded = (
+            (np.abs(before) >= thresholds.mate_score_abs)
+            | (np.abs(after) >= thresholds.mate_score_abs)
+            | (before < thresholds.ignore_position_below)
+        )
+        valid = has_before & has_after & ~excluded
+        cpl = np.where(valid, np.minimum(np.maximum(before - after, 0.0), thresholds.max_cpl_per_move), np.nan)
+    style_counted = has_after & ~(has_before & excluded)
+    return cpl, style_counted
+
+
+def _label_array(cpl: np.ndarray, thresholds: ProfileThresholds) -> np.ndarray:
+    return np.select(
+        [cpl >= thresholds.blunder_cpl, cpl >= thresholds.mistake_cpl, cpl >= thresholds.inaccuracy_cpl],
+        ["blunder", "mistake", "inaccuracy"],
+        default="good",
+    )
+
+
+def _top_openings(games: pd.DataFrame, limit: int) -> List[str]:
+    openings = games["opening"].astype(str)
+    openings = openings[openings != ""]
+    if openings.empty:
+        return []
+    # Most frequent first; ties keep first-seen order.
+    counts = openings.groupby(openings, sort=False).size()
+    first_seen = openings.drop_duplicates().reset_index(drop=True)
+    ordered = counts.reindex(first_seen).sort_values(ascending=False, kind="stable")
+    return [str(name) for name in ordered.index[:limit]]
+
+
+def aggregate_profile(
+    username: str,
+    moves: pd.DataFrame,
+    games: pd.DataFrame,
+    eval_mode: str = "adaptive",
+    thresholds: ProfileThresholds = DEFAULT_THRESHOLDS,
+    proof_source: Optional[Callable[[np.ndarray], pd.DataFrame]] = None,
+) -> PlayerProfile:
+    """
+    Build a profile from per-move records (see services.move_store) with
+    array operations only. ``moves`` may omit fen/played/best; proof rows are
+    then fetched through ``proof_source(row_labels)``.
+    """
+    counted_ids = games.loc[games["counted"], "game_id"].to_numpy()
+    moves = moves[np.isin(moves["game_id"].to_numpy(), counted_ids)]
+    games_analyzed = int(len(counted_ids))
+    total_user_moves = len(moves)
+
+    cpl, style_counted = move_cpl(moves, thresholds)
+    valid = ~np.isnan(cpl)
+    valid_cpl = cpl[valid]
+    avg_cpl = float(valid_cpl.mean()) if valid_cpl.size else 0.0
+
+    labels = _label_array(valid_cpl, thresholds)
+
+    def rate(label: str) -> float:
+        return float(np.count_nonzero(labels == label)) / total_user_moves if total_user_moves else 0.0
+
+    phase = moves["phase"].astype(str).to_numpy()[valid]
+    phase_avg = {}
+    for name in PHASES:
+        in_phase = valid_cpl[phase == name]
+        phase_avg[name] = float(in_phase.mean()) if in_phase.size else 0.0
+    weak_phase = max(phase_avg, key=lambda k: phase_avg[k]) if games_analyzed else "middlegame"
 
-    profile = PlayerProfile(
+    # Style flags
+    aggressive = (moves["is_capture"].to_numpy() | moves["gives_check"].to_numpy())[style_counted]
+    aggressive_ratio = float(aggressive.mean()) if aggressive.size else 0.0
+    castle_plies = moves.loc[moves["is_castle"].to_numpy(), ["game_id", "ply"]].groupby("game_id")["ply"].min()
+    # late castling: castling after ply 16 (after 8 moves) OR never castled in many games
+    late_castling = float(castle_plies.mean()) > thresholds.late_castle_ply if len(castle_plies) else True
+
+    # Proofs: worst moves first, ties in game order
+    proof_mask = valid & (np.nan_to_num(cpl, nan=-1.0) >= thresholds.proof_min_cpl)
+    proof_positions = np.flatnonzero(proof_mask)
+    order = np.argsort(-cpl[proof_positions], kind="stable")[: thresholds.max_proofs]
+    proof_positions = proof_positions[order]
+    proof_rows = moves.iloc[proof_positions]
+    if "fen" not in proof_rows.columns and proof_source is not None and len(proof_rows):
+        strings = proof_source(proof_rows.index.to_numpy())
+        proof_rows = proof_rows.assign(**{c: strings[c].to_numpy() for c in ("fen", "played", "best")})
+    opening_by_game = dict(zip(games["game_id"].to_numpy().tolist(), games["opening"].astype(str).tolist()))
+    proofs: List[Dict[str, object]] = []
+    for position, (_, row) in zip(proof_positions, proof_rows.iterrows()):
+        value = int(cpl[position])
+        proofs.append({
+            "fen": str(row["fen"]),
+            "played_move": str(row["played"]),
+            "best_move": str(row["best"]) or None,
+            "cpl": value,
+            "phase": str(row["phase"]),
+            "label": str(_label_array(np.array([value]), thresholds)[0]),
+            "opening": opening_by_game.get(int(row["game_id"])) or None,
+            "move_number": int(row["move_number"]),
+        })
+
+    return PlayerProfile(
         username=username,
-        games_analyzed=games,
+        games_analyzed=games_analyzed,
         avg_cpl=round(avg_cpl, 2),
-        inaccuracy_rate=round(rate(inacc), 4),
-        mistake_rate=round(rate(mistake), 4),
-        blunder_rate=round(rate(blunder), 4),
+        inaccuracy_rate=round(rate("inaccuracy"), 4),
+        mistake_rate=round(rate("mistake"), 4),
+        blunder_rate=round(rate("blunder"), 4),
         weak_phase=weak_phase,
-        opening_preferences=opening_pref_list,
+        opening_preferences=_top_openings(games, thresholds.top_openings),
         style=StyleFlags(
-            aggressive=aggressive_flag,
-            early_queen=early_queen_flag,
-            late_castling=late_castling_flag,
+            aggressive=aggressive_ratio >= thresholds.aggressive_ratio,
+            early_queen=bool(moves["early_queen"].to_numpy().any()),
+            late_castling=bool(late_castling),
         ),
         phase_breakdown=PhaseWeakness(
-            opening_avg_cpl=round(opening_avg, 2),
-            middlegame_avg_cpl=round(middle_avg, 2),
-            endgame_avg_cpl=round(end_avg, 2),
+            opening_avg_cpl=round(phase_avg["opening"], 2),
+            middlegame_avg_cpl=round(phase_avg["middlegame"], 2),
+            endgame_avg_cpl=round(phase_avg["endgame"], 2),
             weak_phase=weak_phase,
         ),
-        profile_proofs=proof_positions,
+        profile_proofs=proofs,
+        eval_mode=eval_mode,
     )
-    return profile
+
+
+# ---------- Main profiler ----------
+def build_profile_from_pgn(
+    username: str,
+    pgn_path: str,
+    evaluator: StockfishEvaluator,
+    max_games: int = DEFAULT_MAX_GAMES,
+    max_plies_per_game: int = DEFAULT_MAX_PLIES_PER_GAME,
+    recorder: Optional[MoveRecorder] = None,
+) -> PlayerProfile:
+    """
+    Engine stage, then aggregation stage. Pass a ``recorder`` to keep the
+    per-move rows (e.g. for the columnar move store).
+    """
+    recorder = recorder or MoveRecorder(username)
+    collect_moves(username, pgn_path, evaluator, recorder, max_games, max_plies_per_game)
+    moves, games = recorder.frames()
+    return aggregate_profile(username, moves, games, eval_mode=evaluator.budget.mode)
 
 
 def save_profile(profile: PlayerProfile, profiles_dir: str) -> str:
+    return save_profile_dict(asdict(profile), profiles_dir)
+
+
+_profile_locks: Dict[str, threading.Lock] = {}
+_profile_locks_guard = threading.Lock()
+
+
+def _profile_lock(path: str) -> threading.Lock:
+    with _profile_locks_guard:
+        return _profile_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def profile_stamp(path: str) -> Tuple[int, int]:
+    """(mtime_ns, size) of a profile file; changes whenever the file is replaced."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def save_profile_dict(
+    profile: Dict[str, object],
+    profiles_dir: str,
+    expect_stamp: Optional[Tuple[int, int]] = None,
+) -> Optional[str]:
+    """
+    Write the profile JSON. With ``expect_stamp``, the file is only replaced
+    if it still has that profile_stamp() (nobody rewrote it since it was
+    read); returns None when it was not.
+    """
     ensure_dir(profiles_dir)
-    out_path = os.path.join(profiles_dir, f"{profile.username}.json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(asdict(profile), f, indent=2)
+    out_path = os.path.join(profiles_dir, f"{profile['username']}.json")
+    # Write then swap, so readers (and the response cache) never see a half-written file.
+    tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    # The stamp check and the swap happen under one lock, shared by every writer.
+    with _profile_lock(out_path):
+        if expect_stamp is not None and profile_stamp(out_path) != expect_stamp:
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, out_path)
     return out_path
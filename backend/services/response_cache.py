@@ -0,0 +1,105 @@
+"""
+Conditional GETs for responses built from files on disk.
+
+The ETag of a response is derived from the backing files' (path, mtime,
+size) plus anything else the body depends on (query parameters), so it
+changes exactly when the response would. A request whose If-None-Match
+carries the current tag gets an empty 304; otherwise the serialized body
+is taken from a small in-process LRU keyed the same way, and only built
+(file read, parsed and serialized) when the file changed or the entry was
+evicted.
+
+Responses carry `Cache-Control: no-cache`, so browsers keep the body but
+revalidate every time; an unchanged dashboard reload costs a few stat()
+calls.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from services.metrics import CACHE_REQUESTS
+
+# ---------- Config ----------
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "256"))
+
+_entries: "OrderedDict[Tuple, Tuple[str, bytes]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def file_etag(paths: Iterable[str], *variant: object) -> str:
+    """Strong ETag from the files' mtime and size and the response variant."""
+    h = hashlib.sha1()
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}\n".encode("utf-8"))
+    h.update(repr(variant).encode("utf-8"))
+    return f'"{h.hexdigest()[:24]}"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    # GET uses weak comparison (RFC 9110 13.1.2), so a W/ prefix still matches.
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def serialize(payload: Any) -> bytes:
+    # Same encoding as FastAPI's JSONResponse.
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def cached_json(
+    request: Request,
+    key: Tuple,
+    paths: Iterable[str],
+    build: Callable[[], Any],
+    variant: Tuple = (),
+    cache_if: Optional[Callable[[Any], bool]] = None,
+) -> Response:
+    """
+    JSON response for ``build()`` (a JSON-serialisable payload read from
+    ``paths``), with ETag/304 handling and the serialized bytes cached
+    under ``key``. ``cache_if`` can veto caching a payload, e.g. one that
+    carries a transient fallback.
+    """
+    etag = file_etag(paths, *variant)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        CACHE_REQUESTS.inc(cache="response", result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == etag:
+            _entries.move_to_end(key)
+            body = entry[1]
+        else:
+            body = None
+    CACHE_REQUESTS.inc(cache="response", result="hit" if body is not None else "miss")
+
+    if body is None:
+        payload = build()
+        body = serialize(payload)
+        if cache_if is not None and not cache_if(payload):
+            # No tag either, or the client would keep revalidating this body.
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-store"})
+        with _lock:
+            _entries[key] = (etag, body)
+            _entries.move_to_end(key)
+            while len(_entries) > MAX_ENTRIES:
+                _entries.popitem(last=False)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def stats() -> dict:
+    with _lock:
+        return {"entries": len(_entries), "bytes": sum(len(body) for _, body in _entries.values()), "max_entries": MAX_ENTRIES}
@@ -0,0 +1,120 @@
+"""
+Import-time budget and startup profile.
+
+main.py records how long its own imports took and how long each startup
+step took; /health reports that together with which of the heavy modules
+(torch, pandas, google.genai) have been loaded so far. Those are imported
+on first use, so a fresh process should not have any of them.
+
+The CLI measures a cold `import main` in a fresh interpreter with
+`-X importtime`, lists the slowest imports, and exits non-zero when the
+import is over budget or a heavy module is imported eagerly again.
+
+Run (from backend/):
+  python -m services.startup_profile [--module main] [--budget-s 1.0] [--top 15]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# ---------- Config ----------
+IMPORT_BUDGET_S = float(os.getenv("IMPORT_BUDGET_S", "1.0"))
+HEAVY_MODULES = ("torch", "pandas", "google.genai")
+
+
+def loaded_heavy_modules() -> List[str]:
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+class StartupProfile:
+    def __init__(self, budget_s: float = IMPORT_BUDGET_S):
+        self.budget_s = budget_s
+        self.import_s: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = round(seconds, 4)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self) -> Dict[str, object]:
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "import_s": round(self.import_s, 4) if self.import_s is not None else None,
+            "import_budget_s": self.budget_s,
+            "over_budget": self.import_s is not None and self.import_s > self.budget_s,
+            "phases": phases,
+            "heavy_modules_loaded": loaded_heavy_modules(),
+        }
+
+
+def measure_import(module: str = "main") -> Tuple[float, float, List[Tuple[int, int, str]]]:
+    """
+    Import ``module`` in a fresh interpreter. Returns (wall seconds, seconds
+    spent importing ``module`` itself, [(self_us, cumulative_us, name)]).
+    """
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    entries = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entry = (int(self_us), int(cumulative_us), name.rstrip())
+        entries.append(entry)
+        if entry[2].strip() == module:
+            total_us = entry[1]
+    return wall, total_us / 1e6, entries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Profile a cold import of the app.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-s", type=float, default=IMPORT_BUDGET_S)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    wall, import_s, entries = measure_import(args.module)
+    print(f"import {args.module}: {import_s:.3f}s (process wall {wall:.3f}s, budget {args.budget_s:.3f}s)")
+    print("\nslowest imports (cumulative):")
+    for _, cumulative_us, name in sorted(entries, key=lambda e: e[1], reverse=True)[: args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name.strip()}")
+
+    heavy = sorted({name.strip() for _, _, name in entries} & set(HEAVY_MODULES))
+    failed = False
+    if heavy:
+        print(f"\nheavy modules imported eagerly: {', '.join(heavy)}")
+        failed = True
+    if import_s > args.budget_s:
+        print(f"\nover budget by {import_s - args.budget_s:.3f}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
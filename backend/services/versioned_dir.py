@@ -0,0 +1,105 @@
+"""
+Directories that are rewritten as a whole: a user's move store, a
+training dataset, the opening book.
+
+Each write goes to a fresh version directory next to the logical path
+(``<path>.v<time_ns>``), and a small pointer file (``<path>.current``)
+naming the live version is swapped in with os.replace once the version is
+complete. Readers resolve the pointer, so there is never a moment without
+a store, and a reader that still has the previous version's .npy files
+memory-mapped is not in the way: nothing is renamed or deleted under it.
+The previous version is kept for readers that resolved it just before the
+switch; older ones are removed on the next publish (on Windows, a version
+that is still mapped is left for a later one).
+
+A plain directory at ``<path>`` (the layout before versioning) is still
+read when there is no pointer, and is removed like an old version once it
+is recognisably one (it holds the caller's ``marker`` file). Paths built
+from user names go through safe_child(), since old versions are deleted.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from typing import Optional, Set
+
+POINTER_SUFFIX = ".current"
+VERSION_MARK = ".v"
+REPLACE_ATTEMPTS = 5   # os.replace of the pointer can fail on Windows while a reader has it open
+
+
+def safe_child(root: str, name: str) -> str:
+    """``root/name``, refusing names that would resolve outside ``root`` (the result may be deleted)."""
+    path = os.path.join(root, name)
+    root_abs = os.path.realpath(root)
+    if not name or os.path.dirname(os.path.realpath(path)) != root_abs:
+        raise ValueError(f"invalid user id: {name!r}")
+    return path
+
+
+def _pointer(path: str) -> str:
+    return path.rstrip("/\\") + POINTER_SUFFIX
+
+
+def _current_name(path: str) -> Optional[str]:
+    try:
+        with open(_pointer(path), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return name or None
+
+
+def resolve(path: str) -> str:
+    """Directory holding the live version of ``path`` (``path`` itself before the first publish)."""
+    name = _current_name(path)
+    if name is not None:
+        current = os.path.join(os.path.dirname(path.rstrip("/\\")), name)
+        if os.path.isdir(current):
+            return current
+    return path
+
+
+def new_version(path: str) -> str:
+    """Create and return an empty version directory for ``path``; publish() it when complete."""
+    version = path.rstrip("/\\") + VERSION_MARK + str(time.time_ns())
+    os.makedirs(version)
+    return version
+
+
+def publish(path: str, version: str, marker: str) -> None:
+    """
+    Make ``version`` the live directory of ``path`` and remove versions
+    older than the previous one. ``marker`` is a file every complete
+    version holds (its meta or manifest); a legacy plain directory without
+    it is not ours and is left alone.
+    """
+    previous = resolve(path)
+    pointer = _pointer(path)
+    tmp = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version))
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.replace(tmp, pointer)
+            break
+        except PermissionError:
+            if attempt == REPLACE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.01 * (attempt + 1))
+    _cleanup(path, marker, keep={os.path.abspath(version), os.path.abspath(previous)})
+
+
+def _cleanup(path: str, marker: str, keep: Set[str]) -> None:
+    base = path.rstrip("/\\")
+    parent = os.path.dirname(base) or "."
+    prefix = os.path.basename(base) + VERSION_MARK
+    stale = [
+        os.path.join(parent, n) for n in os.listdir(parent) if n.startswith(prefix) and n[len(prefix):].isdigit()
+    ]
+    if os.path.isfile(os.path.join(base, marker)):
+        stale.append(base)
+    for candidate in stale:
+        if os.path.abspath(candidate) not in keep and os.path.isdir(candidate):
+            shutil.rmtree(candidate, ignore_errors=True)
@@ -0,0 +1,293 @@
+"""
+Durable work queue for analysis tasks.
+
+A SQLite file in database/ (WAL mode) shared by the API and any number of
+worker processes. Tasks belong to a job (e.g. one profile build) and go
+through
+
+  queued -> leased -> done
+              |
+              +-> queued again when the lease expires or the worker
+                  reports a failure, until max_attempts is used up
+                  (then failed)
+
+A lease is taken atomically (BEGIN IMMEDIATE), carries the worker's id and
+an expiry, and is extended by heartbeats while the task runs. A worker that
+dies simply stops heartbeating; its task becomes leasable again once the
+lease expires. ack() and fail() only apply while the caller still holds
+the lease, so a late worker cannot overwrite a retried task.
+
+Workers on other machines can use the same file over a shared volume; the
+queue is a stand-in for a real broker, not a replacement for one.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+# ---------- Config ----------
+QUEUE_DB = os.getenv("WORK_QUEUE_DB", os.path.join("database", "work_queue.db"))
+LEASE_S = float(os.getenv("WORK_LEASE_S", "120"))
+MAX_ATTEMPTS = 3
+
+
+@dataclass
+class Task:
+    id: int
+    job: str
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+    lease_owner: str
+    lease_expires: float
+
+
+class WorkQueue:
+    def __init__(self, path: str = QUEUE_DB):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS tasks(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                seq INT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INT NOT NULL DEFAULT 0,
+                max_attempts INT NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, lease_expires)")
+        conn.execute("CREATE INDEX IF NOT EXISTS tasks_job ON tasks(job, seq)")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs(
+                job TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly below.
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- producer side ----------
+    def create_job(
+        self,
+        job: str,
+        kind: str,
+        payload: Dict[str, Any],
+        tasks: Iterable[Dict[str, Any]],
+        task_kind: str,
+        max_attempts: int = MAX_ATTEMPTS,
+    ) -> int:
+        """Record a job and enqueue its tasks in one transaction; returns the task count."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO jobs(job, kind, payload, created_at, updated_at) VALUES(?,?,?,?,?)",
+                (job, kind, json.dumps(payload), now, now),
+            )
+            count = 0
+            for seq, task in enumerate(tasks):
+                conn.execute(
+                    """INSERT INTO tasks(job, kind, seq, payload, max_attempts, created_at, updated_at)
+                       VALUES(?,?,?,?,?,?,?)""",
+                    (job, task_kind, seq, json.dumps(task), max_attempts, now, now),
+                )
+                count += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def job(self, job: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM jobs WHERE job = ?", (job,)).fetchone()
+        if row is None:
+            return None
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM tasks WHERE job = ? GROUP BY status", (job,)
+        ).fetchall())
+        return {
+            "job": row["job"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "payload": json.loads(row["payload"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "tasks": {status: counts.get(status, 0) for status in ("queued", "leased", "done", "failed")},
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def job_results(self, job: str) -> List[Optional[Dict[str, Any]]]:
+        """Task results in enqueue order (None for failed tasks)."""
+        rows = self._conn().execute("SELECT result FROM tasks WHERE job = ? ORDER BY seq", (job,)).fetchall()
+        return [json.loads(row["result"]) if row["result"] else None for row in rows]
+
+    def claim_job(self, job: str) -> bool:
+        """Atomically move a running job to 'finalizing'; only one caller wins."""
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = 'finalizing', updated_at = ? WHERE job = ? AND status = 'running'",
+            (time.time(), job),
+        )
+        return bool(cur.rowcount)
+
+    def completed_jobs(self) -> List[str]:
+        """Running jobs with no queued or leased tasks left (e.g. the last task failed for good)."""
+        rows = self._conn().execute(
+            """SELECT job FROM jobs WHERE status = 'running' AND NOT EXISTS (
+                   SELECT 1 FROM tasks WHERE tasks.job = jobs.job AND tasks.status IN ('queued', 'leased'))"""
+        ).fetchall()
+        return [row["job"] for row in rows]
+
+    def finish_job(self, job: str, status: str, result: Optional[Dict[str, Any]] = None) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE job = ?",
+            (status, json.dumps(result) if result is not None else None, time.time(), job),
+        )
+
+    # ---------- worker side ----------
+    def lease(self, worker: str, kinds: Optional[List[str]] = None, lease_s: float = LEASE_S) -> Optional[Task]:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that used their last attempt are given up on.
+            conn.execute(
+                """UPDATE tasks SET status = 'failed', error = COALESCE(error, 'lease expired'), updated_at = ?
+                   WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts""",
+                (now, now),
+            )
+            query = """SELECT * FROM tasks
+                       WHERE (status = 'queued' OR (status = 'leased' AND lease_expires < ?))"""
+            params: List[Any] = [now]
+            if kinds:
+                query += f" AND kind IN ({','.join('?' * len(kinds))})"
+                params.extend(kinds)
+            row = conn.execute(query + " ORDER BY id LIMIT 1", params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            expires = now + lease_s
+            conn.execute(
+                """UPDATE tasks SET status = 'leased', attempts = attempts + 1, lease_owner = ?,
+                   lease_expires = ?, updated_at = ? WHERE id = ?""",
+                (worker, expires, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return Task(
+            id=row["id"],
+            job=row["job"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            attempts=row["attempts"] + 1,
+            lease_owner=worker,
+            lease_expires=expires,
+        )
+
+    def heartbeat(self, task: Task, lease_s: float = LEASE_S) -> bool:
+        """Extend the lease; False if it was lost (expired and taken by another worker)."""
+        expires = time.time() + lease_s
+        cur = self._conn().execute(
+            "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (expires, time.time(), task.id, task.lease_owner),
+        )
+        if cur.rowcount:
+            task.lease_expires = expires
+        return bool(cur.rowcount)
+
+    def ack(self, task: Task, result: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """
+        Mark a leased task done. Returns how many tasks of its job are still
+        unfinished (0 means this ack completed the job), or None if the lease
+        had been lost.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                """UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated_at = ?
+                   WHERE id = ? AND status = 'leased' AND lease_owner = ?""",
+                (json.dumps(result) if result is not None else None, time.time(), task.id, task.lease_owner),
+            )
+            remaining = self._remaining(conn, task.job) if cur.rowcount else None
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return remaining
+
+    def fail(self, task: Task, error: str) -> Optional[int]:
+        """Give a task back for retry (or fail it for good); same return value as ack()."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                """UPDATE tasks SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                   error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?
+                   WHERE id = ? AND status = 'leased' AND lease_owner = ?""",
+                (error, time.time(), task.id, task.lease_owner),
+            )
+            remaining = self._remaining(conn, task.job) if cur.rowcount else None
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return remaining
+
+    @staticmethod
+    def _remaining(conn: sqlite3.Connection, job: str) -> int:
+        return conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE job = ? AND status IN ('queued', 'leased')", (job,)
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, object]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return {"path": self.path, "tasks": dict(rows)}
+
+
+_queue: Optional[WorkQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> WorkQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WorkQueue()
+    return _queue
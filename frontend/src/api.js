@@ -16,8 +16,8 @@ export const trainModel = async (userId) => {
   return await axios.post(`${API_BASE}/model/train`, formData);
 };
 
-export const predictMove = async (fen) => {
-  return await axios.post(`${API_BASE}/model/predict`, { fen });
+export const predictMove = async (fen, userId = null) => {
+  return await axios.post(`${API_BASE}/model/predict`, { fen, user_id: userId });
 };
 
 export const analyzeAndStore = async () => {
@@ -64,6 +64,33 @@ export const analyzeMoveDeep = async (payload) => {
   return await axios.post(`${API_BASE}/analyze/move/deep`, payload);
 };
 
+// Progressive deep analysis: onStage gets one result per completed depth,
+// the last with final=true. Returns a function that cancels the stream.
+export const streamMoveDeep = (payload, { onStage, onError }) => {
+  const ws = new WebSocket(`${API_BASE.replace(/^http/, "ws")}/analyze/move/stream`);
+  ws.onopen = () => ws.send(JSON.stringify(payload));
+  ws.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    if (message.type === "error") {
+      onError?.(message.detail);
+      ws.close();
+      return;
+    }
+    onStage(message);
+    if (message.final) ws.close();
+  };
+  ws.onerror = () => onError?.(null);
+  return () => ws.close();
+};
+
+export const prefetchPosition = async (fen) => {
+  return await axios.post(`${API_BASE}/analyze/prefetch`, { fen });
+};
+
+export const moveHeatmap = async (payload) => {
+  return await axios.post(`${API_BASE}/analyze/heatmap`, payload);
+};
+
 export const explainMove = async (payload) => {
   return await axios.post(`${API_BASE}/analyze/explain/move`, payload);
 };
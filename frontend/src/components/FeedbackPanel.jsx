@@ -1,21 +1,49 @@
-import React, { useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { getFeedback } from "../api";
 
+const FEEDBACK_POLL_MS = 2000;
+const FEEDBACK_POLL_MAX = 30; // give up after about a minute
+
 export default function FeedbackPanel({ username }) {
   const [feedback, setFeedback] = useState(null);
   const [status, setStatus] = useState("");
+  const pollRef = useRef(null);
+
+  // A new username or unmounting abandons the poll in flight.
+  useEffect(() => {
+    return () => {
+      if (pollRef.current) pollRef.current.cancelled = true;
+    };
+  }, [username]);
 
   const handleLoadFeedback = async () => {
     if (!username.trim()) {
       setStatus("Enter a username to load feedback.");
       return;
     }
+    if (pollRef.current) pollRef.current.cancelled = true;
+    const poll = { cancelled: false };
+    pollRef.current = poll;
     setStatus("Loading feedback...");
     try {
-      const res = await getFeedback(username.trim());
+      let res = await getFeedback(username.trim());
+      // Feedback is generated in the background after a profile build.
+      for (let attempt = 0; res.data?.status === "pending"; attempt++) {
+        if (poll.cancelled) return;
+        if (attempt >= FEEDBACK_POLL_MAX) {
+          setStatus("Feedback is still being prepared. Try again in a moment.");
+          return;
+        }
+        setStatus("Preparing feedback for your proof positions...");
+        await new Promise((resolve) => setTimeout(resolve, FEEDBACK_POLL_MS));
+        if (poll.cancelled) return;
+        res = await getFeedback(username.trim());
+      }
+      if (poll.cancelled) return;
       setFeedback(res.data);
       setStatus("");
     } catch (err) {
+      if (poll.cancelled) return;
       const detail = err?.response?.data?.detail;
       setFeedback({
         username,
@@ -51,6 +79,7 @@ export default function FeedbackPanel({ username }) {
                   <span>Move {item.move_number}</span>
                   <span className={`label ${item.label}`}>{item.label}</span>
                   <span>{item.played_move}</span>
+                  {item.best_move && <span className="muted">best {item.best_move}</span>}
                 </div>
                 <p>{item.feedback}</p>
               </div>
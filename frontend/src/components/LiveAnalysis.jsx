@@ -3,8 +3,10 @@ import { Chessboard } from "react-chessboard";
 import { Chess } from "chess.js";
 import {
   analyzeMove,
-  analyzeMoveDeep,
+  streamMoveDeep,
+  prefetchPosition,
   explainMove,
+  moveHeatmap,
   predictMove,
   listPgnGames,
   getPgnGameMoves,
@@ -33,6 +35,9 @@ export default function LiveAnalysis({ username, startFen }) {
   const [deepResult, setDeepResult] = useState(null);
   const [deepExplanation, setDeepExplanation] = useState("");
   const [deepContext, setDeepContext] = useState(null);
+  const deepStreamRef = useRef(null);
+  const [heatmapStatus, setHeatmapStatus] = useState("");
+  const [heatmap, setHeatmap] = useState(null);
 
   const [debugLogs, setDebugLogs] = useState([]);
 
@@ -45,11 +50,21 @@ export default function LiveAnalysis({ username, startFen }) {
     setDebugLogs([]);
   };
 
+  const cancelDeepStream = () => {
+    if (deepStreamRef.current) {
+      deepStreamRef.current();
+      deepStreamRef.current = null;
+    }
+  };
+
   const resetDeep = () => {
+    cancelDeepStream();
     setDeepStatus("");
     setDeepResult(null);
     setDeepExplanation("");
     setDeepContext(null);
+    setHeatmapStatus("");
+    setHeatmap(null);
   };
 
   const uciToMove = (uci) => {
@@ -91,10 +106,13 @@ export default function LiveAnalysis({ username, startFen }) {
     setLiveResult(null);
 
     const moveUci = `${move.from}${move.to}${move.promotion || ""}`;
+    cancelDeepStream();
     setDeepContext({ fen: fenBefore, move: moveUci });
     setDeepResult(null);
     setDeepExplanation("");
     setDeepStatus("");
+    setHeatmapStatus("");
+    setHeatmap(null);
     const cleanUsername = username.trim();
 
     const processLiveMove = async () => {
@@ -122,7 +140,7 @@ export default function LiveAnalysis({ username, startFen }) {
       }
 
       try {
-        const engineRes = await predictMove(game.fen());
+        const engineRes = await predictMove(game.fen(), username);
         const aiMove = engineRes.data?.move;
         if (aiMove) {
           let applied = game.move(aiMove);
@@ -132,6 +150,7 @@ export default function LiveAnalysis({ username, startFen }) {
           if (applied) {
             setLiveFen(game.fen());
             addDebug(`Live: engine reply ${aiMove}.`);
+            prefetchPosition(game.fen()).catch(() => {});
           }
         }
       } catch {
@@ -244,6 +263,7 @@ export default function LiveAnalysis({ username, startFen }) {
       return;
     }
 
+    cancelDeepStream();
     setDeepContext({ fen: fenBefore, move: moveUci });
     setDeepResult(null);
     setDeepExplanation("");
@@ -274,6 +294,31 @@ export default function LiveAnalysis({ username, startFen }) {
     }
   };
 
+  const handleHeatmap = async () => {
+    if (!deepContext) {
+      setHeatmapStatus("Make a move to rate the alternatives.");
+      return;
+    }
+    setHeatmapStatus("Rating every move...");
+    setHeatmap(null);
+    try {
+      const res = await moveHeatmap({
+        fen: deepContext.fen,
+        username: username.trim() || undefined,
+      });
+      setHeatmap(res.data);
+      setHeatmapStatus("");
+      addDebug(
+        `Heatmap: ${res.data?.evaluated}/${res.data?.legal_moves} moves at depth ${res.data?.depth}` +
+          `${res.data?.cached ? " (cached)" : ""}.`
+      );
+    } catch (err) {
+      const detail = err?.response?.data?.detail;
+      setHeatmapStatus(detail ? `Heatmap failed: ${detail}` : "Heatmap failed.");
+      addDebug(`Heatmap: failed (${detail || "unknown error"}).`);
+    }
+  };
+
   const handleDeepAnalysis = async (useAi) => {
     if (!deepContext) {
       setDeepStatus("Make a move to analyze.");
@@ -297,16 +342,34 @@ export default function LiveAnalysis({ username, startFen }) {
         setDeepResult(res.data?.analysis || null);
         setDeepExplanation(res.data?.explanation || "");
         addDebug("Deep: AI explanation generated.");
+        setDeepStatus("");
       } else {
-        const res = await analyzeMoveDeep({
-          username: cleanUsername,
-          fen: deepContext.fen,
-          move: deepContext.move,
-        });
-        setDeepResult(res.data || null);
-        addDebug("Deep: analysis complete.");
+        cancelDeepStream();
+        deepStreamRef.current = streamMoveDeep(
+          {
+            username: cleanUsername,
+            fen: deepContext.fen,
+            move: deepContext.move,
+          },
+          {
+            onStage: (stage) => {
+              setDeepResult(stage);
+              if (stage.final) {
+                deepStreamRef.current = null;
+                setDeepStatus("");
+                addDebug(`Deep: analysis complete (${stage.elapsed_ms} ms).`);
+              } else {
+                setDeepStatus(`Deepening... depth ${stage.depth}`);
+              }
+            },
+            onError: (detail) => {
+              deepStreamRef.current = null;
+              setDeepStatus(detail ? `Deep analysis failed: ${detail}` : "Deep analysis failed.");
+              addDebug(`Deep: failed (${detail || "connection error"}).`);
+            },
+          }
+        );
       }
-      setDeepStatus("");
     } catch (err) {
       const detail = err?.response?.data?.detail;
       setDeepStatus(detail ? `Deep analysis failed: ${detail}` : "Deep analysis failed.");
@@ -394,7 +457,33 @@ export default function LiveAnalysis({ username, startFen }) {
                     <button className="primary" onClick={() => handleDeepAnalysis(true)}>
                       Explain this move (AI)
                     </button>
+                    <button className="ghost" onClick={handleHeatmap}>
+                      Rate every move
+                    </button>
                   </div>
+                  {heatmapStatus && <p className="status">{heatmapStatus}</p>}
+                  {heatmap && (
+                    <div className="suggested-list">
+                      <h4>All moves from this position</h4>
+                      <div className="chip-row">
+                        {heatmap.moves.length > 0 ? (
+                          heatmap.moves.map((entry) => (
+                            <span
+                              key={entry.uci}
+                              className={`label ${entry.label}${
+                                entry.uci === deepContext?.move ? " heatmap-played" : ""
+                              }`}
+                              title={`${entry.cpl} CPL · ${(entry.line || []).join(" ")}`}
+                            >
+                              {entry.san}
+                            </span>
+                          ))
+                        ) : (
+                          <span className="muted">No legal moves.</span>
+                        )}
+                      </div>
+                    </div>
+                  )}
                   {deepStatus && <p className="status">{deepStatus}</p>}
                   {deepResult && (
                     <div className="deep-card">